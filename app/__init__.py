@@ -1,3 +1,6 @@
+import logging
+import threading
+
 from fastapi import FastAPI
 from fastapi.responses import RedirectResponse
 
@@ -7,13 +10,21 @@ from app.controllers.file_input_router import openapi_tag as file_input_tag
 from app.controllers.file_input_router import router as file_input
 from app.controllers.google_spell_check_router import openapi_tag as spell_check_tag
 from app.controllers.google_spell_check_router import router as spell_check
+from app.controllers.metrics_router import openapi_tag as metrics_tag
+from app.controllers.metrics_router import router as metrics
+from app.controllers.word_list_router import openapi_tag as word_list_tag
+from app.controllers.word_list_router import router as word_list
+from app.core.models.browser import get_browser_pool
+from app.core.service.google_spell_check import warm_start_browser_pool
+from app.core.service.metrics import instrument_request
 from app.settings import get_app_settings
 
 
 # https://github.com/tiangolo/fastapi/issues/508#issuecomment-532368194
 def get_app() -> FastAPI:
     config = get_app_settings()
-    openapi_tags = [file_input_tag, browser_tag, spell_check_tag]
+    logging.basicConfig(level = config.LOG_LEVEL, format = '%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s')
+    openapi_tags = [file_input_tag, browser_tag, spell_check_tag, word_list_tag, metrics_tag]
 
     server = FastAPI(
         title = config.FAST_API_TITLE,
@@ -26,11 +37,29 @@ def get_app() -> FastAPI:
     server.include_router(browser)
     server.include_router(file_input)
     server.include_router(spell_check)
+    server.include_router(word_list)
+    server.include_router(metrics)
+
+    # Latency of every route and optional per-request traces
+    server.middleware("http")(instrument_request)
 
     @server.get("/", include_in_schema = False)
     def redirect_to_docs() -> RedirectResponse:
         return RedirectResponse("/docs")
 
+    @server.on_event("startup")
+    async def warm_start_browser() -> None:
+        # In the background, so that the app serves requests (which wait for a session) while Chrome starts
+        if config.BROWSER_WARM_START and config.SPELL_CHECK_BACKEND == 'google':
+            threading.Thread(target = warm_start_browser_pool, args = (get_browser_pool(),), name = 'browser-warm-start', daemon = True).start()
+
+    @server.on_event("shutdown")
+    async def close_browser() -> None:
+        # Quitting Chrome, rather than leaving it to be killed, keeps its persistent profile intact
+        if config.BROWSER_WARM_START:
+            get_browser_pool().stop_keepalive()
+            get_browser_pool().close()
+
     # @server.on_event("startup")
     # async def connect_to_database() -> None:
     #     database = get_database()
@@ -1,3 +1,4 @@
+import logging
 import os
 
 from app.core.models.browser import Browser
@@ -7,6 +8,7 @@ from fastapi import APIRouter, HTTPException, Query
 from starlette.responses import FileResponse
 
 config = get_app_settings()
+logger = logging.getLogger(__name__)
 router_name = 'Browser'
 router_description = 'APIs to control Selenium driven browser'
 openapi_tag = {'name': router_name, 'description': router_description}
@@ -26,7 +28,7 @@ async def open_url(url: str = Query(
         return BrowserResponse(response_message = f"Successfully launched '{browser.title}' on Selenium driven Chrome browser")
     except Exception as e:
         error_message = f"Could not open URL due to exception: '{e}'"
-        print(error_message)
+        logger.error(error_message)
         raise HTTPException(status_code = 500, detail = error_message)
 
 @router.get("/google-login",
@@ -42,7 +44,7 @@ async def google_login():
         return BrowserResponse(response_message = message)
     except Exception as e:
         error_message = f"Could not log into Google Account due to exception: '{e}'"
-        print(error_message)
+        logger.error(error_message)
         raise HTTPException(status_code = 500, detail = error_message)
 
 @router.get("/screenshot",
@@ -56,7 +58,7 @@ def get_screenshot():
         return FileResponse(screenshot_path, media_type = 'application/octet-stream', filename = 'screenshot.png')
     except Exception as e:
         error_message = f"Could capture screenshot due to exception: '{e}'"
-        print(error_message)
+        logger.error(error_message)
         raise HTTPException(status_code = 500, detail = error_message)
 
 @router.get("/kill/{process_name}",
@@ -86,5 +88,5 @@ async def kill_chrome_instances(process_name: ProcessName):
         return BrowserResponse(response_message = response_message)
     except Exception as e:
         error_message = f"Could not kill processes due to exception: '{e}'"
-        print(error_message)
+        logger.error(error_message)
         raise HTTPException(status_code = 500, detail = error_message)
@@ -1,11 +1,13 @@
+import logging
 import os
-import time
 
 from app.core.schema.file_input_schema import FileInputResponse
+from app.core.service.uploads import UploadOffsetMismatch, get_resumable_uploads, save_upload
 from app.settings import get_app_settings
-from fastapi import APIRouter, File, HTTPException, Query, UploadFile
+from fastapi import APIRouter, File, HTTPException, Query, Request, UploadFile
 
 config = get_app_settings()
+logger = logging.getLogger(__name__)
 router_name = 'File Input'
 router_description = 'APIs to control file inputs for running spell check'
 openapi_tag = {'name': router_name, 'description': router_description}
@@ -40,7 +42,7 @@ async def check_file_by_name(file_name: str = Query('*', description = 'Use * to
                 return FileInputResponse(response_message = f"'{file_name}' is not present")
     except Exception as e:
         error_message = f"Could not get file(s) due to exception: '{e}'"
-        print(error_message)
+        logger.error(error_message)
         raise HTTPException(status_code = 500, detail = error_message)
 
 @router.post("/upload",
@@ -51,31 +53,54 @@ async def check_file_by_name(file_name: str = Query('*', description = 'Use * to
 async def upload_input_file(file: UploadFile = File(..., description = 'Choose file to be uploaded as input')):
     try:
         file_name = file.filename
-        file_size = file.file._file.getbuffer().nbytes
         allowed_file_extensions = ", ".join(config.ALLOWED_UPLOAD_EXTENSIONS)
         if os.path.splitext(file_name)[1].replace(".", "") in config.ALLOWED_UPLOAD_EXTENSIONS:
-            uploaded_file = os.path.join(config.UPLOAD_FOLDER, file_name)
-            start = progress = time.perf_counter()
-            downloaded_content = 0
-            with open(uploaded_file, "wb") as f:
-                while True:
-                    chunk = await file.read(config.FILE_WRITE_BUFFER_SIZE)
-                    if not chunk:
-                        break
-                    f.write(chunk)
-                    downloaded_content += len(chunk)
-                    elapsed_time = time.perf_counter() - progress
-                    # Print progress after every minute
-                    if elapsed_time > 60:
-                        progress = time.perf_counter()
-                        print(f'\n\tDownloaded {(downloaded_content / file_size) * 100:.2f}% at {downloaded_content / elapsed_time / 1000:.2f} kB/sec of {uploaded_file}\n')
-            print(f"\nFinished downloading '{uploaded_file}' in {time.perf_counter() - start:.2f} seconds\n")
-            return FileInputResponse(response_message = f"'{file_name}' uploaded successfully!")
+            upload = await save_upload(file, file_name)
+            return upload_response(upload)
         else:
             return FileInputResponse(response_message = f"Invalid file_type! Allowed file extensions are: '{allowed_file_extensions}'")
     except Exception as e:
         error_message = f"Could not upload file due to exception: '{e}'"
-        print(error_message)
+        logger.error(error_message)
+        raise HTTPException(status_code = 500, detail = error_message)
+
+def upload_response(upload):
+    response = FileInputResponse(response_message = f"'{upload.file_name}' uploaded successfully!", file_hash = upload.file_hash,
+                                 size_bytes = upload.size, throughput_mb_per_sec = round(upload.throughput, 3))
+    if upload.duplicate_of is not None:
+        response.response_message += f" Content is identical to '{upload.duplicate_of}'"
+        response.duplicate_of = upload.duplicate_of
+    return response
+
+@router.get("/upload/{file_name}",
+            summary = 'Get number of bytes received of a resumable upload',
+            response_model = FileInputResponse,
+            response_model_exclude_unset = True)
+async def get_resumable_upload_offset(file_name: str):
+    offset = get_resumable_uploads().offset(file_name)
+    return FileInputResponse(response_message = f"Received {offset} bytes of '{file_name}'", offset = offset)
+
+@router.put("/upload/{file_name}",
+            summary = 'Upload a chunk of a large file',
+            description = '## Resumable upload\nSend the raw bytes of the file in consecutive requests, each with the **offset** it starts at. After a failed request, get the offset received so far and continue from there. The request with **complete** set to true moves the file to the input folder',
+            response_model = FileInputResponse,
+            response_model_exclude_unset = True)
+async def upload_input_file_chunk(request: Request, file_name: str,
+        offset: int = Query(..., description = 'Byte of the file the chunk starts at'),
+        complete: bool = Query(False, description = 'Set for the last chunk')):
+    allowed_file_extensions = ", ".join(config.ALLOWED_UPLOAD_EXTENSIONS)
+    if os.path.splitext(file_name)[1].replace(".", "") not in config.ALLOWED_UPLOAD_EXTENSIONS or os.path.basename(file_name) != file_name:
+        raise HTTPException(status_code = 422, detail = f"Invalid file_type! Allowed file extensions are: '{allowed_file_extensions}'")
+    try:
+        upload = await get_resumable_uploads().append(file_name, offset, request.stream(), complete = complete)
+        if not complete:
+            return FileInputResponse(response_message = f"Received {upload} bytes of '{file_name}'", offset = upload)
+        return upload_response(upload)
+    except UploadOffsetMismatch as e:
+        raise HTTPException(status_code = 409, detail = f"{e}, not at byte {offset}")
+    except Exception as e:
+        error_message = f"Could not upload file due to exception: '{e}'"
+        logger.error(error_message)
         raise HTTPException(status_code = 500, detail = error_message)
 
 @router.delete("/",
@@ -105,5 +130,5 @@ async def delete_input_file(
             return FileInputResponse(response_message = 'Did not delete any file as confirmation_flag was false')
     except Exception as e:
         error_message = f"Could not delete file(s) due to exception: '{e}'"
-        print(error_message)
+        logger.error(error_message)
         raise HTTPException(status_code = 500, detail = error_message)
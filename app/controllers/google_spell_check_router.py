@@ -1,110 +1,209 @@
+import logging
 import os
+import queue
+import uuid
 from typing import List
 
 import pandas as pd
-from app.core.models.browser import Browser
-from app.core.schema.spell_check_schema import SpellCheckResponse
+from app.core.models.browser import get_browser_pool
+from app.core.schema.spell_check_job_schema import JobStatus, SpellCheckJob
+from app.core.schema.spell_check_schema import ResultFormat, SpellCheckResponse
 from app.core.service.google_spell_check import run_spell_check
+from app.core.service.input_file import iter_input_chunks, read_input_file
+from app.core.service.metrics import span
+from app.core.service.request_coalescer import get_spell_check_coalescer
+from app.core.service.result_store import get_result_store, hash_file, run_incremental_spell_check
+from app.core.service.spell_check_jobs import get_job_queue
+from app.core.service.spell_check_results import build_incorrect_words
+from app.core.service.streaming_spell_check import run_streaming_spell_check, stream_results
+from app.core.service.uploads import get_upload_index
 from app.settings import get_app_settings
 from fastapi import APIRouter, HTTPException, Query
+from starlette.responses import FileResponse, StreamingResponse
 
 config = get_app_settings()
+logger = logging.getLogger(__name__)
 router_name = 'Spell Check'
 router_description = 'APIs to get spell-check results'
 openapi_tag = {'name': router_name, 'description': router_description}
 router = APIRouter(prefix = '/spell-check', tags = [router_name])
 
+OUTPUT_DESCRIPTION = "'json' returns a SpellCheckResponse keyed by phrase. 'ndjson' and 'csv' stream one record per flagged row, keyed by ID, as chunks of STREAMING_CHUNK_SIZE rows are checked"
+MEDIA_TYPES = {ResultFormat.NDJSON: 'application/x-ndjson', ResultFormat.CSV: 'text/csv'}
+
+
+def streaming_response(run, output, result_file = None):
+    headers = {'X-Result-File': os.path.basename(result_file)} if result_file is not None else None
+    return StreamingResponse(stream_results(run, output.value), media_type = MEDIA_TYPES[output], headers = headers)
+
+def streaming_result_file(file_name):
+    # Every request writes its own file, concurrent requests for files of the same name never share one
+    return os.path.join(os.path.abspath(config.RESULTS_FOLDER), f'{os.path.splitext(file_name)[0]}_{uuid.uuid4().hex}_spell_check.csv')
+
 
 @router.get("/words/{word}",
             summary = 'Spell-check a single word',
             response_model = SpellCheckResponse,
             response_model_exclude_unset = True)
-async def spell_single_word(word: str):
+def spell_single_word(word: str):
     try:
-        browser_object = Browser(google_login_flag = True)
-        if not browser_object.google_logged_in:
-            browser_object.google_login()
-        df = pd.DataFrame(range(1), columns = ['ID'])
-        df['ACTUAL WORDS'] = [word]
-        df = run_spell_check(df, browser_object.browser)
-        df = df[df['INCORRECT WORDS'] != ''].copy()
-        incorrect_words = {}
-        for i in df.index:
-            incorrect_words[df.loc[i, 'ACTUAL WORDS']] = {
-                'suggested_word': df.loc[i, 'SUGGESTED WORDS'],
-                'description': df.loc[i, 'DESCRIPTION']
-            }
-        return SpellCheckResponse(incorrect_words = incorrect_words)
+        df = get_spell_check_coalescer().check([word], timeout = config.COALESCE_TIMEOUT_SECONDS)
+        cache_hits, cache_misses, api_calls = df.attrs['cache_hits'], df.attrs['cache_misses'], df.attrs['sheets_api_calls']
+        with span('serialization'):
+            incorrect_words = build_incorrect_words(df, include_incorrect_word = False)
+        return SpellCheckResponse(incorrect_words = incorrect_words, cache_hits = cache_hits, cache_misses = cache_misses,
+                                  sheets_api_calls = api_calls)
     except Exception as e:
         error_message = f"Could not run spell-check due to exception: '{e}'"
-        print(error_message)
+        logger.error(error_message)
         raise HTTPException(status_code = 500, detail = error_message)
 
 @router.get("/words",
             summary = 'Spell-check list of words',
             response_model = SpellCheckResponse,
             response_model_exclude_unset = True)
-async def spell_word_list(word_list: List[str] = Query(
+def spell_word_list(word_list: List[str] = Query(
             [],
-            description = "List of words to run spell-check on")):
+            description = "List of words to run spell-check on"),
+        output: ResultFormat = Query(
+            ResultFormat.JSON,
+            description = OUTPUT_DESCRIPTION)):
     try:
-        browser_object = Browser(google_login_flag = True)
-        if not browser_object.google_logged_in:
-            browser_object.google_login()
-        df = pd.DataFrame(range(len(word_list)), columns = ['ID'])
-        df['ACTUAL WORDS'] = word_list
-        df = run_spell_check(df, browser_object.browser)
-        df = df[df['INCORRECT WORDS'] != ''].copy()
-        incorrect_words = {}
-        for i in df.index:
-            incorrect_words[df.loc[i, 'ACTUAL WORDS']] = {
-                'incorrect_word': df.loc[i, 'INCORRECT WORDS'],
-                'suggested_word': df.loc[i, 'SUGGESTED WORDS'],
-                'description': df.loc[i, 'DESCRIPTION']
-            }
-        return SpellCheckResponse(incorrect_words = incorrect_words)
+        if output != ResultFormat.JSON:
+            df = pd.DataFrame(range(len(word_list)), columns = ['ID'])
+            df['ACTUAL WORDS'] = word_list
+            chunks = (df.iloc[i : i + config.STREAMING_CHUNK_SIZE] for i in range(0, len(df), config.STREAMING_CHUNK_SIZE))
+            return streaming_response(lambda on_chunk: run_streaming_spell_check(chunks, pool = get_browser_pool(), on_chunk = on_chunk), output)
+        if len(word_list) <= config.COALESCE_MAX_LIST_SIZE:
+            df = get_spell_check_coalescer().check(word_list, timeout = config.COALESCE_TIMEOUT_SECONDS)
+        else:
+            df = pd.DataFrame(range(len(word_list)), columns = ['ID'])
+            df['ACTUAL WORDS'] = word_list
+            df = run_spell_check(df, pool = get_browser_pool())
+        cache_hits, cache_misses, api_calls = df.attrs['cache_hits'], df.attrs['cache_misses'], df.attrs['sheets_api_calls']
+        with span('serialization'):
+            incorrect_words = build_incorrect_words(df)
+        return SpellCheckResponse(incorrect_words = incorrect_words, cache_hits = cache_hits, cache_misses = cache_misses,
+                                  sheets_api_calls = api_calls)
     except Exception as e:
         error_message = f"Could not run spell-check due to exception: '{e}'"
-        print(error_message)
+        logger.error(error_message)
         raise HTTPException(status_code = 500, detail = error_message)
 
 @router.get("/file",
             summary = 'Run spell-check on uploaded file',
             response_model = SpellCheckResponse,
             response_model_exclude_unset = True)
-async def spell_file(file_name: str = Query(
+def spell_file(file_name: str = Query(
             ...,
-            description = "Name of file to be used as input")):
+            description = "Name of file to be used as input"),
+        streaming: bool = Query(
+            False,
+            description = "Read, check and write the file in chunks of STREAMING_CHUNK_SIZE rows, for files too large to hold in memory"),
+        output: ResultFormat = Query(
+            ResultFormat.JSON,
+            description = OUTPUT_DESCRIPTION)):
     try:
         if not os.path.exists(os.path.join(config.UPLOAD_FOLDER, file_name)):
             error_message = f"'{file_name}' does not exist! Use File Input APIs to ensure valid input"
-            print(error_message)
+            logger.error(error_message)
             raise HTTPException(status_code = 422, detail = error_message)
-        browser_object = Browser(google_login_flag = True)
-        if not browser_object.google_logged_in:
-            browser_object.google_login()
-        if file_name.lower().endswith('.csv'):
-            df = pd.read_csv(os.path.join(config.UPLOAD_FOLDER, file_name))
-        elif (file_name.lower().endswith('.xlsx')) or file_name.lower().endswith('.xls'):
-            df = pd.read_excel(os.path.join(config.UPLOAD_FOLDER, file_name))
+        if output != ResultFormat.JSON:
+            # Streamed output always reads and checks the file in chunks
+            chunks = iter_input_chunks(os.path.join(config.UPLOAD_FOLDER, file_name), config.STREAMING_CHUNK_SIZE)
+            result_file = streaming_result_file(file_name) if streaming else None
+            return streaming_response(lambda on_chunk: run_streaming_spell_check(chunks, result_file, pool = get_browser_pool(), on_chunk = on_chunk),
+                                      output, result_file)
+        if streaming:
+            # Only flagged rows are kept for the response, every row is written to the result file
+            flagged_chunks = []
+            chunks = iter_input_chunks(os.path.join(config.UPLOAD_FOLDER, file_name), config.STREAMING_CHUNK_SIZE)
+            result_file = streaming_result_file(file_name)
+            totals = run_streaming_spell_check(chunks, result_file, pool = get_browser_pool(),
+                                               on_chunk = lambda k: flagged_chunks.append(k[k['INCORRECT WORDS'] != '']))
+            df = pd.concat(flagged_chunks, ignore_index = True) if flagged_chunks else pd.DataFrame(columns = ['INCORRECT WORDS'])
+            cache_hits, cache_misses, api_calls = totals['cache_hits'], totals['cache_misses'], totals['sheets_api_calls']
+            df.attrs['result_file'] = os.path.basename(result_file)
         else:
-            with open(os.path.join(config.UPLOAD_FOLDER, file_name), 'r') as f:
-                word_list = [i.strip('\n\r') for i in f.readlines()]
-            df = pd.DataFrame(range(len(word_list)), columns = ['ID'])
-            df['ACTUAL WORDS'] = word_list
-        df = run_spell_check(df, browser_object.browser)
-        df = df[df['INCORRECT WORDS'] != ''].copy()
-        incorrect_words = {}
-        for i in df.index:
-            incorrect_words[df.loc[i, 'ACTUAL WORDS']] = {
-                'incorrect_word': df.loc[i, 'INCORRECT WORDS'],
-                'suggested_word': df.loc[i, 'SUGGESTED WORDS'],
-                'description': df.loc[i, 'DESCRIPTION']
-            }
-        return SpellCheckResponse(incorrect_words = incorrect_words)
+            file_path = os.path.join(config.UPLOAD_FOLDER, file_name)
+            df = read_input_file(file_path)
+            if config.RESULT_STORE_ENABLED:
+                # The hash recorded while the file was uploaded saves reading it again
+                file_hash = get_upload_index().hash_of(file_name, file_path) or hash_file(file_path)
+                df = run_incremental_spell_check(df, file_hash, file_name,
+                                                 lambda k: run_spell_check(k, pool = get_browser_pool()), get_result_store())
+            else:
+                df = run_spell_check(df, pool = get_browser_pool())
+            cache_hits, cache_misses, api_calls = df.attrs['cache_hits'], df.attrs['cache_misses'], df.attrs['sheets_api_calls']
+        with span('serialization'):
+            incorrect_words = build_incorrect_words(df)
+        return SpellCheckResponse(incorrect_words = incorrect_words, cache_hits = cache_hits, cache_misses = cache_misses,
+                                  sheets_api_calls = api_calls, reused_rows = df.attrs.get('reused_rows'), result_file = df.attrs.get('result_file'))
     except HTTPException as http_exception:
         raise http_exception
     except Exception as e:
         error_message = f"Could not run spell-check due to exception: '{e}'"
-        print(error_message)
+        logger.error(error_message)
         raise HTTPException(status_code = 500, detail = error_message)
+
+@router.post("/jobs",
+             summary = 'Submit uploaded file for spell-check in the background',
+             description = 'Returns a job whose progress can be polled and whose result can be downloaded once completed',
+             status_code = 202,
+             response_model = SpellCheckJob)
+async def submit_spell_file_job(file_name: str = Query(
+            ...,
+            description = "Name of file to be used as input")):
+    if not os.path.exists(os.path.join(config.UPLOAD_FOLDER, file_name)):
+        error_message = f"'{file_name}' does not exist! Use File Input APIs to ensure valid input"
+        logger.error(error_message)
+        raise HTTPException(status_code = 422, detail = error_message)
+    try:
+        return get_job_queue().submit(file_name)
+    except queue.Full:
+        raise HTTPException(status_code = 503, detail = 'Spell-check job queue is full, try again later')
+
+@router.get("/jobs/{job_id}",
+            summary = 'Get status and progress of a spell-check job',
+            response_model = SpellCheckJob)
+async def get_spell_file_job(job_id: str):
+    job = get_job_queue().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code = 404, detail = f"Job '{job_id}' does not exist")
+    return job
+
+@router.delete("/jobs/{job_id}",
+               summary = 'Cancel a queued or running spell-check job',
+               response_model = SpellCheckJob)
+async def cancel_spell_file_job(job_id: str):
+    job = get_job_queue().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code = 404, detail = f"Job '{job_id}' does not exist")
+    return job
+
+@router.post("/jobs/{job_id}/resume",
+             summary = 'Resume a failed or interrupted spell-check job',
+             description = 'Continues from the last chunk written to the result, re-checking only the rows after it',
+             status_code = 202,
+             response_model = SpellCheckJob)
+async def resume_spell_file_job(job_id: str):
+    job = get_job_queue().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code = 404, detail = f"Job '{job_id}' does not exist")
+    try:
+        resumed = get_job_queue().resume(job_id)
+    except queue.Full:
+        raise HTTPException(status_code = 503, detail = 'Spell-check job queue is full, try again later')
+    if resumed is None:
+        raise HTTPException(status_code = 409, detail = f"Job '{job_id}' is {job.status.value.lower()} and cannot be resumed")
+    return resumed
+
+@router.get("/jobs/{job_id}/result",
+            summary = 'Download result of a completed spell-check job as CSV')
+async def get_spell_file_job_result(job_id: str):
+    job = get_job_queue().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code = 404, detail = f"Job '{job_id}' does not exist")
+    if job.status != JobStatus.COMPLETED:
+        raise HTTPException(status_code = 409, detail = f"Job '{job_id}' is {job.status.value.lower()}, result is not available")
+    return FileResponse(job.result_file, media_type = 'text/csv', filename = f'{os.path.splitext(job.file_name)[0]}_spell_check.csv')
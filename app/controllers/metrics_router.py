@@ -0,0 +1,35 @@
+from app.core.schema.sheets_quota_schema import SheetsQuotaResponse
+from app.core.service.metrics import REGISTRY, read_trace
+from app.core.service.sheets_quota import get_sheets_quota_scheduler
+from app.settings import get_app_settings
+from fastapi import APIRouter, HTTPException
+from starlette.responses import PlainTextResponse
+
+config = get_app_settings()
+router_name = 'Metrics'
+router_description = 'APIs to monitor request latency and spell-check stages'
+openapi_tag = {'name': router_name, 'description': router_description}
+router = APIRouter(prefix = '/metrics', tags = [router_name])
+
+
+@router.get("",
+            summary = 'Get metrics of this worker in Prometheus text format',
+            response_class = PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type = 'text/plain; version=0.0.4')
+
+@router.get("/traces/{trace_id}",
+            summary = 'Get spans of a traced request',
+            description = "When traces are enabled, requests sent with an 'X-Trace' header are traced and their trace id is returned "
+                          "in the 'X-Trace-Id' header")
+def get_trace(trace_id: str):
+    trace = read_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code = 404, detail = f"Trace '{trace_id}' does not exist")
+    return trace
+
+@router.get("/sheets-quota",
+            summary = 'Get the Google Sheets API quota used by this worker per credential',
+            response_model = SheetsQuotaResponse)
+def get_sheets_quota():
+    return SheetsQuotaResponse(credentials = get_sheets_quota_scheduler().usage())
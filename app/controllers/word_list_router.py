@@ -0,0 +1,67 @@
+import logging
+from typing import List
+
+from app.core.schema.word_list_schema import WordListName, WordListResponse
+from app.core.service.word_lists import get_blacklist, get_whitelist, normalize_word
+from app.settings import get_app_settings
+from fastapi import APIRouter, HTTPException, Query
+
+config = get_app_settings()
+logger = logging.getLogger(__name__)
+router_name = 'Word Lists'
+router_description = 'APIs to view and edit black-listed and white-listed words'
+openapi_tag = {'name': router_name, 'description': router_description}
+router = APIRouter(prefix = '/word-lists', tags = [router_name])
+
+WORD_LISTS = {WordListName.BLACKLIST: get_blacklist, WordListName.WHITELIST: get_whitelist}
+
+
+@router.get("/{name}",
+            summary = 'Get size of a word list or look up a word in it',
+            response_model = WordListResponse,
+            response_model_exclude_unset = True)
+def get_word_list(name: WordListName, word: str = Query(None, description = 'Word or phrase to look up, regardless of case and punctuation')):
+    try:
+        word_list = WORD_LISTS[name]()
+        words = word_list.words()
+        if word is None:
+            return WordListResponse(response_message = f'{len(words)} {name.value} entries', entries = len(words), content_hash = word_list.content_hash)
+        matched_entry = words.get(normalize_word(word))
+        if matched_entry is None:
+            return WordListResponse(response_message = f"'{word}' is not in the {name.value}")
+        return WordListResponse(response_message = f"'{word}' is in the {name.value}", matched_entry = matched_entry)
+    except Exception as e:
+        error_message = f"Could not read word list due to exception: '{e}'"
+        logger.error(error_message)
+        raise HTTPException(status_code = 500, detail = error_message)
+
+@router.post("/{name}/words",
+             summary = 'Add entries to a word list',
+             description = 'Entries already present (regardless of case and punctuation) are skipped. Every worker picks up the change within WORD_LIST_RELOAD_SECONDS',
+             response_model = WordListResponse,
+             response_model_exclude_unset = True)
+def add_words(name: WordListName, words: List[str] = Query(..., description = 'Words or phrases to add')):
+    try:
+        word_list = WORD_LISTS[name]()
+        added, _ = word_list.edit(add = words)
+        return WordListResponse(response_message = f'Added {len(added)} {name.value} entries', entries = len(word_list),
+                                content_hash = word_list.content_hash, added_words = added)
+    except Exception as e:
+        error_message = f"Could not edit word list due to exception: '{e}'"
+        logger.error(error_message)
+        raise HTTPException(status_code = 500, detail = error_message)
+
+@router.delete("/{name}/words",
+               summary = 'Remove entries from a word list',
+               response_model = WordListResponse,
+               response_model_exclude_unset = True)
+def remove_words(name: WordListName, words: List[str] = Query(..., description = 'Words or phrases to remove, regardless of case and punctuation')):
+    try:
+        word_list = WORD_LISTS[name]()
+        _, removed = word_list.edit(remove = words)
+        return WordListResponse(response_message = f'Removed {len(removed)} {name.value} entries', entries = len(word_list),
+                                content_hash = word_list.content_hash, removed_words = removed)
+    except Exception as e:
+        error_message = f"Could not edit word list due to exception: '{e}'"
+        logger.error(error_message)
+        raise HTTPException(status_code = 500, detail = error_message)
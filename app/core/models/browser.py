@@ -1,7 +1,15 @@
+import logging
 import os
 import platform
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
 
 import chromedriver_autoinstaller
+from app.core.service.metrics import WEBDRIVER_CALLS, span
+from app.core.service.worker_lease import get_worker_lease, kill_process_tree, worker_slot
 from app.settings import get_app_settings
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -9,6 +17,7 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
 config = get_app_settings()
+logger = logging.getLogger(__name__)
 
 
 # Singleton Pattern: https://stackoverflow.com/a/6798042
@@ -21,13 +30,17 @@ class Singleton(type):
             cls._instances[cls].__init__(browser = cls._instances[cls].browser, *args, **kwargs)
         return cls._instances[cls]
 
-class Browser(metaclass = Singleton):
+class BrowserSession:
 
-    def __init__(self, browser = None, google_login_flag = False):
+    def __init__(self, browser = None, google_login_flag = False, worksheet_index = 0):
         self.browser = browser
+        # Worksheet of config.SHEET_NAME used by this session, so sessions never overwrite each other's input
+        self.worksheet_index = worksheet_index
+        self.driver_pid = getattr(self, 'driver_pid', None)
+        self.login_attempted_at = getattr(self, 'login_attempted_at', None)
 
         if self.browser == None or not self.is_browser_reachable():
-            os.system("taskkill /f /im chromedriver.exe")
+            self.kill_stale_drivers()
             proxy = config.PROXY
             try:
                 chrome_options = webdriver.ChromeOptions()
@@ -39,7 +52,12 @@ class Browser(metaclass = Singleton):
                 if platform.system() == 'Windows':
                     chrome_options.add_argument('--disable-gpu')  # applicable to windows os only
                 chrome_options.add_argument('--start-maximized')
-                chrome_options.add_argument('--incognito')
+                profile_folder = chrome_profile_folder(worksheet_index)
+                if profile_folder:
+                    # The Google login is kept in the profile, so restarted sessions skip the login flow
+                    chrome_options.add_argument(f'--user-data-dir={profile_folder}')
+                else:
+                    chrome_options.add_argument('--incognito')
                 chrome_options.add_argument('--disable-extensions')
                 chrome_options.add_argument('--disable-popup-blocking')
                 chrome_options.add_argument('--disable-notifications')
@@ -48,14 +66,23 @@ class Browser(metaclass = Singleton):
                 chrome_options.add_experimental_option('useAutomationExtension', False)
                 if proxy:
                     chrome_options.add_argument('--proxy-server = http://%s' % proxy)
-                self.browser = webdriver.Chrome(options = chrome_options, executable_path = chromedriver_autoinstaller.install())
+                with span('browser_start'):
+                    try:
+                        self.browser = webdriver.Chrome(options = chrome_options, executable_path = resolve_chromedriver())
+                    except Exception as e:
+                        # The remembered driver may not match a Chrome updated since, install a matching one
+                        logger.warning(f'Could not start Chrome with the cached chromedriver: {e}')
+                        self.browser = webdriver.Chrome(options = chrome_options, executable_path = resolve_chromedriver(refresh = True))
+                # Recorded so that a later worker holding the same lease can clean up after a crash
+                self.driver_pid = self.browser.service.process.pid
+                get_worker_lease().record_driver(self.driver_pid)
 
                 self.google_logged_in = False
                 # Login to Google Account
                 if google_login_flag:
                     self.google_logged_in = self.google_login()
             except Exception as e:
-                print(e)
+                logger.exception(e)
 
     def is_browser_reachable(self):
         try:
@@ -64,19 +91,39 @@ class Browser(metaclass = Singleton):
         except Exception as e:
             # Log message only if browser is not reachable
             if self.browser is not None:
-                print(e)
+                logger.warning(f'Browser is not reachable: {e}')
                 self.browser.quit()
-                os.system("taskkill /f /im chromedriver.exe")
+                self.kill_stale_drivers()
             return False
 
+    def restart(self):
+        # Replaces a Chrome which stopped responding or got stuck, returning the new WebDriver
+        try:
+            self.browser.quit()
+        except Exception as e:
+            logger.warning(f'Could not quit browser: {e}')
+        self.kill_stale_drivers()
+        BrowserSession.__init__(self, google_login_flag = True, worksheet_index = self.worksheet_index)
+        return self.browser
+
+    def kill_stale_drivers(self):
+        # Only the driver (and the Chrome it started) of this session is killed, other sessions and workers share the machine
+        if self.driver_pid is not None:
+            kill_process_tree(self.driver_pid, 'chromedriver')
+            get_worker_lease().record_driver(self.driver_pid, running = False)
+            self.driver_pid = None
+
     def google_login(self):
+        self.login_attempted_at = time.monotonic()
         try:
+            WEBDRIVER_CALLS.inc(call = 'navigate')
             self.browser.get('https://mail.google.com')
             if ('inbox' in self.browser.title.lower()):
                 self.google_logged_in = True
-                print('Already logged into Google Account!')
+                logger.info('Already logged into Google Account!')
                 return True
 
+            WEBDRIVER_CALLS.inc(call = 'navigate')
             self.browser.get(config.GOOGLE_LOGIN_URL)
             username = os.environ['GOOGLE_USERNAME_ENV']
             password = os.environ['GOOGLE_PASSWORD_ENV']
@@ -86,8 +133,210 @@ class Browser(metaclass = Singleton):
             WebDriverWait(self.browser, 15).until(EC.element_to_be_clickable((By.XPATH, "//input[@name='password']"))).send_keys(password)
             self.browser.find_element_by_id("passwordNext").click()
             self.google_logged_in = True
-            print('Successfully logged into Google Account using credentials!')
+            logger.info('Successfully logged into Google Account using credentials!')
             return True
         except Exception as e:
-            print(e)
+            logger.exception(e)
             return False
+
+
+class Browser(BrowserSession, metaclass = Singleton):
+    pass
+
+
+def resolve_chromedriver(refresh = False):
+    # Installing checks the Chrome version and may download a driver, so the resolved path is kept for the life of the
+    # process and in CHROMEDRIVER_CACHE_PATH for later processes
+    if config.CHROMEDRIVER_PATH:
+        return config.CHROMEDRIVER_PATH
+    if refresh:
+        _resolve_chromedriver.cache_clear()
+        try:
+            os.remove(config.CHROMEDRIVER_CACHE_PATH)
+        except FileNotFoundError:
+            pass
+    return _resolve_chromedriver()
+
+@lru_cache()
+def _resolve_chromedriver():
+    try:
+        with open(config.CHROMEDRIVER_CACHE_PATH, 'r') as f:
+            path = f.read().strip()
+        if os.path.isfile(path):
+            return path
+    except FileNotFoundError:
+        pass
+    path = chromedriver_autoinstaller.install()
+    os.makedirs(os.path.dirname(os.path.abspath(config.CHROMEDRIVER_CACHE_PATH)), exist_ok = True)
+    with open(config.CHROMEDRIVER_CACHE_PATH, 'w') as f:
+        f.write(path)
+    return path
+
+def chrome_profile_folder(worksheet_index):
+    # A profile can only be open in one Chrome at a time, so every session of every worker slot has its own
+    if not config.CHROME_PROFILE_FOLDER:
+        return None
+    return os.path.join(os.path.abspath(config.CHROME_PROFILE_FOLDER), f'worker_{worker_slot()}_session_{worksheet_index}')
+
+
+def create_browser_session(worksheet_index, google_login_flag = True):
+    # Slot 0 is the Browser singleton so that the Browser APIs (login, screenshot) act on a pooled session
+    if worksheet_index == 0:
+        return Browser(google_login_flag = google_login_flag)
+    return BrowserSession(google_login_flag = google_login_flag, worksheet_index = worksheet_index)
+
+
+class IdleSessions(queue.LifoQueue):
+    # The most recently used session is handed out first. put_back() returns a session below the others, so that a
+    # keepalive pass taking sessions one at a time visits each of them once
+
+    def put_back(self, session):
+        with self.not_full:
+            self.queue.insert(0, session)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+
+class BrowserPool:
+
+    def __init__(self, size = 1, session_factory = create_browser_session):
+        self.size = size
+        self.session_factory = session_factory
+        self._idle_sessions = IdleSessions()
+        # Worksheet indices without a session. An index is taken by exactly one live session, so two browsers never
+        # check the same worksheet
+        self._free_indices = set(range(size))
+        self._lock = threading.Lock()
+        self._keepalive = None
+
+    def checkout(self, timeout = None):
+        session = None
+        try:
+            session = self._idle_sessions.get_nowait()
+        except queue.Empty:
+            worksheet_index = self._take_index()
+            if worksheet_index is not None:
+                session = self._create(worksheet_index)
+        if session is None:
+            try:
+                session = self._idle_sessions.get(timeout = timeout)
+            except queue.Empty:
+                raise TimeoutError(f'No browser session became available within {timeout} seconds')
+
+        # Health check: replace sessions whose Chrome died while idle
+        if session.browser is None or not session.is_browser_reachable():
+            logger.warning(f'Replacing unreachable browser session for worksheet {session.worksheet_index}')
+            session = self._create(session.worksheet_index)
+        # A failed login is retried at most every BROWSER_LOGIN_RETRY_SECONDS instead of on every request
+        login_attempted_at = getattr(session, 'login_attempted_at', None)
+        if not getattr(session, 'google_logged_in', False) and (login_attempted_at is None or
+                time.monotonic() - login_attempted_at >= config.BROWSER_LOGIN_RETRY_SECONDS):
+            session.google_login()
+        return session
+
+    def checkin(self, session):
+        self._idle_sessions.put(session)
+
+    @contextmanager
+    def session(self, timeout = None):
+        session = self.checkout(timeout)
+        try:
+            yield session
+        finally:
+            self.checkin(session)
+
+    def warm(self, prepare = None):
+        # Starts every session of the pool ahead of the first request, calling prepare(session) on each, e.g. to log in
+        # and open its worksheet. Sessions are handed to waiting requests as soon as they are ready
+        started = 0
+        while True:
+            worksheet_index = self._take_index()
+            if worksheet_index is None:
+                return started
+            session = self._create(worksheet_index)
+            try:
+                if prepare is not None:
+                    prepare(session)
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                self.checkin(session)
+            started += 1
+
+    def keepalive(self, prepare = None):
+        # Pings the idle sessions one at a time, so that requests keep checking out the others meanwhile. Sessions whose
+        # Chrome died are replaced and passed to prepare(session), as warm() does. Sessions in use are left alone
+        for _ in range(self._idle_sessions.qsize()):
+            try:
+                session = self._idle_sessions.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                reachable = session.browser is not None and session.is_browser_reachable()
+            except Exception as e:
+                logger.exception(e)
+                reachable = False
+            if not reachable:
+                logger.warning(f'Replacing unreachable browser session for worksheet {session.worksheet_index}')
+                try:
+                    session = self._create(session.worksheet_index)
+                except Exception as e:
+                    # The worksheet index is free again, the next checkout starts its session
+                    logger.exception(e)
+                    continue
+                try:
+                    if prepare is not None:
+                        prepare(session)
+                except Exception as e:
+                    logger.exception(e)
+            self._idle_sessions.put_back(session)
+
+    def start_keepalive(self, interval, prepare = None):
+        stop = threading.Event()
+        def run():
+            while not stop.wait(interval):
+                self.keepalive(prepare)
+        self._keepalive = stop
+        threading.Thread(target = run, name = 'browser-keepalive', daemon = True).start()
+
+    def stop_keepalive(self):
+        if self._keepalive is not None:
+            self._keepalive.set()
+            self._keepalive = None
+
+    def close(self):
+        while True:
+            try:
+                session = self._idle_sessions.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                session.browser.quit()
+            except Exception as e:
+                logger.exception(e)
+            session.kill_stale_drivers()
+            with self._lock:
+                self._free_indices.add(session.worksheet_index)
+
+    def _take_index(self):
+        with self._lock:
+            if not self._free_indices:
+                return None
+            worksheet_index = min(self._free_indices)
+            self._free_indices.remove(worksheet_index)
+            return worksheet_index
+
+    def _create(self, worksheet_index):
+        # Also used to replace a dead session, whose index is then held by no session if the replacement fails
+        try:
+            return self.session_factory(worksheet_index)
+        except Exception:
+            # Give the index back so that a later checkout can retry creating it
+            with self._lock:
+                self._free_indices.add(worksheet_index)
+            raise
+
+
+@lru_cache()
+def get_browser_pool() -> BrowserPool:
+    return BrowserPool(size = config.BROWSER_POOL_SIZE)
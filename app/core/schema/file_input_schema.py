@@ -7,3 +7,11 @@ class FileInputResponse(BaseModel):
     response_message: str
     all_files: Optional[List[str]] = None
     deleted_files: Optional[List[str]] = None
+    # SHA-256 of the uploaded content, computed while it is written to disk
+    file_hash: Optional[str] = None
+    size_bytes: Optional[int] = None
+    throughput_mb_per_sec: Optional[float] = None
+    # Previously uploaded file with identical content
+    duplicate_of: Optional[str] = None
+    # Bytes of a resumable upload received so far
+    offset: Optional[int] = None
@@ -0,0 +1,18 @@
+from typing import List
+
+from pydantic import BaseModel
+
+
+class CredentialQuota(BaseModel):
+    # File name of the service account key, or the environment variable holding it
+    credential: str
+    requests_per_minute: float
+    available_tokens: float
+    # Seconds left of the pause after a 429
+    paused_seconds: float
+    requests: int
+    rate_limited: int
+    wait_seconds: float
+
+class SheetsQuotaResponse(BaseModel):
+    credentials: List[CredentialQuota]
@@ -0,0 +1,34 @@
+from enum import Enum
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class JobStatus(str, Enum):
+    QUEUED = "Queued"
+    RUNNING = "Running"
+    COMPLETED = "Completed"
+    FAILED = "Failed"
+    CANCELLED = "Cancelled"
+
+class SpellCheckJob(BaseModel):
+    job_id: str
+    file_name: str
+    status: JobStatus = JobStatus.QUEUED
+    rows_total: Optional[int] = None
+    rows_processed: int = 0
+    misspellings_found: int = 0
+    error: Optional[str] = None
+    result_file: Optional[str] = None
+    # Input rows whose results are in result_file, of which checkpoint_misspellings are flagged, and the size of
+    # result_file at that point. A resumed job continues from there
+    checkpoint_rows: int = 0
+    checkpoint_misspellings: int = 0
+    checkpoint_bytes: int = 0
+    resumes: int = 0
+    # Process whose queue holds the job or which runs it. A running job has heartbeat_at refreshed by its owner every
+    # JOB_HEARTBEAT_SECONDS
+    owner_pid: Optional[int] = None
+    heartbeat_at: Optional[float] = None
+    created_at: float
+    updated_at: float
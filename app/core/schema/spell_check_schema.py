@@ -1,7 +1,22 @@
-from typing import Dict
+from enum import Enum
+from typing import Dict, Optional
 
 from pydantic import BaseModel
 
 
 class SpellCheckResponse(BaseModel):
     incorrect_words: Dict[str, Dict[str, str]]
+    cache_hits: Optional[int] = None
+    cache_misses: Optional[int] = None
+    # Google Sheets API calls made for the request, shared by every request of a coalesced batch
+    sheets_api_calls: Optional[int] = None
+    # Rows of a file request whose results were taken from the result store instead of being checked
+    reused_rows: Optional[int] = None
+    # Name in RESULTS_FOLDER of the result file written by a streaming file request
+    result_file: Optional[str] = None
+
+class ResultFormat(str, Enum):
+    # JSON is a single SpellCheckResponse keyed by phrase, NDJSON and CSV stream one ID-keyed record per flagged row
+    JSON = "json"
+    NDJSON = "ndjson"
+    CSV = "csv"
@@ -0,0 +1,19 @@
+from enum import Enum
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class WordListResponse(BaseModel):
+    response_message: str
+    entries: Optional[int] = None
+    # SHA-256 of the word-list file, changes whenever it is edited
+    content_hash: Optional[str] = None
+    added_words: Optional[List[str]] = None
+    removed_words: Optional[List[str]] = None
+    # Entry as written in the word list that a looked up word matched
+    matched_entry: Optional[str] = None
+
+class WordListName(str, Enum):
+    BLACKLIST = "blacklist"
+    WHITELIST = "whitelist"
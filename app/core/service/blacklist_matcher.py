@@ -0,0 +1,101 @@
+import threading
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+from app.core.service.word_lists import get_blacklist, normalize_word
+
+# (SortedWordFile, BlacklistMatcher) of the black-listed words last compiled
+_matcher = (None, None)
+_matcher_lock = threading.Lock()
+
+
+class BlacklistMatcher:
+
+    def __init__(self, words):
+        # words: entries as written, or a mapping of normalized entry --> entry as written such as a SortedWordFile.
+        # Normalized entries are token sequences joined by single spaces
+        if isinstance(words, Mapping):
+            self.entries = words
+        else:
+            self.entries = {}
+            for word in sorted(words):
+                if normalize_word(word):
+                    self.entries.setdefault(normalize_word(word), word)
+        phrases = [i for i in self.entries if ' ' in i]
+        self.max_length = max((i.count(' ') + 1 for i in phrases), default = 1 if len(self.entries) else 0)
+        self.first_tokens = {i.split(' ')[0] for i in phrases}
+
+    def find(self, texts):
+        # Returns {row position: [matched entries in order of appearance]}
+        if not len(self.entries):
+            return {}
+        tokens = pd.Series(texts, dtype = object).reset_index(drop = True).astype(str).str.split().explode().dropna()
+        # Tokens repeat a lot, so normalization and lookups run once per distinct token
+        codes, uniques = pd.factorize(tokens)
+        normalized = np.array([normalize_word(i) for i in uniques], dtype = object)
+        unique_entries = np.array([self.entries.get(i) for i in normalized], dtype = object)
+        unique_starts = np.array([i in self.first_tokens for i in normalized], dtype = bool)
+
+        keep = normalized[codes] != ''
+        codes = codes[keep]
+        rows = tokens.index.to_numpy()[keep]
+        values = normalized[codes]
+
+        matched_positions = [np.flatnonzero(unique_entries[codes] != None)]
+        matched_entries = [unique_entries[codes[matched_positions[0]]]]
+
+        # Multi-word entries are only looked for where a token starts one of them
+        starts = np.flatnonzero(unique_starts[codes])
+        for length in range(2, self.max_length + 1):
+            starts = starts[starts + length - 1 < len(values)]
+            starts = starts[rows[starts] == rows[starts + length - 1]]
+            if len(starts) == 0:
+                break
+            grams = values[starts]
+            for offset in range(1, length):
+                grams = grams + ' ' + values[starts + offset]
+            entries = np.array([self.entries.get(i) for i in grams], dtype = object)
+            matched_positions.append(starts[entries != None])
+            matched_entries.append(entries[entries != None])
+
+        positions = np.concatenate(matched_positions)
+        order = np.argsort(positions, kind = 'stable')
+        matches = {}
+        for row, entry in zip(rows[positions[order]].tolist(), np.concatenate(matched_entries)[order].tolist()):
+            row_matches = matches.setdefault(row, [])
+            if entry not in row_matches:
+                row_matches.append(entry)
+        return matches
+
+    def mark(self, df):
+        matches = self.find(df.iloc[:, 1])
+        if not matches:
+            return df
+        incorrect_column = df.columns.get_loc('INCORRECT WORDS')
+        description_column = df.columns.get_loc('DESCRIPTION')
+        positions = list(matches)
+        incorrect_words = df.iloc[positions, incorrect_column].tolist()
+        descriptions = df.iloc[positions, description_column].tolist()
+        for k, position in enumerate(positions):
+            for j in matches[position]:
+                if incorrect_words[k] == '':
+                    incorrect_words[k] = j
+                    descriptions[k] = j + ' marked using black-listed words'
+                elif j not in incorrect_words[k]:
+                    incorrect_words[k] = incorrect_words[k] + ', ' + j
+                    descriptions[k] = (descriptions[k] + ', ' + j + ' marked using black-listed words') if descriptions[k] != '' else (j + ' marked using black-listed words')
+        df.iloc[positions, incorrect_column] = incorrect_words
+        df.iloc[positions, description_column] = descriptions
+        return df
+
+
+def get_blacklist_matcher() -> BlacklistMatcher:
+    # Recompiled whenever the black-listed words change
+    global _matcher
+    words = get_blacklist().words()
+    with _matcher_lock:
+        if _matcher[0] is not words:
+            _matcher = (words, BlacklistMatcher(words))
+        return _matcher[1]
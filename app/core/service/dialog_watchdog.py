@@ -0,0 +1,60 @@
+import threading
+
+from app.settings import get_app_settings
+
+config = get_app_settings()
+
+
+class DialogStalled(Exception):
+    pass
+
+
+class AdaptiveTimeout:
+    # Timeout following the observed durations of an operation, computed as TCP does for retransmissions (RFC 6298):
+    # the smoothed duration plus four times its smoothed deviation, kept between minimum and maximum
+
+    def __init__(self, initial, minimum, maximum):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.mean = None
+        self.deviation = None
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            if self.mean is None:
+                self.mean, self.deviation = seconds, seconds / 2
+            else:
+                self.deviation = 0.75 * self.deviation + 0.25 * abs(self.mean - seconds)
+                self.mean = 0.875 * self.mean + 0.125 * seconds
+
+    @property
+    def timeout(self):
+        with self._lock:
+            if self.mean is None:
+                return self.initial
+            return min(max(self.mean + 4 * self.deviation, self.minimum), self.maximum)
+
+
+# Shared by every session of the process, Sheets responds alike whichever Chrome asks
+PAGE_LOAD_TIMEOUT = AdaptiveTimeout(30, config.SPELL_CHECK_PAGE_TIMEOUT_MIN_SECONDS, config.SPELL_CHECK_PAGE_TIMEOUT_MAX_SECONDS)
+DIALOG_STALL_TIMEOUT = AdaptiveTimeout(60, config.SPELL_CHECK_STALL_TIMEOUT_MIN_SECONDS, config.SPELL_CHECK_STALL_TIMEOUT_MAX_SECONDS)
+
+
+class DialogCheckpoint:
+    # Position of the spell-check dialog in a shard: rows before it have been checked completely, so a check recovered
+    # in a new browser only uploads the rows after the checkpoint again. Their verdicts are only written to the verdict
+    # cache once the whole check completed, as a check which fails for good may have skipped rows
+
+    def __init__(self, start):
+        self.start = start
+        self.position = start
+
+    @property
+    def resume_position(self):
+        # The row under the dialog may hold misspellings which were not read yet, so it is checked again
+        return max(self.start, self.position - 1)
+
+    def advance(self, position):
+        self.position = max(self.position, position)
@@ -1,151 +1,589 @@
-import os
+import logging
+import math
+import queue
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from itertools import chain
+from typing import NamedTuple
 
 import numpy as np
 import pandas as pd
-import pygsheets
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
-from tqdm import tqdm
 
+from app.core.service.blacklist_matcher import get_blacklist_matcher
+from app.core.service.dialog_watchdog import DIALOG_STALL_TIMEOUT, PAGE_LOAD_TIMEOUT, DialogCheckpoint, DialogStalled
+from app.core.service.metrics import DIALOG_RECOVERIES, DIALOG_TIMEOUTS, MISSPELLINGS, VERDICT_CACHE_LOOKUPS, WEBDRIVER_CALLS, span, traced
+from app.core.service.sheets_session import COLUMN_ROWS, get_sheets_session
+from app.core.service.spell_check_backend import SymSpellBackend
+from app.core.service.spell_check_results import (RESULT_COLUMNS, RowIndex, SpellCheckProgress, apply_verdicts,
+                                                  record_misspelling, verdicts_from_misspellings, write_results)
+from app.core.service.symspell import get_symspell_index
+from app.core.service.verdict_cache import Verdict, get_verdict_cache, split_tokens
+from app.core.service.worker_lease import worker_slot
 from app.settings import get_app_settings
 
 config = get_app_settings()
+logger = logging.getLogger(__name__)
 
 
-def fill_google_sheet(df):
+class SheetShard(NamedTuple):
+    # Rows start:stop of a payload, written to worksheet_index of spreadsheet sheet_name
+    sheet_name: str
+    worksheet_index: int
+    start: int
+    stop: int
+    wks: object
+
+def sheet_shard_targets(worksheet_index, shard_count):
+    # Shard j goes to the spreadsheet j % len(sheet_names), every worksheet_index owning its own worksheets in them.
+    # Worksheet indices are local to the worker process: one per pooled session (or two for the streaming uploads of
+    # the Browser singleton), followed by those of StreamWorksheets
+    sheet_names = [config.SHEET_NAME] + config.SHEETS_SHARD_SPREADSHEETS
+    worksheets_per_sheet = math.ceil(max(1, config.SHEETS_WRITE_SHARDS) / len(sheet_names))
+    worksheets_per_worker = max(config.BROWSER_POOL_SIZE, 2) + 2 * config.STREAMING_CONCURRENT_UPLOADS
+    worksheet_index = worker_slot() * worksheets_per_worker + worksheet_index
+    return [(sheet_names[j % len(sheet_names)], worksheet_index * worksheets_per_sheet + j // len(sheet_names)) for j in range(shard_count)]
+
+def clean_phrases(phrases):
+    # Arrow-backed text (e.g. of Parquet inputs) is cleaned in its Arrow buffers, other columns become Python strings
+    if isinstance(phrases.dtype, pd.StringDtype):
+        return phrases.fillna('').str.replace('\r\n', ' ', regex = False)
+    return phrases.apply(lambda k: str(k).replace('\r\n', ' '))
+
+def fill_google_sheet(df, worksheet_index = 0):
+    # Returns the SheetShards holding df, in row order. Failed uploads raise, a request never goes on without its sheet
+    df.iloc[:, 1] = clean_phrases(df.iloc[:, 1])
+    # Large payloads are split into contiguous shards, written concurrently to separate worksheets
+    shard_count = max(1, min(config.SHEETS_WRITE_SHARDS, len(df) // config.SHEETS_WRITE_MIN_SHARD_SIZE))
+    bounds = np.linspace(0, len(df), shard_count + 1).astype(int)
+    targets = sheet_shard_targets(worksheet_index, shard_count)
+    calls = [Counter() for _ in range(shard_count)]
+
+    def write_shard(j):
+        # The authorized client and worksheet handles are kept by the Sheets session between calls
+        sheet_name, index = targets[j]
+        wks = get_sheets_session(sheet_name).fill(df.iloc[bounds[j] : bounds[j + 1]], index, calls[j])
+        return SheetShard(sheet_name, index, int(bounds[j]), int(bounds[j + 1]), wks)
 
     try:
-        # Authorization
-        client = None
-        if os.path.exists(config.CREDENTIALS_JSON_PATH):
-            client = pygsheets.authorize(service_file = config.CREDENTIALS_JSON_PATH)
-        else:
-            client = pygsheets.authorize(service_account_env_var = config.CREDENTIALS_ENV_VAR)
+        with span('sheets_upload'):
+            if shard_count == 1:
+                return [write_shard(0)]
+            logger.info(f'Writing {len(df)} phrases to {shard_count} worksheets')
+            with ThreadPoolExecutor(max_workers = max(1, min(config.SHEETS_WRITE_WORKERS, shard_count))) as executor:
+                return list(executor.map(traced(write_shard), range(shard_count)))
+    finally:
+        count_api_calls(df, sum(calls, Counter()))
+
+def clear_google_sheet(df, shards):
+    calls = Counter()
+    with span('sheets_clear'):
+        for shard in shards:
+            get_sheets_session(shard.sheet_name).clear(shard.wks, calls)
+    count_api_calls(df, calls)
+
+def count_api_calls(df, calls):
+    add_counts(df, sheets_api_calls = sum(calls.values()))
+
+def add_counts(df, **counts):
+    for name, count in counts.items():
+        df.attrs[name] = df.attrs.get(name, 0) + count
 
-        # Open the google spreadsheet (where config.SHEET_NAME is the name of my sheet)
-        spreadsheet = client.open(config.SHEET_NAME)
+class DialogMetrics:
+    # WebDriver round trips and wall time of the spell-check dialog loop, reported per recorded misspelling
 
-        # Select the first worksheet and clear it
-        wks = spreadsheet[0]
-        wks.clear()
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.round_trips = 0
+        self.misspellings = 0
 
-        # Increase rows in sheet
-        wks.resize(192000)
+    def record_misspelling(self):
+        self.misspellings += 1
 
-        df.iloc[:, 1] = df.iloc[:, 1].apply(lambda k: str(k).replace('\r\n', ' '))
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
 
-        div, rem = len(df) // 191000, len(df) % 191000
-        a = 0
-        for i in range(div):
-            b = a + 191000
-            wks.set_dataframe(pd.DataFrame(df.iloc[a : b, 1]), (1, i + 1))
-            a = b
-        # DO NOT REPLACE "a + rem" WITH "b + rem" AS IT THROWS ERROR!
-        wks.set_dataframe(pd.DataFrame(df.iloc[a : a + rem, 1]), (1, div + 1))
+    def summary(self):
+        per_misspelling = max(self.misspellings, 1)
+        return (f'{self.misspellings} misspellings in {self.seconds:.1f}s: {self.round_trips / per_misspelling:.1f} round trips and '
+                f'{1000 * self.seconds / per_misspelling:.0f} ms per misspelling')
 
-        return wks
-    except Exception as e:
-        print(e)
+# Reads the spell-check dialog: cell text, misspelled word, first suggestion and button visibility
+DIALOG_STATE_SCRIPT = '''
+function dialogState() {
+    function visible(element) { return !!element && element.offsetParent !== null; }
+    var cell = document.getElementsByClassName('cell-input')[0];
+    var word = document.getElementById('docs-spellcheckslidingdialog-original-word');
+    var suggestion = document.getElementsByClassName('goog-menuitem-content')[0];
+    return {
+        phrase: cell ? cell.innerText : '',
+        word: word ? word.innerText : '',
+        suggestion: suggestion ? suggestion.innerText : '',
+        ignore_visible: visible(document.getElementById('docs-spellcheckslidingdialog-button-ignore')),
+        done: visible(document.getElementById('docs-spellcheckslidingdialog-no-misspellings-footer'))
+    };
+}
+'''
+READ_DIALOG_STATE_SCRIPT = DIALOG_STATE_SCRIPT + 'return dialogState();'
+# Selects the cell labelled arguments[0] through the name box and returns the text of the formula bar. The selection may
+# only move after the script returned, so a caller polls until it reads the cell it asked for
+READ_CELL_SCRIPT = '''
+var nameBox = document.getElementById('t-name-box');
+if (nameBox) {
+    nameBox.value = arguments[0];
+    nameBox.dispatchEvent(new KeyboardEvent('keydown', {key: 'Enter', keyCode: 13, bubbles: true}));
+}
+var formulaBar = document.querySelector('#t-formula-bar-input .cell-input');
+return formulaBar ? formulaBar.innerText.replace(/\\n$/, '') : null;
+'''
+# Presses "Ignore all" or "Ignore" as named by arguments[1] and calls back with the dialog state once it differs from arguments[0],
+# or after arguments[2] milliseconds when it does not change (e.g. the same word is misspelled twice in a cell)
+NEXT_DIALOG_STATE_SCRIPT = DIALOG_STATE_SCRIPT + '''
+var previous = arguments[0], ignore = arguments[1], timeout = arguments[2], callback = arguments[arguments.length - 1];
+function changed(state) {
+    return state.done || (state.word !== '' && (state.word !== previous.word || state.phrase !== previous.phrase));
+}
+var finished = false;
+function finish() {
+    if (finished) { return; }
+    finished = true;
+    observer.disconnect();
+    clearTimeout(timer);
+    callback(dialogState());
+}
+var observer = new MutationObserver(function () { if (changed(dialogState())) { finish(); } });
+observer.observe(document.body, {childList: true, subtree: true, characterData: true, attributes: true});
+var timer = setTimeout(finish, timeout);
+if (ignore) {
+    // "Ignore all" skips the word in every other cell, dialogs without it fall back to "Ignore".
+    // Closure buttons react to mouse events rather than to click() alone
+    var button = ignore === 'ignore_all' ? document.getElementById('docs-spellcheckslidingdialog-button-ignore-all') : null;
+    if (!button || button.offsetParent === null) {
+        button = document.getElementById('docs-spellcheckslidingdialog-button-ignore');
+    }
+    ['mousedown', 'mouseup', 'click'].forEach(function (type) {
+        button.dispatchEvent(new MouseEvent(type, {bubbles: true, cancelable: true, view: window}));
+    });
+}
+if (changed(dialogState())) { finish(); }
+'''
 
 def mark_bad_words_from_file(df):
-    df.replace(np.NaN, '', regex = True, inplace = True)
-    # Explicitly mark words from BLACKLIST_WORDS
-    print('Marking bad words from file...')
-    for i in tqdm(df.index):
-        # Creating set and taking intersection to reduce inner for loop iterations
-        bad_words = config.BLACKLIST_WORDS & set(df.at[i, df.columns[1]].split())
-        for j in bad_words:
-            if df.at[i, 'INCORRECT WORDS'] == '':
-                df.at[i, 'INCORRECT WORDS'] = j
-                df.at[i, 'DESCRIPTION'] = j + ' marked using black-listed words'
-            if j not in df.at[i, 'INCORRECT WORDS']:
-                df.at[i, 'INCORRECT WORDS'] = df.at[i, 'INCORRECT WORDS'] + ', ' + j
-                df.at[i, 'DESCRIPTION'] = (df.at[i, 'DESCRIPTION'] + ', ' + j + ' marked using black-listed words') if df.at[i, 'DESCRIPTION'] != '' else (j + ' marked using black-listed words')
-    return df
-
-def run_spell_check(df, browser):
-    wks = fill_google_sheet(df)
-
-    df['INCORRECT WORDS'] = '' * len(df)
-    df['SUGGESTED WORDS'] = '' * len(df)
-    df['DESCRIPTION'] = '' * len(df)
-
-    browser.get(wks.url)
+    df.replace(np.nan, '', inplace = True)
+    # Explicitly mark words and phrases from the black-listed words
+    with span('blacklist_marking'):
+        return get_blacklist_matcher().mark(df)
+
+def run_google_spell_check(df, browser, worksheet_index = 0, progress = None, shards = None, recover = None):
+    # shards: SheetShards already filled with df by fill_google_sheet, otherwise worksheet_index is filled here.
+    # recover: optional callable restarting Chrome and returning its new WebDriver, used when the dialog stalls or the
+    # browser fails. The rows after the last checkpoint are then uploaded again and checked in the new browser. Without
+    # it, the first failure is raised
+    if shards is None:
+        shards = fill_google_sheet(df, worksheet_index)
+
+    # Misspelled (word, suggestion) pairs are collected per row and written to df once every shard is checked
+    phrases = df.iloc[:, 1].tolist()
+    row_index = RowIndex(phrases)
+    row_misspellings = {}
+    flag = 1
+    metrics = DialogMetrics()
+    try:
+        # One spell-check pass per worksheet. Rows are recorded against their position in df, which merges the shards
+        for shard in shards:
+            checkpoint = DialogCheckpoint(shard.start)
+            recoveries = 0
+            while True:
+                try:
+                    flag = check_worksheet(browser, shard, row_index, row_misspellings, progress, metrics, checkpoint, reload = recoveries > 0)
+                    break
+                except (DialogStalled, WebDriverException) as e:
+                    recoveries += 1
+                    # Retrying in the same browser would fail alike
+                    if recover is None or recoveries > config.SPELL_CHECK_MAX_RECOVERIES:
+                        raise
+                    DIALOG_RECOVERIES.inc(reason = type(e).__name__)
+                    logger.warning(f'Resuming spell-check of rows {checkpoint.resume_position} to {shard.stop} after exception: {e!r}')
+                    browser = recover()
+                    shard = refill_shard(df, shard, checkpoint.resume_position)
+            if not flag:
+                break
+    finally:
+        # Reset Sheet
+        clear_google_sheet(df, shards)
+        logger.info(f'Spell-check dialog: {metrics.summary()}')
+        add_counts(df, dialog_round_trips = metrics.round_trips, dialog_misspellings = metrics.misspellings, dialog_seconds = metrics.seconds)
+
+    if progress is not None:
+        progress(len(phrases), [])
+
+    df, misspellings = write_results(df, phrases, row_misspellings)
+    # Verdicts are only trustworthy if the spell-check dialog ran to the end
+    return df, (misspellings if flag else None)
+
+def refill_shard(df, shard, start):
+    # Uploads the rows start:shard.stop of df, which have not been checked yet, in place of the shard's worksheet
+    calls = Counter()
+    with span('sheets_upload'):
+        wks = get_sheets_session(shard.sheet_name).fill(df.iloc[start : shard.stop], shard.worksheet_index, calls)
+    count_api_calls(df, calls)
+    return shard._replace(start = start, wks = wks)
+
+def check_worksheet(browser, shard, row_index, row_misspellings, progress = None, metrics = None, checkpoint = None, reload = False):
+    # Runs the spell-check dialog over shard.wks. Returns 0 when the dialog could not be opened
+    with span('page_navigation'):
+        if not open_spell_check_dialog(browser, shard.wks, reload, last_written_cell(shard, row_index.phrases)):
+            return 0
+    with span('dialog_loop'):
+        run_dialog_loop(browser, shard, row_index, row_misspellings, progress, metrics, checkpoint)
+    return 1
+
+def open_spell_check_dialog(browser, wks, reload = False, last_cell = None):
+    # last_cell: label and value of the last cell written to wks, which a worksheet left open must show before its reuse
+    started = time.monotonic()
+    WEBDRIVER_CALLS.inc(call = 'current_url')
+    reuse = not reload and last_cell is not None and same_sheet_url(browser.current_url, wks.url)
+    if reuse:
+        # The worksheet is still open from the last check and receives the new values through the Sheets live updates.
+        # Closing the dialog left open and waiting for the grid to show them replaces a full page load
+        WEBDRIVER_CALLS.inc(call = 'actions')
+        ActionChains(browser).send_keys(Keys.ESCAPE).perform()
+        reuse = cell_shows(browser, *last_cell, config.BROWSER_REUSE_SETTLE_MS / 1000)
+        if not reuse:
+            logger.info(f'Reloading {wks.url} as it did not show the new values within {config.BROWSER_REUSE_SETTLE_MS} ms')
+    if not reuse:
+        WEBDRIVER_CALLS.inc(call = 'navigate')
+        browser.get(wks.url)
     # Checking if Sheet Title can be changed. This indicates spreadsheet is ready to use.
-    title_box = WebDriverWait(browser, 15).until(EC.presence_of_element_located((By.XPATH, "//input[@class='docs-title-input']")))
+    WEBDRIVER_CALLS.inc(call = 'wait')
+    title_box = WebDriverWait(browser, PAGE_LOAD_TIMEOUT.timeout).until(EC.presence_of_element_located((By.XPATH, "//input[@class='docs-title-input']")))
+    WEBDRIVER_CALLS.inc(call = 'actions')
     ActionChains(browser).key_down(Keys.CONTROL).send_keys(Keys.ARROW_DOWN).key_up(Keys.CONTROL).perform()
 
     # Tools --> Spelling --> Spell Check
-    tools = WebDriverWait(browser, 15).until(EC.presence_of_element_located((By.ID, 'docs-tools-menu')))
+    WEBDRIVER_CALLS.inc(call = 'wait')
+    tools = WebDriverWait(browser, PAGE_LOAD_TIMEOUT.timeout).until(EC.presence_of_element_located((By.ID, 'docs-tools-menu')))
+    WEBDRIVER_CALLS.inc(call = 'click')
     tools.click()
+    WEBDRIVER_CALLS.inc(call = 'actions')
     ActionChains(browser).send_keys(Keys.ENTER, Keys.ARROW_DOWN, Keys.ARROW_DOWN, Keys.ARROW_DOWN, Keys.ARROW_DOWN, Keys.ARROW_DOWN, Keys.ARROW_RIGHT, Keys.ENTER).perform()
 
-    flag = 1
-    no_result = None
-    ignore_btn = None
     try:
-        ignore_btn = WebDriverWait(browser, 15).until(EC.presence_of_element_located((By.ID, 'docs-spellcheckslidingdialog-button-ignore')))
-        no_result = WebDriverWait(browser, 15).until(EC.presence_of_element_located((By.ID, 'docs-spellcheckslidingdialog-no-misspellings-footer')))
+        WEBDRIVER_CALLS.inc(2, call = 'wait')
+        WebDriverWait(browser, PAGE_LOAD_TIMEOUT.timeout).until(EC.presence_of_element_located((By.ID, 'docs-spellcheckslidingdialog-button-ignore')))
+        WebDriverWait(browser, PAGE_LOAD_TIMEOUT.timeout).until(EC.presence_of_element_located((By.ID, 'docs-spellcheckslidingdialog-no-misspellings-footer')))
     except:
-        flag = 0
+        return 0
+    PAGE_LOAD_TIMEOUT.observe(time.monotonic() - started)
+    return 1
+
+def cell_shows(browser, label, value, timeout):
+    # Whether the cell labelled label shows value within timeout seconds
+    deadline = time.monotonic() + timeout
+    while True:
+        WEBDRIVER_CALLS.inc(call = 'execute_script')
+        if browser.execute_script(READ_CELL_SCRIPT, label) == value:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+
+def last_written_cell(shard, phrases):
+    # Label and value of the last cell SheetsSession.fill() wrote for the rows of shard, None when it has no rows
+    count = shard.stop - shard.start
+    if count <= 0:
+        return None
+    column, row = divmod(count - 1, COLUMN_ROWS)
+    return f'{column_label(column + 1)}{row + 2}', str(phrases[shard.stop - 1])
+
+def column_label(column):
+    # 1 --> "A", 27 --> "AA"
+    label = ''
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        label = chr(ord('A') + remainder) + label
+    return label
 
+def same_sheet_url(current_url, url):
+    # Sheets may append parameters (e.g. "?pli=1") to the path before the "#gid=" fragment
+    if not current_url or not url:
+        return False
+    current_path, _, current_fragment = current_url.partition('#')
+    path, _, fragment = url.partition('#')
+    return current_path.split('?')[0] == path.split('?')[0] and current_fragment == fragment
+
+def open_session_worksheet(session):
+    # Loads the first worksheet of a pooled session in its Chrome, so that its first check skips the page load
+    sheet_name, index = sheet_shard_targets(session.worksheet_index, 1)[0]
+    sheets_session = get_sheets_session(sheet_name)
+    with sheets_session.connection() as connection:
+        wks = sheets_session.worksheet(connection, index)
+    WEBDRIVER_CALLS.inc(call = 'navigate')
+    session.browser.get(wks.url)
+    WEBDRIVER_CALLS.inc(call = 'wait')
+    WebDriverWait(session.browser, 30).until(EC.presence_of_element_located((By.XPATH, "//input[@class='docs-title-input']")))
+
+def warm_start_browser_pool(pool):
+    # Launches and logs in every session of the pool, opens their worksheets and keeps them alive between requests
+    start = time.perf_counter()
+    started = pool.warm(open_session_worksheet)
+    logger.info(f'Warmed {started} browser sessions in {time.perf_counter() - start:.1f} seconds')
+    if config.BROWSER_KEEPALIVE_SECONDS > 0:
+        pool.start_keepalive(config.BROWSER_KEEPALIVE_SECONDS, open_session_worksheet)
+
+def run_dialog_loop(browser, shard, row_index, row_misspellings, progress = None, metrics = None, checkpoint = None):
+    # Every iteration is a single WebDriver round trip: the script presses "Ignore all" (or "Ignore") if asked to
+    # and returns the next dialog state as soon as a MutationObserver sees it change.
+    # A misspelled word is applied to every row containing it when first seen, so it needs a single iteration.
+    # Raises DialogStalled when the dialog does not move within DIALOG_STALL_TIMEOUT.
+    metrics = metrics if metrics is not None else DialogMetrics()
+    browser.set_script_timeout(config.SPELL_CHECK_DIALOG_WAIT_MS / 1000 + 30)
+    last_change = time.monotonic()
+
+    def next_state(state, ignore = None):
+        nonlocal last_change
+        metrics.round_trips += 1
+        WEBDRIVER_CALLS.inc(call = 'execute_async_script')
+        new_state = browser.execute_async_script(NEXT_DIALOG_STATE_SCRIPT, state, ignore, config.SPELL_CHECK_DIALOG_WAIT_MS)
+        now = time.monotonic()
+        if new_state['done'] or (new_state['word'], new_state['phrase']) != (state['word'], state['phrase']):
+            DIALOG_STALL_TIMEOUT.observe(now - last_change)
+            last_change = now
+        else:
+            DIALOG_TIMEOUTS.inc()
+            if now - last_change > DIALOG_STALL_TIMEOUT.timeout:
+                raise DialogStalled(f"Spell-check dialog did not move for {now - last_change:.0f} seconds on '{state['word']}' in '{state['phrase']}'")
+        return new_state
+
+    metrics.round_trips += 1
+    WEBDRIVER_CALLS.inc(call = 'execute_script')
+    state = browser.execute_script(READ_DIALOG_STATE_SCRIPT)
+    position = shard.start
+    # Words already applied to every row containing them
+    ignored_words = set()
     old_phrase = ''
     old_word = ''
-    while(flag and not no_result.is_displayed()):
-        suggested_word = ''
-        incorrect_phrase = browser.find_element_by_class_name("cell-input").text
-        incorrect_word = browser.find_element_by_id("docs-spellcheckslidingdialog-original-word").text
-        # 3 attempts to overcome "Stale Element" error
-        for _ in range(3):
-            try:
-                suggested_word = browser.find_element_by_class_name("goog-menuitem-content").text
-                break
-            except:
-                continue
+    while not state['done']:
+        incorrect_phrase, incorrect_word, suggested_word = state['phrase'], state['word'], state['suggestion']
 
-        # For unknown error where incorrect_word is empty even when it is seen in UI. Continue the loop to read it correctly
+        # For unknown error where incorrect_word is empty even when it is seen in UI. Wait for it to be filled in
         if incorrect_word == '':
-            time.sleep(1)
+            state = next_state(state)
             continue
 
         # Following case indicates that incorrect_word has already been recorded. Hence pressing "Ignore" in UI AND CONTINUING LOOP
-        if old_phrase == incorrect_phrase and old_word == incorrect_word:
-            if ignore_btn.is_displayed():
-                ignore_btn.click()
+        if (old_phrase == incorrect_phrase and old_word == incorrect_word) or incorrect_word in ignored_words:
+            if state['ignore_visible']:
+                state = next_state(state, 'ignore_all')
                 continue
 
-        incorrect_word_indices = df.index[df[df.columns[1]] == incorrect_phrase].tolist()
-        for i in incorrect_word_indices:
-
-            # Marking incorrect_word
-            if df.at[i, 'INCORRECT WORDS'] == '' and incorrect_word not in config.WHITELIST_WORDS:
-                df.at[i, 'INCORRECT WORDS'] = incorrect_word
-                df.at[i, 'SUGGESTED WORDS'] = suggested_word
-            if incorrect_word not in df.at[i, 'INCORRECT WORDS'] and incorrect_word in df.iloc[i, 1] and incorrect_word not in config.WHITELIST_WORDS:
-                df.at[i, 'INCORRECT WORDS'] = df.at[i, 'INCORRECT WORDS'] + ', ' + incorrect_word
-                df.at[i, 'SUGGESTED WORDS'] = df.at[i, 'SUGGESTED WORDS'] + ', ' + suggested_word
-
-            # Adding description if incorrect_word was not marked because it was present in config.WHITELIST_WORDS
-            if df.at[i, 'DESCRIPTION'] == '' and incorrect_word in config.WHITELIST_WORDS:
-                df.at[i, 'DESCRIPTION'] = incorrect_word + ' found in white-listed words'
-            if df.at[i, 'DESCRIPTION'] != '' and incorrect_word in config.WHITELIST_WORDS:
-                df.at[i, 'DESCRIPTION'] = (df.at[i, 'DESCRIPTION'] + ', ' + incorrect_word + ' found in white-listed words') if incorrect_word not in df.at[i, 'DESCRIPTION'] else df.at[i, 'DESCRIPTION']
-
-        if ignore_btn.is_displayed():
-            ignore_btn.click()
-        else:
-            # Adding sleep to allow spell check to search for next incorrect word
-            time.sleep(1)
+        new_rows = record_misspelling(row_index, row_misspellings, incorrect_phrase, incorrect_word, suggested_word)
+        metrics.record_misspelling()
+        MISSPELLINGS.inc()
+        position = max([position] + [i + 1 for i in row_index.phrase_rows.get(incorrect_phrase, ()) if i < shard.stop])
+        if checkpoint is not None:
+            checkpoint.advance(position)
+        if progress is not None:
+            progress(position, new_rows)
+
+        if not state['ignore_visible']:
+            # Wait for spell check to search for next incorrect word
+            state = next_state(state)
             continue
 
         old_phrase = incorrect_phrase
         old_word = incorrect_word
+        if incorrect_word in row_index.word_codes:
+            ignored_words.add(incorrect_word)
+        state = next_state(state, 'ignore_all')
+
+    if progress is not None:
+        progress(shard.stop, [])
+    return metrics
+
+def run_pooled_google_spell_check(df, pool, progress = None):
+    # Contiguous shards of at least BROWSER_POOL_MIN_SHARD_SIZE rows, one per pooled browser session
+    shard_count = max(1, min(pool.size, len(df) // config.BROWSER_POOL_MIN_SHARD_SIZE))
+    shard_rows = np.array_split(np.arange(len(df)), shard_count)
+
+    def check_shard(rows):
+        shard_progress = partial(progress.update, int(rows[0])) if progress is not None and len(rows) else None
+        with pool.session(timeout = config.BROWSER_POOL_CHECKOUT_TIMEOUT) as session:
+            return run_google_spell_check(df.iloc[rows].reset_index(drop = True), session.browser, session.worksheet_index,
+                                          shard_progress, recover = session.restart)
+
+    if shard_count == 1:
+        results = [check_shard(shard_rows[0])]
+    else:
+        logger.info(f'Checking {len(df)} phrases in {shard_count} shards')
+        with ThreadPoolExecutor(max_workers = shard_count) as executor:
+            results = list(executor.map(traced(check_shard), shard_rows))
+
+    merged = pd.concat([i[0] for i in results], ignore_index = True)
+    for name in ('sheets_api_calls', 'dialog_round_trips', 'dialog_misspellings', 'dialog_seconds'):
+        merged.attrs[name] = sum(i[0].attrs.get(name, 0) for i in results)
+    misspellings = {}
+    for _, shard_misspellings in results:
+        if shard_misspellings is None:
+            misspellings = None
+            break
+        misspellings.update(shard_misspellings)
+    return merged, misspellings
+
+class StreamWorksheets:
+    # Pairs of worksheets which streaming uploads alternate between. They belong to no browser session, so a stream
+    # uploads its next chunk without holding a browser and any pooled session checks it
+
+    def __init__(self, first, streams):
+        self._free = queue.Queue()
+        for i in range(streams):
+            self._free.put((first + 2 * i, first + 2 * i + 1))
+
+    def reserve(self, timeout = None):
+        try:
+            return self._free.get(timeout = timeout)
+        except queue.Empty:
+            raise TimeoutError(f'No streaming worksheets became available within {timeout} seconds')
+
+    def give_back(self, worksheets):
+        self._free.put(worksheets)
+
+@lru_cache()
+def get_stream_worksheets() -> StreamWorksheets:
+    return StreamWorksheets(max(config.BROWSER_POOL_SIZE, 2), config.STREAMING_CONCURRENT_UPLOADS)
+
+class GoogleSheetsBackend:
+    cacheable = True
+
+    def __init__(self, browser = None, pool = None):
+        self.browser = browser
+        self.pool = pool
+        self.stream_worksheets = None
+
+    def upload(self, df, slot = 0):
+        # Fills worksheet slot (0 or 1) ahead of check() so that uploading overlaps with checking the previous chunk.
+        # Pooled uploads go to worksheets of their own, reserved until close(), and only check() takes a session
+        if self.pool is None:
+            return fill_google_sheet(df, slot)
+        if self.stream_worksheets is None:
+            self.stream_worksheets = get_stream_worksheets().reserve(timeout = config.BROWSER_POOL_CHECKOUT_TIMEOUT)
+        return fill_google_sheet(df, self.stream_worksheets[slot])
+
+    def release(self, upload):
+        for shard in upload:
+            get_sheets_session(shard.sheet_name).clear(shard.wks)
+
+    def close(self):
+        if self.stream_worksheets is not None:
+            get_stream_worksheets().give_back(self.stream_worksheets)
+            self.stream_worksheets = None
+
+    def check(self, df, progress = None, upload = None):
+        if upload is not None:
+            if self.pool is None:
+                return run_google_spell_check(df, self.browser, progress = partial(progress.update, 0) if progress else None, shards = upload)
+            with self.pool.session(timeout = config.BROWSER_POOL_CHECKOUT_TIMEOUT) as session:
+                return run_google_spell_check(df, session.browser, progress = partial(progress.update, 0) if progress else None,
+                                              shards = upload, recover = session.restart)
+        if self.pool is not None:
+            return run_pooled_google_spell_check(df, self.pool, progress)
+        return run_google_spell_check(df, self.browser, progress = partial(progress.update, 0) if progress else None)
+
+def get_spell_check_backend(browser = None, pool = None):
+    if config.SPELL_CHECK_BACKEND == 'offline':
+        symspell_index = get_symspell_index()
+        if symspell_index is None:
+            raise RuntimeError(f"Offline spell-check needs the SymSpell dictionary '{config.SYMSPELL_DICTIONARY_PATH}'")
+        return SymSpellBackend(symspell_index)
+    return GoogleSheetsBackend(browser, pool)
+
+class PreparedSpellCheck:
+
+    def __init__(self, df):
+        # Splits df into rows answered from the verdict cache or the dictionary and the distinct phrases
+        # (unique_df, None when there are none) which are left for the spell-check backend
+        df['INCORRECT WORDS'] = '' * len(df)
+        df['SUGGESTED WORDS'] = '' * len(df)
+        df['DESCRIPTION'] = '' * len(df)
+        df.iloc[:, 1] = clean_phrases(df.iloc[:, 1])
+
+        # Rows made up entirely of cached or dictionary tokens never reach Google Sheets
+        with span('cache_lookup'):
+            row_tokens = [split_tokens(i) for i in df.iloc[:, 1]]
+            unique_tokens = set(chain.from_iterable(row_tokens))
+            verdicts = get_verdict_cache().get_many(unique_tokens) if config.VERDICT_CACHE_ENABLED else {}
+        df.attrs['cache_hits'] = len(verdicts)
+        df.attrs['cache_misses'] = len(unique_tokens) - len(verdicts)
+        VERDICT_CACHE_LOOKUPS.inc(df.attrs['cache_hits'], result = 'hit')
+        VERDICT_CACHE_LOOKUPS.inc(df.attrs['cache_misses'], result = 'miss')
+
+        # Tokens made up of dictionary words are known to be correct
+        symspell_index = get_symspell_index()
+        df.attrs['dictionary_hits'] = 0
+        if symspell_index is not None:
+            for token in unique_tokens - verdicts.keys():
+                if symspell_index.is_known(token):
+                    verdicts[token] = Verdict()
+                    df.attrs['dictionary_hits'] += 1
+        self.is_cached = np.array([all(j in verdicts for j in i) for i in row_tokens], dtype = bool)
+
+        if self.is_cached.any():
+            cached_results = [apply_verdicts(row_tokens[i], verdicts) for i in np.flatnonzero(self.is_cached)]
+            df.loc[self.is_cached, RESULT_COLUMNS] = np.array(cached_results, dtype = object)
+
+        self.df = df
+        self.pending_phrases = None
+        self.unique_df = None
+        if not self.is_cached.all():
+            # Only distinct phrases are uploaded; their results are expanded back to every duplicate row
+            self.pending_phrases = df.iloc[:, 1][~self.is_cached]
+            self.unique_df = pd.DataFrame({df.columns[1]: self.pending_phrases.unique()})
+            self.unique_df.insert(0, df.columns[0], range(len(self.unique_df)))
+            logger.info(f'Checking {len(self.unique_df)} distinct phrases out of {len(self.pending_phrases)} uncached rows')
+
+    def progress_tracker(self, progress):
+        if progress is None or self.unique_df is None:
+            return None
+        return SpellCheckProgress(
+            progress,
+            self.pending_phrases.value_counts(sort = False).reindex(self.unique_df.iloc[:, 1]).to_numpy(),
+            processed_rows = int(self.is_cached.sum()),
+            flagged_rows = int((self.df.loc[self.is_cached, 'INCORRECT WORDS'] != '').sum()))
+
+    def finish(self, unique_df = None, misspellings = None, cacheable = False, progress = None):
+        # unique_df and misspellings are the result of checking self.unique_df with the backend
+        df = self.df
+        df.attrs['sheets_api_calls'] = unique_df.attrs.get('sheets_api_calls', 0) if unique_df is not None else 0
+        if unique_df is not None:
+            with span('expand_results'):
+                results = unique_df.set_index(unique_df.columns[1])[RESULT_COLUMNS]
+                df.loc[~self.is_cached, RESULT_COLUMNS] = results.loc[self.pending_phrases].values
+            if config.VERDICT_CACHE_ENABLED and cacheable and misspellings is not None:
+                with span('cache_write'):
+                    get_verdict_cache().set_many(verdicts_from_misspellings(unique_df.iloc[:, 1], misspellings))
 
-    # Reset Sheet
-    wks.clear()
+        df = mark_bad_words_from_file(df)
+        if progress is not None:
+            progress(len(df), int((df['INCORRECT WORDS'] != '').sum()))
+        return df
 
-    return mark_bad_words_from_file(df)
+def run_spell_check(df, browser = None, pool = None, progress = None, backend = None):
+    # backend: SpellCheckBackend used for rows which are neither cached nor in the dictionary. Defaults to the
+    # one selected by config.SPELL_CHECK_BACKEND, driving browser or pool for Google Sheets.
+    # progress: optional callable(rows_processed, misspellings_found) where misspellings_found counts flagged rows.
+    # It is called from the dialog loop, so raising from it aborts the spell-check.
+    backend = backend or get_spell_check_backend(browser, pool)
+    prepared = PreparedSpellCheck(df)
+    unique_df, misspellings = None, None
+    if prepared.unique_df is not None:
+        with span('backend_check'):
+            unique_df, misspellings = backend.check(prepared.unique_df, prepared.progress_tracker(progress))
+    return prepared.finish(unique_df, misspellings, backend.cacheable, progress)
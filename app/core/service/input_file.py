@@ -0,0 +1,185 @@
+import logging
+import math
+import os
+import threading
+from itertools import islice
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.settings import get_app_settings
+
+config = get_app_settings()
+logger = logging.getLogger(__name__)
+
+COLUMNAR_EXTENSIONS = ('.parquet', '.feather', '.arrow')
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+# Text stays in Arrow string buffers instead of one Python object per row
+ARROW_STRINGS = {pa.string(): pd.StringDtype('pyarrow'), pa.large_string(): pd.StringDtype('pyarrow')}
+
+
+def read_input_file(file_path):
+    # First column is the unique identifier and second column is used as input for spell-checking
+    if file_path.lower().endswith(EXCEL_EXTENSIONS) and config.EXCEL_TO_PARQUET:
+        file_path = excel_as_parquet(file_path)
+    if file_path.lower().endswith(COLUMNAR_EXTENSIONS):
+        df = arrow_to_pandas(read_columnar_file(file_path))
+    elif file_path.lower().endswith('.csv'):
+        df = pd.read_csv(file_path)
+    elif file_path.lower().endswith(EXCEL_EXTENSIONS):
+        df = pd.read_excel(file_path)
+    else:
+        with open(file_path, 'r') as f:
+            word_list = [i.strip('\n\r') for i in f.readlines()]
+        df = pd.DataFrame(range(len(word_list)), columns = ['ID'])
+        df['ACTUAL WORDS'] = word_list
+    return df
+
+def iter_input_chunks(file_path, chunk_size, skip_rows = 0):
+    # Same frames as read_input_file, yielded chunk_size rows at a time so that memory does not grow with the file.
+    # The first skip_rows rows are left out, e.g. those already checked by an interrupted job
+    chunks = _iter_input_chunks(file_path, chunk_size)
+    if skip_rows:
+        chunks = _skip_rows(chunks, skip_rows)
+    yield from chunks
+
+def _skip_rows(chunks, rows):
+    for chunk in chunks:
+        if rows >= len(chunk):
+            rows -= len(chunk)
+            continue
+        yield chunk.iloc[rows:].reset_index(drop = True) if rows else chunk
+        rows = 0
+
+def _iter_input_chunks(file_path, chunk_size):
+    if file_path.lower().endswith(EXCEL_EXTENSIONS) and config.EXCEL_TO_PARQUET:
+        file_path = excel_as_parquet(file_path)
+    if file_path.lower().endswith('.parquet'):
+        # Row groups are read one batch at a time from the memory-mapped file
+        parquet_file = pq.ParquetFile(file_path, memory_map = True)
+        for batch in parquet_file.iter_batches(batch_size = chunk_size, columns = input_columns(parquet_file.schema_arrow)):
+            yield arrow_to_pandas(pa.Table.from_batches([batch]))
+    elif file_path.lower().endswith(COLUMNAR_EXTENSIONS):
+        # Record batches are read one at a time, so only the batches making up the current chunk are held in memory
+        pending = None
+        for batch in read_ipc_batches(file_path)[1]:
+            table = pa.Table.from_batches([batch])
+            table = table if pending is None else pa.concat_tables([pending, table])
+            while table.num_rows >= chunk_size:
+                yield arrow_to_pandas(table.slice(0, chunk_size))
+                table = table.slice(chunk_size)
+            pending = table
+        if pending is not None and pending.num_rows:
+            yield arrow_to_pandas(pending)
+    elif file_path.lower().endswith('.csv'):
+        with pd.read_csv(file_path, chunksize = chunk_size) as reader:
+            yield from reader
+    elif file_path.lower().endswith('.xlsx'):
+        yield from _iter_xlsx_chunks(file_path, chunk_size)
+    elif file_path.lower().endswith('.xls'):
+        # xlrd has no streaming mode, so legacy workbooks are read at once and only checked in chunks
+        df = pd.read_excel(file_path)
+        for i in range(0, len(df), chunk_size):
+            yield df.iloc[i : i + chunk_size].reset_index(drop = True)
+    else:
+        with open(file_path, 'r') as f:
+            start = 0
+            while True:
+                word_list = [i.strip('\n\r') for i in islice(f, chunk_size)]
+                if not word_list:
+                    break
+                df = pd.DataFrame(range(start, start + len(word_list)), columns = ['ID'])
+                df['ACTUAL WORDS'] = word_list
+                start += len(word_list)
+                yield df
+
+def _iter_xlsx_chunks(file_path, chunk_size):
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(file_path, read_only = True, data_only = True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only = True)
+        columns = next(rows, None)
+        if columns is None:
+            return
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            yield pd.DataFrame(chunk, columns = columns)
+    finally:
+        workbook.close()
+
+
+def input_columns(schema):
+    # Identifier and text columns, leaving out the index pandas may have stored with the data
+    names = [i for i in schema.names if not i.startswith('__index_level_')]
+    if len(names) < 2:
+        raise ValueError('Input needs an identifier column followed by a text column')
+    return names[:2]
+
+def read_columnar_file(file_path):
+    # Reads only the identifier and text columns of a Parquet or Arrow IPC (Feather v2) file through a memory map
+    if file_path.lower().endswith('.parquet'):
+        parquet_file = pq.ParquetFile(file_path, memory_map = True)
+        return parquet_file.read(columns = input_columns(parquet_file.schema_arrow))
+    schema, batches = read_ipc_batches(file_path)
+    return pa.Table.from_batches(batches, schema)
+
+def read_ipc_batches(file_path):
+    # Schema of the identifier and text columns of an Arrow IPC file or stream, and an iterator over its record batches
+    # reduced to those columns. Uncompressed batches are zero-copy views of the memory map, but Feather v2 files are
+    # LZ4-compressed by default and each batch is then decompressed into memory as it is read
+    source = pa.memory_map(file_path, 'r')
+    try:
+        reader = pa.ipc.open_file(source)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    except pa.ArrowInvalid:
+        source.seek(0)
+        reader = pa.ipc.open_stream(source)
+        batches = iter(reader)
+    columns = input_columns(reader.schema)
+    return pa.schema([reader.schema.field(i) for i in columns]), (i.select(columns) for i in batches)
+
+def arrow_to_pandas(table):
+    return table.to_pandas(types_mapper = ARROW_STRINGS.get)
+
+def excel_as_parquet(file_path):
+    # Parquet copy of an Excel input, converted on first use so that later runs skip parsing the workbook. The copy is
+    # named after the size and modification time of the workbook, re-uploading it converts it again
+    stat = os.stat(file_path)
+    name = f'{os.path.basename(file_path)}.{stat.st_size}.{stat.st_mtime_ns}.parquet'
+    parquet_path = os.path.join(os.path.abspath(config.EXCEL_PARQUET_FOLDER), name)
+    if os.path.exists(parquet_path):
+        return parquet_path
+    os.makedirs(os.path.dirname(parquet_path), exist_ok = True)
+    temporary_path = f'{parquet_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        chunks = _iter_xlsx_chunks(file_path, config.STREAMING_CHUNK_SIZE) if file_path.lower().endswith('.xlsx') else [pd.read_excel(file_path)]
+        write_parquet(chunks, temporary_path)
+        os.replace(temporary_path, parquet_path)
+    except Exception as e:
+        # Inputs which do not fit a Parquet schema, e.g. with identifiers of mixed types, are read from Excel as before
+        logger.warning(f"Could not convert '{file_path}' to Parquet: {e}")
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        return file_path
+    logger.info(f"Converted '{file_path}' to '{parquet_path}'")
+    return parquet_path
+
+def write_parquet(chunks, path):
+    writer = None
+    try:
+        for chunk in chunks:
+            text = [None if i is None or (isinstance(i, float) and math.isnan(i)) else str(i) for i in chunk.iloc[:, 1]]
+            table = pa.table({str(chunk.columns[0]): pa.array(chunk.iloc[:, 0], from_pandas = True),
+                              str(chunk.columns[1]): pa.array(text, type = pa.string())})
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+        if writer is None:
+            raise ValueError('Input is empty')
+    finally:
+        if writer is not None:
+            writer.close()
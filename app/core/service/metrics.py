@@ -0,0 +1,228 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from app.settings import get_app_settings
+
+config = get_app_settings()
+logger = logging.getLogger(__name__)
+
+# Seconds, from a single cached lookup up to a spell-check of a large file
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 180, 600, 1800)
+
+
+def format_labels(label_names, label_values, extra = ()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+
+    def __init__(self, name, description, label_names = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount = 1, **labels):
+        key = tuple(labels[i] for i in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[i] for i in self.label_names), 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f'{self.name}{format_labels(self.label_names, key)} {value}' for key, value in values]
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, description, label_names = (), buckets = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # Label values --> [count per bucket (the last one being +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[i] for i in self.label_names)
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][bucket] += 1
+            counts[1] += value
+
+    def count(self, **labels):
+        counts = self._values.get(tuple(labels[i] for i in self.label_names))
+        return sum(counts[0]) if counts is not None else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = sorted((key, (list(counts[0]), counts[1])) for key, counts in self._values.items())
+        for key, (bucket_counts, total) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{format_labels(self.label_names, key, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.label_names, key)} {total}')
+            lines.append(f'{self.name}_count{format_labels(self.label_names, key)} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, description, label_names = ()):
+        self.metrics.append(Counter(name, description, label_names))
+        return self.metrics[-1]
+
+    def histogram(self, name, description, label_names = (), buckets = DEFAULT_BUCKETS):
+        self.metrics.append(Histogram(name, description, label_names, buckets))
+        return self.metrics[-1]
+
+    def render(self):
+        # Prometheus text exposition format. Every worker process reports its own metrics
+        return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+REQUEST_SECONDS = REGISTRY.histogram('http_request_duration_seconds', 'Latency of HTTP requests by route', ('method', 'route', 'status'))
+STAGE_SECONDS = REGISTRY.histogram('spell_check_stage_seconds', 'Duration of spell-check stages', ('stage',))
+MISSPELLINGS = REGISTRY.counter('spell_check_misspellings_total', 'Misspellings read from the spell-check dialog')
+DIALOG_TIMEOUTS = REGISTRY.counter('spell_check_dialog_timeouts_total', 'Waits for the spell-check dialog which ended without a change')
+WEBDRIVER_CALLS = REGISTRY.counter('webdriver_calls_total', 'WebDriver commands sent to Chrome', ('call',))
+SHEETS_API_CALLS = REGISTRY.counter('sheets_api_calls_total', 'Google Sheets API calls', ('call',))
+SHEETS_RATE_LIMITED = REGISTRY.counter('sheets_api_rate_limited_total', 'Google Sheets API calls answered with a 429', ('credential',))
+SHEETS_QUOTA_WAIT_SECONDS = REGISTRY.counter('sheets_api_quota_wait_seconds_total', 'Time spent waiting for Sheets API quota', ('credential',))
+DIALOG_RECOVERIES = REGISTRY.counter('spell_check_recoveries_total', 'Spell-checks resumed from their checkpoint after a failure', ('reason',))
+VERDICT_CACHE_LOOKUPS = REGISTRY.counter('verdict_cache_lookups_total', 'Distinct tokens looked up in the verdict cache', ('result',))
+
+
+class Trace:
+
+    def __init__(self, name):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage, start, seconds):
+        with self._lock:
+            self.spans.append({'stage': stage, 'start_ms': round(1000 * (start - self.started), 3),
+                               'duration_ms': round(1000 * seconds, 3), 'thread': threading.current_thread().name})
+
+    def dump(self, folder, max_files = None):
+        os.makedirs(folder, exist_ok = True)
+        with open(os.path.join(folder, f'{self.trace_id}.json'), 'w') as f:
+            json.dump({'trace_id': self.trace_id, 'name': self.name, 'duration_ms': round(1000 * (time.perf_counter() - self.started), 3),
+                       'spans': sorted(self.spans, key = lambda k: k['start_ms'])}, f, indent = 2)
+        if max_files is not None:
+            rotate_traces(folder, max_files)
+
+
+def rotate_traces(folder, max_files):
+    # Deletes the oldest traces beyond max_files
+    traces = []
+    for entry in os.scandir(folder):
+        try:
+            if entry.name.endswith('.json'):
+                traces.append((entry.stat().st_mtime, entry.path))
+        except FileNotFoundError:
+            pass
+    for _, path in sorted(traces)[:max(0, len(traces) - max_files)]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Deleted by another worker
+            pass
+
+
+_current_trace = contextvars.ContextVar('trace', default = None)
+
+@contextmanager
+def span(stage):
+    # Times a stage into STAGE_SECONDS and the trace of the current request, if it is being traced
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage = stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, start, seconds)
+
+def traced(function):
+    # Runs function in a copy of the calling context, so that spans of pooled threads join the trace of the request
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(function, *args, **kwargs)
+
+def read_trace(trace_id):
+    path = os.path.join(os.path.abspath(config.TRACES_FOLDER), f'{os.path.basename(trace_id)}.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+async def instrument_request(request, call_next):
+    # Records the latency of every request, until the last chunk of its body has been sent: streamed responses are
+    # still being produced when call_next returns. When TRACES_ENABLED, requests sent with an "X-Trace" header also get
+    # their spans written to TRACES_FOLDER, under the id returned in the "X-Trace-Id" header
+    trace = Trace(f'{request.method} {request.url.path}') if config.TRACES_ENABLED and request.headers.get('x-trace') else None
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+
+    def finish(status):
+        route = request.scope.get('route')
+        REQUEST_SECONDS.observe(time.perf_counter() - start, method = request.method,
+                                route = route.path if route is not None else 'unmatched', status = status)
+        if trace is not None:
+            trace.dump(os.path.abspath(config.TRACES_FOLDER), config.TRACES_MAX_FILES)
+            logger.info(f'Trace {trace.trace_id} of {trace.name}: {len(trace.spans)} spans')
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        finish(500)
+        raise
+    finally:
+        _current_trace.reset(token)
+    if trace is not None:
+        response.headers['X-Trace-Id'] = trace.trace_id
+    body_iterator = response.body_iterator
+
+    async def body():
+        # A body cut short by an error is counted as a server error, although its status line was sent already
+        status = 500
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+            status = response.status_code
+        finally:
+            finish(status)
+    response.body_iterator = body()
+    return response
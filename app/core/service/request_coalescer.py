@@ -0,0 +1,102 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+
+import pandas as pd
+
+from app.core.models.browser import get_browser_pool
+from app.core.service.google_spell_check import run_spell_check
+from app.settings import get_app_settings
+
+config = get_app_settings()
+
+
+class SpellCheckCoalescer:
+
+    def __init__(self, run_batch, window = 0.05, max_batch_size = 500, workers = 1):
+        # run_batch: callable taking a DataFrame of ID and ACTUAL WORDS and returning it spell-checked
+        self.run_batch = run_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._pending_size = 0
+        self._timer = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers = workers, thread_name_prefix = 'spell-check-batch')
+
+    def submit(self, words):
+        future = Future()
+        batch = None
+        with self._lock:
+            self._pending.append((list(words), future))
+            self._pending_size += len(words)
+            if self._pending_size >= self.max_batch_size:
+                batch = self._take_pending()
+            elif self._timer is None:
+                # First request of a batch opens the collection window
+                self._timer = threading.Timer(self.window, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._executor.submit(self._run, batch)
+        return future
+
+    def check(self, words, timeout = None):
+        # Batches run one after the other on each worker, so besides the window a caller waits for the batches queued
+        # ahead of its own. A caller which gives up after timeout seconds is left out of its batch if it has not started
+        future = self.submit(words)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def _flush(self):
+        with self._lock:
+            batch = self._take_pending()
+        if batch:
+            self._executor.submit(self._run, batch)
+
+    def _take_pending(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = self._pending
+        self._pending = []
+        self._pending_size = 0
+        return batch
+
+    def _run(self, batch):
+        # Requests whose caller timed out are dropped, the others can no longer be cancelled
+        batch = [(request_words, future) for request_words, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            words = [word for request_words, _ in batch for word in request_words]
+            df = pd.DataFrame(range(len(words)), columns = ['ID'])
+            df['ACTUAL WORDS'] = words
+            df = self.run_batch(df)
+
+            # Fan the combined result back out to every waiting request
+            start = 0
+            for request_words, future in batch:
+                result = df.iloc[start : start + len(request_words)].reset_index(drop = True)
+                result['ID'] = range(len(request_words))
+                result.attrs = dict(df.attrs, batch_size = len(words))
+                future.set_result(result)
+                start += len(request_words)
+        except Exception as e:
+            # Every caller not answered yet gets the error, none is left waiting
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
+@lru_cache()
+def get_spell_check_coalescer() -> SpellCheckCoalescer:
+    return SpellCheckCoalescer(
+        lambda df: run_spell_check(df, pool = get_browser_pool()),
+        window = config.COALESCE_WINDOW_SECONDS,
+        max_batch_size = config.COALESCE_MAX_BATCH_SIZE,
+        workers = config.BROWSER_POOL_SIZE
+    )
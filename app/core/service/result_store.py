@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from app.core.service.spell_check_results import RESULT_COLUMNS
+from app.core.service.word_lists import get_blacklist, get_whitelist
+from app.settings import get_app_settings
+
+config = get_app_settings()
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT_VERSION = 1
+ROW_HASH_COLUMN = 'ROW HASH'
+
+
+def hash_file(file_path, block_size = 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_rows(df):
+    # Per-row hash of ID and text, stable across processes
+    return pd.util.hash_pandas_object(df.iloc[:, [0, 1]].astype(str), index = False).to_numpy()
+
+def results_signature(blacklist_hash, whitelist_hash, backend):
+    # Results depend on the word lists and on the backend which found the misspellings
+    return hashlib.sha256(f'{STORE_FORMAT_VERSION} {blacklist_hash} {whitelist_hash} {backend}'.encode()).hexdigest()[:16]
+
+
+class ResultStore:
+
+    def __init__(self, folder, signature, max_bytes = None):
+        # Results are kept as Parquet per upload content hash, in a folder per results signature, so that changing
+        # the black-listed or white-listed words or the backend invalidates every stored result. Once the folders of
+        # every signature hold more than max_bytes, the results least recently used are deleted
+        self.root = folder
+        self.folder = os.path.join(folder, signature)
+        self.max_bytes = max_bytes
+        os.makedirs(self.folder, exist_ok = True)
+        self._lock = threading.Lock()
+
+    def _path(self, file_hash):
+        return os.path.join(self.folder, f'{file_hash}.parquet')
+
+    def get(self, file_hash):
+        try:
+            df = pd.read_parquet(self._path(file_hash))
+        except FileNotFoundError:
+            return None
+        # The modification time orders results by their last use for eviction
+        try:
+            os.utime(self._path(file_hash))
+        except OSError:
+            pass
+        return df
+
+    def put(self, file_hash, file_name, df):
+        # df must carry ROW_HASH_COLUMN. Written to a temporary file first so readers never see a partial result
+        temporary_path = f'{self._path(file_hash)}.{os.getpid()}.{threading.get_ident()}.tmp'
+        df.to_parquet(temporary_path, index = False)
+        os.replace(temporary_path, self._path(file_hash))
+        with self._lock:
+            latest = self._latest()
+            latest[file_name] = file_hash
+            with open(os.path.join(self.folder, 'latest.json'), 'w') as f:
+                json.dump(latest, f)
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+
+    def evict(self, max_bytes):
+        # Deletes the least recently used results of every signature until they take at most max_bytes
+        results = []
+        for signature in os.listdir(self.root):
+            folder = os.path.join(self.root, signature)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if name.endswith('.parquet'):
+                    try:
+                        stat = os.stat(os.path.join(folder, name))
+                    except FileNotFoundError:
+                        continue
+                    results.append((stat.st_mtime, stat.st_size, os.path.join(folder, name)))
+        total = sum(size for _, size, _ in results)
+        for _, size, path in sorted(results):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _latest(self):
+        try:
+            with open(os.path.join(self.folder, 'latest.json'), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def previous(self, file_name):
+        # Latest stored result of an upload with the same name, e.g. the export of the previous night
+        with self._lock:
+            file_hash = self._latest().get(file_name)
+        return self.get(file_hash) if file_hash is not None else None
+
+
+def run_incremental_spell_check(df, file_hash, file_name, run, store):
+    # run(df) spell-checks df and returns it with RESULT_COLUMNS. Identical uploads are answered from the store and
+    # rows whose ID and text are unchanged since the previous upload of file_name reuse their stored results.
+    stored = store.get(file_hash)
+    if stored is not None:
+        stored = stored.drop(columns = ROW_HASH_COLUMN)
+        stored.attrs = {'cache_hits': 0, 'cache_misses': 0, 'sheets_api_calls': 0, 'reused_rows': len(stored)}
+        return stored
+
+    row_hashes = hash_rows(df)
+    previous = store.previous(file_name)
+    known = np.zeros(len(df), dtype = bool)
+    if previous is not None:
+        previous_results = previous.drop_duplicates(ROW_HASH_COLUMN).set_index(ROW_HASH_COLUMN)[RESULT_COLUMNS]
+        known = pd.Series(row_hashes).isin(previous_results.index).to_numpy()
+
+    if known.any():
+        logger.info(f'Re-using stored results of {int(known.sum())} unchanged rows out of {len(df)}')
+        changed_df = run(df[~known].reset_index(drop = True)) if not known.all() else None
+        for column in RESULT_COLUMNS:
+            df[column] = ''
+        df.loc[known, RESULT_COLUMNS] = previous_results.loc[row_hashes[known]].to_numpy()
+        attrs = {'cache_hits': 0, 'cache_misses': 0, 'sheets_api_calls': 0}
+        if changed_df is not None:
+            df.loc[~known, RESULT_COLUMNS] = changed_df[RESULT_COLUMNS].to_numpy()
+            attrs.update(changed_df.attrs)
+        df.attrs = attrs
+    else:
+        df = run(df)
+    df.attrs['reused_rows'] = int(known.sum())
+
+    store.put(file_hash, file_name, df.assign(**{ROW_HASH_COLUMN: row_hashes}))
+    return df
+
+
+def get_result_store() -> ResultStore:
+    # Editing the word lists or switching the backend moves on to a new store
+    return _get_result_store(results_signature(get_blacklist().version, get_whitelist().version, config.SPELL_CHECK_BACKEND))
+
+@lru_cache()
+def _get_result_store(signature) -> ResultStore:
+    return ResultStore(os.path.abspath(config.RESULT_STORE_FOLDER), signature, config.RESULT_STORE_MAX_MB * 1024 * 1024)
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from app.core.service.file_lock import FileLock
+from app.core.service.metrics import SHEETS_QUOTA_WAIT_SECONDS, SHEETS_RATE_LIMITED
+from app.settings import get_app_settings
+
+config = get_app_settings()
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    # Holds up to capacity tokens, refilled at rate tokens per second. A request takes one token
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        # Set after a 429, no token is handed out before it
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        # Seconds until a token is available
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now, seconds):
+        self._refill(now)
+        self.tokens = min(self.tokens, 0)
+        self.paused_until = max(self.paused_until, now + seconds)
+
+
+class SheetsQuotaScheduler:
+    # Spreads Sheets API requests over several credentials, each limited by its own token bucket. New connections get
+    # the credential whose next token comes first, and a credential answered with a 429 is paused with an exponential
+    # backoff while the others carry on. With state_path, the buckets are kept in that file, under a lock file, so that
+    # every process using it draws from the same budget. clock must then be shared by the processes, e.g. time.time
+
+    def __init__(self, credentials, requests_per_minute = 60, burst = 10, max_backoff = 64, clock = time.monotonic, sleep = time.sleep,
+                 state_path = None):
+        self.credentials = list(credentials)
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.sleep = sleep
+        self.state_path = state_path
+        self._buckets = {i: TokenBucket(requests_per_minute / 60, burst, clock()) for i in self.credentials}
+        self._failures = {i: 0 for i in self.credentials}
+        self._usage = {i: {'requests': 0, 'rate_limited': 0, 'wait_seconds': 0.0} for i in self.credentials}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        # Buckets and backoffs are read from the state file before every change and written back after it
+        with self._lock:
+            if self.state_path is None:
+                yield
+                return
+            with FileLock(f'{self.state_path}.lock'):
+                self._load_state()
+                try:
+                    yield
+                finally:
+                    self._save_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        for credential in self.credentials:
+            entry = state.get(str(credential))
+            if entry is not None:
+                bucket = self._buckets[credential]
+                bucket.tokens, bucket.updated, bucket.paused_until = entry['tokens'], entry['updated'], entry['paused_until']
+                self._failures[credential] = entry['failures']
+
+    def _save_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            state = {}
+        # Credentials of other processes' configurations are kept
+        for credential in self.credentials:
+            bucket = self._buckets[credential]
+            state[str(credential)] = {'tokens': bucket.tokens, 'updated': bucket.updated, 'paused_until': bucket.paused_until,
+                                      'failures': self._failures[credential]}
+        temporary_path = f'{self.state_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary_path, self.state_path)
+
+    def choose(self):
+        with self._locked():
+            now = self.clock()
+            return min(self.credentials, key = lambda k: (self._buckets[k].delay(now), self._usage[k]['requests']))
+
+    def acquire(self, credential):
+        # Blocks until credential may send a request, returns the seconds waited
+        waited = 0.0
+        while True:
+            with self._locked():
+                now = self.clock()
+                delay = self._buckets[credential].delay(now)
+                if delay <= 0:
+                    self._buckets[credential].take(now)
+                    self._usage[credential]['requests'] += 1
+                    self._usage[credential]['wait_seconds'] += waited
+                    break
+            self.sleep(delay)
+            waited += delay
+        if waited:
+            SHEETS_QUOTA_WAIT_SECONDS.inc(waited, credential = credential_name(credential))
+        return waited
+
+    def rate_limited(self, credential, retry_after = None):
+        # Pauses credential for Retry-After seconds if Google sent it, otherwise for 1, 2, 4 ... seconds with jitter
+        with self._locked():
+            self._failures[credential] += 1
+            self._usage[credential]['rate_limited'] += 1
+            backoff = retry_after if retry_after is not None else \
+                min(self.max_backoff, 2 ** (self._failures[credential] - 1)) * random.uniform(0.5, 1)
+            self._buckets[credential].pause(self.clock(), backoff)
+        SHEETS_RATE_LIMITED.inc(credential = credential_name(credential))
+        logger.warning(f'Sheets API quota of {credential_name(credential)} exceeded, pausing it for {backoff:.1f} seconds')
+        return backoff
+
+    def succeeded(self, credential):
+        with self._locked():
+            self._failures[credential] = 0
+
+    def usage(self):
+        with self._locked():
+            now = self.clock()
+            return [dict(self._usage[i], credential = credential_name(i), requests_per_minute = self._buckets[i].rate * 60,
+                         available_tokens = round(self._buckets[i].tokens if self._buckets[i].delay(now) <= 0 else 0, 3),
+                         paused_seconds = round(max(0.0, self._buckets[i].paused_until - now), 3),
+                         wait_seconds = round(self._usage[i]['wait_seconds'], 3))
+                    for i in self.credentials]
+
+
+def credential_name(credential):
+    # File name of a service account key, the key itself is never reported
+    return os.path.basename(credential) if credential else config.CREDENTIALS_ENV_VAR
+
+def sheets_credentials():
+    # Service account files which exist, or None for the one in CREDENTIALS_ENV_VAR
+    paths = [i for i in dict.fromkeys([config.CREDENTIALS_JSON_PATH] + config.SHEETS_CREDENTIALS_PATHS) if os.path.exists(i)]
+    return paths or [None]
+
+def is_rate_limited(e):
+    # googleapiclient.errors.HttpError keeps the response, a dict of its headers and status, in resp
+    resp = getattr(e, 'resp', None)
+    status = getattr(e, 'status_code', None) or getattr(resp, 'status', None) or (resp.get('status') if isinstance(resp, dict) else None)
+    return str(status) == '429'
+
+def retry_after(e):
+    try:
+        return float(getattr(e, 'resp', {}).get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+@lru_cache()
+def get_sheets_quota_scheduler() -> SheetsQuotaScheduler:
+    # Shared by the Sheets sessions of every spreadsheet, quota is counted per credential. Google counts it across the
+    # worker processes too, which draw from the state file or, without one, from an equal share each
+    if config.SHEETS_QUOTA_STATE_PATH:
+        return SheetsQuotaScheduler(sheets_credentials(), config.SHEETS_REQUESTS_PER_MINUTE, config.SHEETS_REQUEST_BURST,
+                                    config.SHEETS_BACKOFF_MAX_SECONDS, clock = time.time,
+                                    state_path = os.path.abspath(config.SHEETS_QUOTA_STATE_PATH))
+    workers = max(1, int(config.FAST_API_WORKERS))
+    return SheetsQuotaScheduler(sheets_credentials(), config.SHEETS_REQUESTS_PER_MINUTE / workers,
+                                max(1, config.SHEETS_REQUEST_BURST // workers), config.SHEETS_BACKOFF_MAX_SECONDS)
@@ -0,0 +1,168 @@
+import itertools
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache, partial
+
+import pygsheets
+
+from app.core.service.metrics import SHEETS_API_CALLS
+from app.core.service.sheets_quota import get_sheets_quota_scheduler, is_rate_limited, retry_after
+from app.settings import get_app_settings
+
+config = get_app_settings()
+
+# Rows written per worksheet column; longer payloads continue in the next column
+COLUMN_ROWS = 191000
+# Calls made to Google's OAuth endpoints, which do not use Sheets API quota
+UNMETERED_CALLS = ('authorize', 'refresh')
+
+
+def authorize(credential = None):
+    # check = False raises a 429 to the Sheets session, which backs off, instead of pygsheets sleeping 100 seconds
+    if credential is None and os.path.exists(config.CREDENTIALS_JSON_PATH):
+        credential = config.CREDENTIALS_JSON_PATH
+    if credential is not None:
+        return pygsheets.authorize(service_file = credential, check = False)
+    return pygsheets.authorize(service_account_env_var = config.CREDENTIALS_ENV_VAR, check = False)
+
+
+class SheetsConnection:
+    # An authorized client with the spreadsheet and worksheet handles opened through it
+
+    def __init__(self, client, credential = None):
+        self.client = client
+        self.credential = credential
+        self.spreadsheet = None
+        self.worksheets = {}
+
+
+class SheetsSession:
+
+    def __init__(self, sheet_name, authorize = authorize, max_cells_per_write = 200000, scheduler = None):
+        # Clients are not thread-safe, so concurrent uploads each use their own connection. Connections are kept
+        # for the life of the process instead of re-authorizing and re-opening the spreadsheet on every call.
+        # scheduler: SheetsQuotaScheduler choosing the credential of every connection and pacing its calls
+        self.sheet_name = sheet_name
+        self.authorize = authorize
+        self.max_cells_per_write = max_cells_per_write
+        self.scheduler = scheduler
+        self.api_calls = Counter()
+        self._idle = []
+        # Worksheet index --> (rows, columns) holding values which have not been cleared yet
+        self._written = {}
+        # id() of a worksheet handle --> credential of the connection it was opened through
+        self._worksheet_credentials = {}
+        self._lock = threading.Lock()
+
+    def _call(self, calls, credential, name, function, *args, **kwargs):
+        for attempt in itertools.count():
+            if self.scheduler is not None and name not in UNMETERED_CALLS:
+                self.scheduler.acquire(credential)
+            try:
+                result = function(*args, **kwargs)
+                break
+            except Exception as e:
+                if self.scheduler is None or not is_rate_limited(e):
+                    raise
+                self.scheduler.rate_limited(credential, retry_after(e))
+                if attempt >= config.SHEETS_RATE_LIMIT_RETRIES:
+                    raise
+        if self.scheduler is not None:
+            self.scheduler.succeeded(credential)
+        SHEETS_API_CALLS.inc(call = name)
+        with self._lock:
+            self.api_calls[name] += 1
+        if calls is not None:
+            calls[name] += 1
+        return result
+
+    @contextmanager
+    def connection(self, calls = None):
+        # Calls are spread over the credentials by handing out a connection of the one with quota left soonest
+        credential = self.scheduler.choose() if self.scheduler is not None else None
+        with self._lock:
+            connection = next((i for i in reversed(self._idle) if i.credential == credential), None)
+            if connection is not None:
+                self._idle.remove(connection)
+        if connection is None:
+            authorize = self.authorize if credential is None else partial(self.authorize, credential)
+            connection = SheetsConnection(self._call(calls, credential, 'authorize', authorize), credential)
+        else:
+            self._refresh(connection, calls)
+        yield connection
+        # A connection whose calls failed may hold a revoked token or stale handles, so it is not reused
+        with self._lock:
+            self._idle.append(connection)
+
+    def _refresh(self, connection, calls):
+        credentials = getattr(connection.client, 'oauth', None)
+        if credentials is not None and credentials.token is not None and credentials.expired:
+            from google.auth.transport.requests import Request
+            self._call(calls, connection.credential, 'refresh', credentials.refresh, Request())
+
+    def worksheet(self, connection, index, calls = None):
+        if index in connection.worksheets:
+            return connection.worksheets[index]
+        if connection.spreadsheet is None:
+            connection.spreadsheet = self._call(calls, connection.credential, 'open', connection.client.open, self.sheet_name)
+        with self._lock:
+            first_use = index not in self._written
+            self._written.setdefault(index, None)
+        # Worksheets may have been added through another connection since the spreadsheet was opened
+        if len(connection.spreadsheet.worksheets()) <= index:
+            self._call(calls, connection.credential, 'fetch', connection.spreadsheet.fetch_properties)
+        while len(connection.spreadsheet.worksheets()) <= index:
+            title = f'{self.sheet_name} {len(connection.spreadsheet.worksheets())}'
+            self._call(calls, connection.credential, 'add_worksheet', connection.spreadsheet.add_worksheet, title)
+        wks = connection.spreadsheet.worksheets()[index]
+        if first_use:
+            # Whatever an earlier process left behind is unknown, so the worksheet is cleared completely once
+            self._call(calls, connection.credential, 'clear', wks.clear)
+        connection.worksheets[index] = wks
+        with self._lock:
+            self._worksheet_credentials[id(wks)] = connection.credential
+        return wks
+
+    def fill(self, df, worksheet_index = 0, calls = None):
+        # Writes the second column of df in columns of COLUMN_ROWS rows below a header, in as few calls as possible
+        with self.connection(calls) as connection:
+            wks = self.worksheet(connection, worksheet_index, calls)
+            values = df.iloc[:, 1].astype(str).tolist()
+            columns = [[str(df.columns[1])] + values[i : i + COLUMN_ROWS] for i in range(0, max(len(values), 1), COLUMN_ROWS)]
+            rows = max(len(i) for i in columns)
+
+            # Rows beyond the new payload are dropped by the resize and columns beyond it are cleared
+            with self._lock:
+                written = self._written.get(worksheet_index)
+            if written is not None and written[1] > len(columns):
+                self._call(calls, connection.credential, 'clear', wks.clear, (1, len(columns) + 1), written)
+            # The sheet is sized to the payload, a spell-check never scans an empty grid
+            if wks.rows != rows or wks.cols < len(columns):
+                self._call(calls, connection.credential, 'resize', wks.resize, rows, max(wks.cols, len(columns)))
+
+            columns_per_write = max(1, self.max_cells_per_write // rows)
+            for i in range(0, len(columns), columns_per_write):
+                self._call(calls, connection.credential, 'update_values', wks.update_values, (1, i + 1), columns[i : i + columns_per_write], majordim = 'COLUMNS')
+            with self._lock:
+                self._written[worksheet_index] = (rows, len(columns))
+            return wks
+
+    def clear(self, wks, calls = None):
+        # Clears only the range written by fill()
+        with self._lock:
+            written = self._written.get(wks.index)
+            self._written[wks.index] = None
+            credential = self._worksheet_credentials.get(id(wks))
+        if written is not None:
+            self._call(calls, credential, 'clear', wks.clear, 'A1', written)
+
+
+def get_sheets_session(sheet_name = None) -> SheetsSession:
+    return _get_sheets_session(sheet_name or config.SHEET_NAME)
+
+@lru_cache()
+def _get_sheets_session(sheet_name) -> SheetsSession:
+    # One session per spreadsheet, shared by every request of the process
+    return SheetsSession(sheet_name, max_cells_per_write = config.SHEETS_MAX_CELLS_PER_WRITE, scheduler = get_sheets_quota_scheduler())
@@ -0,0 +1,83 @@
+import time
+from typing import Dict, Iterable, List, Optional, Protocol, Tuple, Union
+
+import pandas as pd
+
+from app.core.service.spell_check_results import RowIndex, record_misspelling, write_results
+from app.core.service.verdict_cache import normalize_token, split_tokens
+
+
+class SpellCheckBackend(Protocol):
+    # Whether verdicts found by this backend may be stored in the verdict cache
+    cacheable: bool
+
+    def check(self, df: pd.DataFrame, progress = None) -> Tuple[pd.DataFrame, Optional[Dict[str, List[Tuple[str, str]]]]]:
+        # df holds distinct phrases in its second column. Returns df with RESULT_COLUMNS filled in and the
+        # misspelled (word, suggestion) pairs of every phrase, or None when the check did not run to the end.
+        # progress is an optional SpellCheckProgress to be updated as misspellings are found.
+        ...
+
+
+class SymSpellBackend:
+    cacheable = False
+
+    def __init__(self, index):
+        self.index = index
+
+    def check(self, df, progress = None):
+        phrases = df.iloc[:, 1].tolist()
+        row_index = RowIndex(phrases)
+        row_misspellings = {}
+        suggestions = {}
+        for position, phrase in enumerate(phrases):
+            for token in split_tokens(phrase):
+                for word in self.index.unknown_words(token):
+                    # Every row containing the word was marked when it was first seen
+                    if word in suggestions:
+                        continue
+                    suggestions[word] = self.index.suggest(word)
+                    new_rows = record_misspelling(row_index, row_misspellings, phrase, word, suggestions[word])
+                    if progress is not None:
+                        progress.update(0, position + 1, new_rows)
+        if progress is not None:
+            progress.update(0, len(phrases), [])
+        return write_results(df, phrases, row_misspellings)
+
+
+class FakeSpellCheckBackend:
+    # Deterministic in-process stand-in for Google Sheets, used for tests and benchmarks
+    cacheable = False
+
+    def __init__(self, misspelled_words: Union[Dict[str, str], Iterable[str]], latency = 0.0, misspelling_latency = 0.0):
+        # misspelled_words: words to flag, optionally mapped to their suggestion.
+        # latency is spent once per check (upload and navigation) and misspelling_latency once per flagged word.
+        self.misspelled_words = dict(misspelled_words) if isinstance(misspelled_words, dict) else {i: '' for i in misspelled_words}
+        self.latency = latency
+        self.misspelling_latency = misspelling_latency
+        self.checked_phrases = 0
+        self.checks = 0
+
+    def check(self, df, progress = None):
+        self.checks += 1
+        self.checked_phrases += len(df)
+        if self.latency:
+            time.sleep(self.latency)
+        phrases = df.iloc[:, 1].tolist()
+        row_index = RowIndex(phrases)
+        row_misspellings = {}
+        # Like the dialog with "Ignore all", every misspelled word stops the check once
+        recorded = set()
+        for position, phrase in enumerate(phrases):
+            for token in phrase.split():
+                word = normalize_token(token)
+                if word not in self.misspelled_words or word in recorded:
+                    continue
+                recorded.add(word)
+                if self.misspelling_latency:
+                    time.sleep(self.misspelling_latency)
+                new_rows = record_misspelling(row_index, row_misspellings, phrase, word, self.misspelled_words[word])
+                if progress is not None:
+                    progress.update(0, position + 1, new_rows)
+        if progress is not None:
+            progress.update(0, len(phrases), [])
+        return write_results(df, phrases, row_misspellings)
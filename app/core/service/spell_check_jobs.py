@@ -0,0 +1,266 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+
+from app.core.models.browser import get_browser_pool
+from app.core.schema.spell_check_job_schema import JobStatus, SpellCheckJob
+from app.core.service.input_file import iter_input_chunks
+from app.core.service.streaming_spell_check import run_streaming_spell_check
+from app.core.service.worker_lease import process_alive
+from app.settings import get_app_settings
+
+config = get_app_settings()
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+ACTIVE_STATUSES = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class InMemoryJobStore:
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, file_name):
+        now = time.time()
+        job = SpellCheckJob(job_id = uuid.uuid4().hex, file_name = file_name, owner_pid = os.getpid(), created_at = now, updated_at = now)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        return job.copy()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job.copy() if job is not None else None
+
+    def update(self, job_id, expected = None, **changes):
+        # expected: statuses the job must be in for the changes to apply, otherwise None is returned
+        with self._lock:
+            if expected is not None and self._jobs[job_id].status not in expected:
+                return None
+            job = self._jobs[job_id].copy(update = dict(changes, updated_at = time.time()))
+            self._jobs[job_id] = job
+        return job.copy()
+
+
+class SqliteJobStore:
+
+    def __init__(self, db_path):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok = True)
+        self._connection = sqlite3.connect(db_path, check_same_thread = False, isolation_level = None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, job TEXT)')
+        self._lock = threading.Lock()
+
+    def create(self, file_name):
+        now = time.time()
+        job = SpellCheckJob(job_id = uuid.uuid4().hex, file_name = file_name, owner_pid = os.getpid(), created_at = now, updated_at = now)
+        with self._lock:
+            self._connection.execute('INSERT INTO jobs VALUES (?, ?)', (job.job_id, job.json()))
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connection.execute('SELECT job FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return SpellCheckJob.parse_raw(row[0]) if row is not None else None
+
+    def update(self, job_id, expected = None, **changes):
+        # expected: statuses the job must be in for the changes to apply, otherwise None is returned
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._connection.execute('SELECT job FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+                job = SpellCheckJob.parse_raw(row[0])
+                if expected is not None and job.status not in expected:
+                    self._connection.execute('ROLLBACK')
+                    return None
+                job = job.copy(update = dict(changes, updated_at = time.time()))
+                self._connection.execute('UPDATE jobs SET job = ? WHERE job_id = ?', (job.json(), job_id))
+                self._connection.execute('COMMIT')
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+        return job
+
+
+def owner_gone(job):
+    # Whether the process owning an active job exited, or stopped sending heartbeats while running it
+    if job.owner_pid is not None and not process_alive(job.owner_pid):
+        return True
+    return job.status == JobStatus.RUNNING and job.heartbeat_at is not None and time.time() - job.heartbeat_at > config.JOB_STALE_SECONDS
+
+@contextmanager
+def heartbeat(store, job_id):
+    # Refreshes heartbeat_at of a running job every JOB_HEARTBEAT_SECONDS, as long as the block runs
+    stopped = threading.Event()
+
+    def beat():
+        while not stopped.wait(config.JOB_HEARTBEAT_SECONDS):
+            store.update(job_id, expected = (JobStatus.RUNNING,), heartbeat_at = time.time())
+
+    thread = threading.Thread(target = beat, daemon = True, name = f'spell-check-job-heartbeat-{job_id}')
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+def run_spell_check_job(store, job_id):
+    # Status changes only apply from the expected status, so a job cancelled meanwhile stays cancelled
+    if store.update(job_id, expected = (JobStatus.QUEUED,), status = JobStatus.RUNNING, owner_pid = os.getpid(), heartbeat_at = time.time()) is None:
+        return
+    with heartbeat(store, job_id):
+        run_until_finished(store, job_id)
+
+def run_until_finished(store, job_id):
+    result_file = os.path.join(os.path.abspath(config.RESULTS_FOLDER), f'{job_id}.csv')
+    failures = 0
+    while True:
+        job = store.get(job_id)
+        try:
+            totals = run_job_from_checkpoint(store, job, result_file)
+            store.update(job_id, expected = (JobStatus.RUNNING,), status = JobStatus.COMPLETED,
+                         rows_total = job.checkpoint_rows + totals['rows'], result_file = result_file)
+            return
+        except JobCancelled:
+            logger.info(f"Spell-check job '{job_id}' cancelled")
+            return
+        except Exception as e:
+            if store.get(job_id).status == JobStatus.CANCELLED:
+                return
+            # Chunks written since the last attempt count as progress, a job failing without any gives up sooner
+            failures = 1 if store.get(job_id).checkpoint_rows > job.checkpoint_rows else failures + 1
+            if failures > config.JOB_MAX_RESUMES:
+                logger.error(f"Spell-check job '{job_id}' failed due to exception: '{e}'")
+                store.update(job_id, expected = (JobStatus.RUNNING,), status = JobStatus.FAILED, error = str(e))
+                return
+            job = store.update(job_id, resumes = store.get(job_id).resumes + 1)
+            logger.warning(f"Spell-check job '{job_id}' resuming from row {job.checkpoint_rows} after exception: '{e}'")
+
+def run_job_from_checkpoint(store, job, result_file):
+    # Rows past the checkpoint are read and checked, their results appended to what the result file held at the checkpoint
+    job_id, checkpoint = job.job_id, {'rows': job.checkpoint_rows, 'misspellings': job.checkpoint_misspellings}
+    if job.checkpoint_rows and os.path.exists(result_file):
+        with open(result_file, 'r+b') as f:
+            f.truncate(job.checkpoint_bytes)
+    elif os.path.exists(result_file):
+        os.remove(result_file)
+    # The input is streamed in chunks, so the total number of rows is only known once it has been read
+    chunks = iter_input_chunks(os.path.join(config.UPLOAD_FOLDER, job.file_name), config.STREAMING_CHUNK_SIZE, skip_rows = job.checkpoint_rows)
+
+    def check_cancelled():
+        if store.get(job_id).status == JobStatus.CANCELLED:
+            raise JobCancelled()
+
+    reported_at = None
+
+    def progress(rows_processed, misspellings_found):
+        # Called for every misspelling, so the store is read and written at most every JOB_PROGRESS_INTERVAL_SECONDS
+        nonlocal reported_at
+        now = time.monotonic()
+        if reported_at is not None and now - reported_at < config.JOB_PROGRESS_INTERVAL_SECONDS:
+            return
+        reported_at = now
+        check_cancelled()
+        store.update(job_id, rows_processed = job.checkpoint_rows + rows_processed,
+                     misspellings_found = job.checkpoint_misspellings + misspellings_found)
+
+    def on_chunk(df):
+        # Called once the chunk has been appended to the result file, which is when the progress is exact
+        checkpoint['rows'] += len(df)
+        checkpoint['misspellings'] += int((df['INCORRECT WORDS'] != '').sum())
+        store.update(job_id, checkpoint_rows = checkpoint['rows'], checkpoint_misspellings = checkpoint['misspellings'],
+                     checkpoint_bytes = os.path.getsize(result_file), rows_processed = checkpoint['rows'],
+                     misspellings_found = checkpoint['misspellings'])
+
+    return run_streaming_spell_check(chunks, result_file, pool = get_browser_pool(), progress = progress, on_chunk = on_chunk, append = True,
+                                     check_cancelled = check_cancelled)
+
+
+class SpellCheckJobQueue:
+
+    def __init__(self, store, workers = 1, max_size = 16, runner = run_spell_check_job):
+        self.store = store
+        self.workers = workers
+        self.runner = runner
+        self._queue = queue.Queue(maxsize = max_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, file_name):
+        # Raises queue.Full when max_size jobs are already waiting
+        self._start_workers()
+        job = self.store.create(file_name)
+        try:
+            self._queue.put_nowait(job.job_id)
+        except queue.Full:
+            self.store.update(job.job_id, status = JobStatus.FAILED, error = 'Job queue is full')
+            raise
+        return job
+
+    def resume(self, job_id):
+        # Requeues a failed job, or an active one whose owner process is gone, from its checkpoint.
+        # Returns None for jobs which cannot be resumed
+        job = self.store.get(job_id)
+        orphaned = job.status in ACTIVE_STATUSES and owner_gone(job)
+        if job.status != JobStatus.FAILED and not orphaned:
+            return None
+        self._start_workers()
+        previous = job
+        # Only applies if the job did not change meanwhile, e.g. another request resumed it first
+        job = self.store.update(job_id, expected = (previous.status,), status = JobStatus.QUEUED, error = None,
+                                owner_pid = os.getpid(), heartbeat_at = None)
+        if job is None:
+            return None
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            self.store.update(job_id, status = previous.status, error = previous.error, owner_pid = previous.owner_pid,
+                              heartbeat_at = previous.heartbeat_at)
+            raise
+        return job
+
+    def cancel(self, job_id):
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        # Queued jobs are skipped by the workers and running jobs stop before their next upload or check, or at their
+        # next progress update. Finished jobs are returned unchanged
+        return self.store.update(job_id, expected = ACTIVE_STATUSES, status = JobStatus.CANCELLED) or self.store.get(job_id)
+
+    def _start_workers(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target = self._work, daemon = True, name = f'spell-check-job-{len(self._threads)}')
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self.runner(self.store, job_id)
+            finally:
+                self._queue.task_done()
+
+
+@lru_cache()
+def get_job_queue() -> SpellCheckJobQueue:
+    if config.JOB_STORE == 'sqlite':
+        store = SqliteJobStore(os.path.abspath(config.JOB_STORE_PATH))
+    else:
+        store = InMemoryJobStore()
+    return SpellCheckJobQueue(store, workers = config.JOB_WORKERS, max_size = config.JOB_QUEUE_SIZE)
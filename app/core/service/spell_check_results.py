@@ -0,0 +1,145 @@
+import re
+import threading
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from app.core.service.verdict_cache import Verdict, normalize_token, split_tokens
+from app.core.service.word_lists import get_whitelist
+
+RESULT_COLUMNS = ['INCORRECT WORDS', 'SUGGESTED WORDS', 'DESCRIPTION']
+# Separates the words Sheets reports from a cell, e.g. "knwon" in "well-knwon"
+WORD_SEPARATOR = r"[^\w']+"
+
+
+def format_misspellings(misspellings):
+    incorrect_words, suggested_words, description = [], [], []
+    whitelist = get_whitelist()
+    for incorrect_word, suggested_word in misspellings:
+        # Adding description instead of marking incorrect_word if it is present in the white-listed words
+        if whitelist.matches(incorrect_word):
+            if incorrect_word + ' found in white-listed words' not in description:
+                description.append(incorrect_word + ' found in white-listed words')
+        elif incorrect_word not in incorrect_words:
+            incorrect_words.append(incorrect_word)
+            suggested_words.append(suggested_word)
+    return ', '.join(incorrect_words), ', '.join(suggested_words), ', '.join(description)
+
+def apply_verdicts(tokens, verdicts):
+    return format_misspellings(chain.from_iterable(
+        zip(verdicts[i].incorrect_words, verdicts[i].suggested_words) for i in tokens))
+
+def build_phrase_index(phrases):
+    # Phrase --> row positions, built once so every misspelling is a dict lookup instead of a column scan
+    phrase_rows = {}
+    for i, phrase in enumerate(phrases):
+        phrase_rows.setdefault(phrase, []).append(i)
+    for phrase, rows in list(phrase_rows.items()):
+        # Sheets trims surrounding whitespace of the cell shown in the spell-check dialog
+        if phrase.strip() != phrase:
+            phrase_rows.setdefault(phrase.strip(), []).extend(rows)
+    return phrase_rows
+
+class RowIndex:
+
+    def __init__(self, phrases):
+        # Phrase --> row positions, and word --> row positions of the phrases containing it (posting lists), built once
+        # over the input so that a misspelling found in one row is applied to every row containing the same word
+        self.phrases = phrases
+        self.phrase_rows = build_phrase_index(phrases)
+        words = pd.Series(phrases, dtype = object).astype(str).str.split(WORD_SEPARATOR, regex = True).explode()
+        words = words[words.notna() & (words != '')]
+        codes, uniques = pd.factorize(words)
+        # A word repeated within a phrase is posted once; postings end up sorted by word and then by row
+        keys = np.unique(codes.astype(np.int64) * max(len(phrases), 1) + words.index.to_numpy())
+        self.word_codes = {word: code for code, word in enumerate(uniques.tolist())}
+        self.posting_rows = keys % max(len(phrases), 1)
+        self.posting_starts = np.searchsorted(keys // max(len(phrases), 1), np.arange(len(uniques) + 1))
+
+    def word_rows(self, word):
+        # Returns None for words which are not one of the indexed words
+        code = self.word_codes.get(word)
+        if code is None:
+            return None
+        return self.posting_rows[self.posting_starts[code] : self.posting_starts[code + 1]].tolist()
+
+def record_misspelling(row_index, row_misspellings, incorrect_phrase, incorrect_word, suggested_word):
+    # Applies the misspelling to every row containing incorrect_word ("Ignore all"). Falls back to the rows of the
+    # dialog cell when Sheets reports a word which is not one of the indexed words. Returns the rows which got their first misspelling
+    rows = row_index.word_rows(incorrect_word)
+    if rows is None:
+        rows = [i for i in row_index.phrase_rows.get(incorrect_phrase, ()) if incorrect_word in row_index.phrases[i]]
+    new_rows = []
+    for i in rows:
+        pairs = row_misspellings.get(i)
+        if pairs is None:
+            new_rows.append(i)
+            pairs = row_misspellings[i] = []
+        if (incorrect_word, suggested_word) not in pairs:
+            pairs.append((incorrect_word, suggested_word))
+    return new_rows
+
+def verdicts_from_misspellings(phrases, misspellings):
+    # A token is correct unless Google flagged it, or a part of it (e.g. "knwon" in "well-knwon"), in its phrase
+    verdicts = {}
+    for phrase in phrases:
+        flagged = misspellings.get(phrase, [])
+        for token in split_tokens(phrase):
+            parts = set(re.split(WORD_SEPARATOR, token)) | {token}
+            matches = [(i, j) for i, j in flagged if normalize_token(i) in parts]
+            verdicts[token] = Verdict(tuple(i for i, _ in matches), tuple(j for _, j in matches))
+    return verdicts
+
+class SpellCheckProgress:
+
+    def __init__(self, callback, row_counts, processed_rows = 0, flagged_rows = 0):
+        # row_counts: number of input rows behind every row uploaded to the sheet
+        self.callback = callback
+        self.row_counts = np.asarray(row_counts)
+        self.cumulative_counts = np.concatenate([[0], np.cumsum(self.row_counts)])
+        self.processed_rows = processed_rows
+        self.flagged_rows = flagged_rows
+        self.positions = {}
+        self._lock = threading.Lock()
+
+    def update(self, offset, position, new_rows):
+        # offset: first sheet row of the shard, position: sheet rows of the shard done so far
+        with self._lock:
+            self.positions[offset] = position
+            self.flagged_rows += int(self.row_counts[[offset + i for i in new_rows]].sum())
+            processed_rows = self.processed_rows + int(sum(self.cumulative_counts[offset + j] - self.cumulative_counts[offset] for offset, j in self.positions.items()))
+            flagged_rows = self.flagged_rows
+        self.callback(processed_rows, flagged_rows)
+
+def write_results(df, phrases, row_misspellings):
+    # Writes the collected misspellings to df in one go and returns them keyed by phrase for the verdict cache
+    # Misspellings fanned out from other rows are listed in the order they appear in the phrase
+    results = [format_misspellings(sorted(row_misspellings.get(i, ()), key = lambda k: phrases[i].find(k[0]))) for i in range(len(phrases))]
+    df[RESULT_COLUMNS] = pd.DataFrame(results, columns = RESULT_COLUMNS, index = df.index)
+    return df, {phrases[i]: pairs for i, pairs in row_misspellings.items() if pairs}
+
+def build_incorrect_words(df, include_incorrect_word = True):
+    # Keyed by phrase, so duplicate phrases collapse into one entry. The streaming formats are keyed by ID instead
+    df = df[df['INCORRECT WORDS'] != '']
+    columns, keys = RESULT_COLUMNS, ['incorrect_word', 'suggested_word', 'description']
+    if not include_incorrect_word:
+        columns, keys = columns[1:], keys[1:]
+    results = zip(*(df[i].tolist() for i in columns))
+    return dict(zip(df.iloc[:, 1].tolist(), (dict(zip(keys, i)) for i in results)))
+
+def format_result_rows(df, result_format, header = False):
+    # NDJSON lines or CSV rows of the flagged rows of df, keyed by the ID in its first column
+    df = df[df['INCORRECT WORDS'] != '']
+    if result_format == 'csv':
+        return df.iloc[:, [0, 1]].join(df[RESULT_COLUMNS]).to_csv(index = False, header = header)
+    if len(df) == 0:
+        return ''
+    records = pd.DataFrame({
+        'id': df.iloc[:, 0],
+        'actual_words': df.iloc[:, 1],
+        'incorrect_word': df['INCORRECT WORDS'],
+        'suggested_word': df['SUGGESTED WORDS'],
+        'description': df['DESCRIPTION']
+    })
+    return records.to_json(orient = 'records', lines = True, force_ascii = False).rstrip('\n') + '\n'
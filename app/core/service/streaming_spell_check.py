@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import queue
+import threading
+
+from app.core.service.google_spell_check import PreparedSpellCheck, get_spell_check_backend
+from app.core.service.metrics import span, traced
+from app.core.service.spell_check_results import RESULT_COLUMNS, format_result_rows
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the chunks handed from one stage to the next
+END_OF_CHUNKS = None
+
+
+def _put(chunk_queue, item, stop):
+    # Bounded queues block producers, but a failed stage must not leave its neighbours blocked forever
+    while not stop.is_set():
+        try:
+            chunk_queue.put(item, timeout = 0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(chunk_queue, stop):
+    while not stop.is_set():
+        try:
+            return chunk_queue.get(timeout = 0.1)
+        except queue.Empty:
+            continue
+    return END_OF_CHUNKS
+
+def run_streaming_spell_check(chunks, result_file = None, browser = None, pool = None, progress = None, backend = None, on_chunk = None, append = False,
+                              check_cancelled = None):
+    # Spell-checks an iterable of DataFrame chunks as a pipeline of three stages connected by queues of one chunk:
+    #   reader: reads chunk k+1, looks it up in the verdict cache and dictionary and uploads its distinct phrases
+    #   checker (calling thread): runs the backend over chunk k
+    #   writer: expands the results of chunk k-1 to its rows, marks black-listed words and appends it to result_file,
+    #           if one is given
+    # so at most a handful of chunks are held in memory whatever the size of the input.
+    # on_chunk: optional callable(df) receiving every finished chunk, e.g. to collect flagged rows.
+    # progress: optional callable(rows_processed, misspellings_found), as for run_spell_check.
+    # append: add to the rows already in result_file, e.g. when resuming, instead of replacing it.
+    # check_cancelled: optional callable raising to stop the spell-check, called before every upload and every check.
+    # Returns totals of rows, flagged rows, verdict cache hits and misses and Sheets API calls.
+    backend = backend or get_spell_check_backend(browser, pool)
+    can_upload = hasattr(backend, 'upload')
+    prepared_queue = queue.Queue(maxsize = 1)
+    checked_queue = queue.Queue(maxsize = 1)
+    # Upload slots of the backend: a chunk is uploaded to a free one, which is freed once the chunk has been checked,
+    # so the worksheet being checked is never overwritten
+    free_slots = queue.Queue()
+    for slot in (0, 1):
+        free_slots.put(slot)
+    stop = threading.Event()
+    errors = []
+    totals = {'rows': 0, 'flagged_rows': 0, 'cache_hits': 0, 'cache_misses': 0, 'sheets_api_calls': 0}
+    lock = threading.Lock()
+
+    if result_file is not None:
+        if os.path.dirname(result_file):
+            os.makedirs(os.path.dirname(result_file), exist_ok = True)
+        if os.path.exists(result_file) and not append:
+            os.remove(result_file)
+
+    def fail(e):
+        errors.append(e)
+        stop.set()
+
+    def read():
+        rows_before = 0
+        try:
+            for chunk in chunks:
+                if stop.is_set():
+                    return
+                if check_cancelled is not None:
+                    check_cancelled()
+                prepared = PreparedSpellCheck(chunk.reset_index(drop = True))
+                slot, upload = None, None
+                if can_upload and prepared.unique_df is not None:
+                    slot = _get(free_slots, stop)
+                    if slot is None:
+                        return
+                    upload = backend.upload(prepared.unique_df, slot)
+                if not _put(prepared_queue, (prepared, upload, rows_before, slot), stop):
+                    if upload is not None:
+                        backend.release(upload)
+                    return
+                rows_before += len(prepared.df)
+        except Exception as e:
+            fail(e)
+        finally:
+            _put(prepared_queue, END_OF_CHUNKS, stop)
+
+    def write():
+        try:
+            header = result_file is None or not os.path.exists(result_file) or os.path.getsize(result_file) == 0
+            while True:
+                item = _get(checked_queue, stop)
+                if item is END_OF_CHUNKS:
+                    return
+                prepared, unique_df, misspellings = item
+                df = prepared.finish(unique_df, misspellings, backend.cacheable)
+                if result_file is not None:
+                    df.to_csv(result_file, mode = 'a', header = header, index = False)
+                    header = False
+                with lock:
+                    totals['rows'] += len(df)
+                    totals['flagged_rows'] += int((df['INCORRECT WORDS'] != '').sum())
+                    totals['cache_hits'] += df.attrs['cache_hits']
+                    totals['cache_misses'] += df.attrs['cache_misses']
+                    totals['sheets_api_calls'] += df.attrs['sheets_api_calls']
+                    rows, flagged_rows = totals['rows'], totals['flagged_rows']
+                if on_chunk is not None:
+                    on_chunk(df)
+                if progress is not None:
+                    progress(rows, flagged_rows)
+        except Exception as e:
+            fail(e)
+
+    reader = threading.Thread(target = traced(read), daemon = True, name = 'spell-check-reader')
+    writer = threading.Thread(target = traced(write), daemon = True, name = 'spell-check-writer')
+    reader.start()
+    writer.start()
+    try:
+        while True:
+            item = _get(prepared_queue, stop)
+            if item is END_OF_CHUNKS:
+                break
+            prepared, upload, rows_before, slot = item
+            if check_cancelled is not None:
+                try:
+                    check_cancelled()
+                except BaseException:
+                    if upload is not None:
+                        backend.release(upload)
+                    raise
+            unique_df, misspellings = None, None
+            if prepared.unique_df is not None:
+                tracker = None
+                if progress is not None:
+                    # Flagged rows of the previous chunk are only counted once it has been written
+                    tracker = prepared.progress_tracker(
+                        lambda rows, flagged_rows: progress(rows_before + rows, totals['flagged_rows'] + flagged_rows))
+                with span('backend_check'):
+                    if upload is not None:
+                        try:
+                            unique_df, misspellings = backend.check(prepared.unique_df, tracker, upload = upload)
+                        finally:
+                            free_slots.put(slot)
+                    else:
+                        unique_df, misspellings = backend.check(prepared.unique_df, tracker)
+            if not _put(checked_queue, (prepared, unique_df, misspellings), stop):
+                break
+    except BaseException as e:
+        fail(e)
+    finally:
+        _put(checked_queue, END_OF_CHUNKS, stop)
+        writer.join()
+        stop.set()
+        reader.join()
+        # Worksheets uploaded ahead of a failed check are cleared and their sessions returned to the pool
+        while True:
+            try:
+                item = prepared_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not END_OF_CHUNKS and item[1] is not None:
+                backend.release(item[1])
+        if hasattr(backend, 'close'):
+            backend.close()
+    if errors:
+        raise errors[0]
+    return totals
+
+
+class ResultStreamClosed(Exception):
+    pass
+
+class ResultStreamAborted(Exception):
+    pass
+
+def stream_results(run, result_format):
+    # Yields NDJSON lines or CSV rows of flagged rows while run(on_chunk) is still spell-checking in another thread.
+    # run must call on_chunk(df) with every finished chunk, e.g. run_streaming_spell_check(..., on_chunk = on_chunk).
+    results = queue.Queue(maxsize = 4)
+    stop = threading.Event()
+    errors = []
+
+    def on_chunk(df):
+        # Stops the spell-check when the client has gone away
+        if not _put(results, format_result_rows(df, result_format), stop):
+            raise ResultStreamClosed()
+
+    def produce():
+        try:
+            run(on_chunk)
+        except ResultStreamClosed:
+            pass
+        except Exception as e:
+            logger.error(f"Could not stream spell-check results due to exception: '{e}'")
+            errors.append(e)
+        finally:
+            _put(results, END_OF_CHUNKS, stop)
+
+    thread = threading.Thread(target = produce, daemon = True, name = 'spell-check-result-stream')
+    thread.start()
+    try:
+        if result_format == 'csv':
+            yield ','.join(['ID', 'ACTUAL WORDS'] + RESULT_COLUMNS) + '\n'
+        while True:
+            lines = _get(results, stop)
+            if lines is END_OF_CHUNKS:
+                break
+            if lines:
+                yield lines
+        if errors:
+            # The status code has already been sent, so NDJSON clients get the error as the last record. The stream is
+            # then aborted: the server drops the connection before the end of the chunked body, and CSV clients see an
+            # incomplete response instead of a file which looks complete
+            if result_format == 'ndjson':
+                yield json.dumps({'error': str(errors[0])}) + '\n'
+            raise ResultStreamAborted(f"Spell-check failed after {result_format} results were sent: '{errors[0]}'") from errors[0]
+    finally:
+        stop.set()
@@ -0,0 +1,166 @@
+import logging
+import os
+import pickle
+import re
+from functools import lru_cache
+
+from app.settings import get_app_settings
+
+config = get_app_settings()
+logger = logging.getLogger(__name__)
+
+# Alphabetic words inside a token, e.g. "well" and "known" in "well-known" or "don't" in "don't,"
+WORD_PATTERN = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*")
+INDEX_FORMAT_VERSION = 1
+
+
+def damerau_levenshtein_distance(a, b, max_distance):
+    # Optimal string alignment distance, giving up once every path exceeds max_distance
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class SymSpellIndex:
+
+    def __init__(self, frequencies, max_edit_distance = 2, prefix_length = 7):
+        # Precomputes the delete-neighbourhood of every dictionary word (SymSpell), so a lookup only has to
+        # generate the deletes of the input word instead of comparing it with the whole dictionary
+        self.max_edit_distance = max_edit_distance
+        self.prefix_length = prefix_length
+        self.words = {word.lower(): count for word, count in frequencies.items()}
+        self.deletes = {}
+        for word in self.words:
+            for delete in self._edits(word[:prefix_length]):
+                self.deletes.setdefault(delete, []).append(word)
+
+    def _edits(self, word):
+        edits = {word}
+        queue = [word]
+        for _ in range(self.max_edit_distance):
+            next_queue = []
+            for candidate in queue:
+                if len(candidate) <= 1:
+                    continue
+                for i in range(len(candidate)):
+                    delete = candidate[:i] + candidate[i + 1:]
+                    if delete not in edits:
+                        edits.add(delete)
+                        next_queue.append(delete)
+            queue = next_queue
+        return edits
+
+    def lookup(self, word, max_distance = None):
+        # Returns [(suggestion, distance, count)] sorted by distance and then by descending frequency
+        max_distance = self.max_edit_distance if max_distance is None else min(max_distance, self.max_edit_distance)
+        word = word.lower()
+        if word in self.words:
+            return [(word, 0, self.words[word])]
+
+        suggestions = {}
+        considered = set()
+        prefix = word[:self.prefix_length]
+        candidates = [prefix]
+        seen_candidates = {prefix}
+        for candidate in candidates:
+            if len(prefix) - len(candidate) > max_distance:
+                break
+            for suggestion in self.deletes.get(candidate, ()):
+                if suggestion in considered or abs(len(suggestion) - len(word)) > max_distance:
+                    continue
+                considered.add(suggestion)
+                distance = damerau_levenshtein_distance(word, suggestion, max_distance)
+                if distance <= max_distance:
+                    suggestions[suggestion] = distance
+            if len(prefix) - len(candidate) < max_distance and len(candidate) > 1:
+                for i in range(len(candidate)):
+                    delete = candidate[:i] + candidate[i + 1:]
+                    if delete not in seen_candidates:
+                        seen_candidates.add(delete)
+                        candidates.append(delete)
+        return sorted(
+            ((i, j, self.words[i]) for i, j in suggestions.items()),
+            key = lambda k: (k[1], -k[2], k[0])
+        )
+
+    def unknown_words(self, token):
+        return [i for i in WORD_PATTERN.findall(token) if i.lower() not in self.words]
+
+    def is_known(self, token):
+        return len(self.unknown_words(token)) == 0
+
+    def suggest(self, word):
+        suggestions = self.lookup(word)
+        if not suggestions:
+            return ''
+        suggestion = suggestions[0][0]
+        # Keep the capitalisation of the input, e.g. "Wrold" --> "World"
+        if word.isupper():
+            return suggestion.upper()
+        if word[:1].isupper():
+            return suggestion[:1].upper() + suggestion[1:]
+        return suggestion
+
+
+def load_frequency_dictionary(dictionary_path):
+    # SymSpell format: "<word> <count>" per line
+    frequencies = {}
+    with open(dictionary_path, 'r', encoding = 'utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                frequencies[parts[0]] = frequencies.get(parts[0], 0) + int(parts[1])
+            elif len(parts) == 1:
+                frequencies[parts[0]] = frequencies.get(parts[0], 0) + 1
+    return frequencies
+
+def load_symspell_index(dictionary_path, index_path, max_edit_distance = 2, prefix_length = 7):
+    # The index is built once and serialized next to the verdict cache so that workers start quickly
+    stat = os.stat(dictionary_path)
+    signature = (INDEX_FORMAT_VERSION, os.path.abspath(dictionary_path), stat.st_size, stat.st_mtime, max_edit_distance, prefix_length)
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, 'rb') as f:
+                stored_signature, index = pickle.load(f)
+            if stored_signature == signature:
+                return index
+        except Exception as e:
+            logger.warning(f"Rebuilding SymSpell index as '{index_path}' could not be loaded: '{e}'")
+
+    logger.info(f"Building SymSpell index from '{dictionary_path}'...")
+    index = SymSpellIndex(load_frequency_dictionary(dictionary_path), max_edit_distance, prefix_length)
+    if os.path.dirname(index_path):
+        os.makedirs(os.path.dirname(index_path), exist_ok = True)
+    # Write to a temporary file first so that other workers never read a partially written index
+    temporary_path = f'{index_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as f:
+        pickle.dump((signature, index), f, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, index_path)
+    return index
+
+
+@lru_cache()
+def get_symspell_index():
+    # Returns None when no dictionary is configured, which disables the offline pre-filter
+    dictionary_path = os.path.abspath(config.SYMSPELL_DICTIONARY_PATH)
+    if not os.path.exists(dictionary_path):
+        logger.warning(f"SymSpell dictionary '{dictionary_path}' not found, every word will be checked using Google Sheets")
+        return None
+    return load_symspell_index(
+        dictionary_path,
+        os.path.abspath(config.SYMSPELL_INDEX_PATH),
+        max_edit_distance = config.SYMSPELL_MAX_EDIT_DISTANCE,
+        prefix_length = config.SYMSPELL_PREFIX_LENGTH
+    )
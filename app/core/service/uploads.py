@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+import aiofiles
+import aiofiles.os
+
+from app.core.service.file_lock import FileLock
+from app.settings import get_app_settings
+
+config = get_app_settings()
+logger = logging.getLogger(__name__)
+
+
+class UploadOffsetMismatch(Exception):
+    def __init__(self, expected_offset):
+        super().__init__(f'Upload continues at byte {expected_offset}')
+        self.expected_offset = expected_offset
+
+
+class UploadIndex:
+
+    def __init__(self, path):
+        # File name --> {hash, size, mtime} of every completed upload, used to recognize duplicates and to skip re-hashing
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def add(self, file_name, file_hash, file_path):
+        stat = os.stat(file_path)
+        # Worker processes share the index file
+        with self._lock, FileLock(f'{self.path}.lock'):
+            entries = self._load()
+            entries[file_name] = {'hash': file_hash, 'size': stat.st_size, 'mtime': stat.st_mtime}
+            with open(self.path, 'w') as f:
+                json.dump(entries, f)
+
+    @staticmethod
+    def _unchanged(entry, file_path):
+        # Whether the file still has the size and modification time recorded at upload
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return False
+        return (entry['size'], entry['mtime']) == (stat.st_size, stat.st_mtime)
+
+    def hash_of(self, file_name, file_path):
+        # Hash recorded at upload, as long as the file was not modified since
+        with self._lock:
+            entry = self._load().get(file_name)
+        return entry['hash'] if entry is not None and self._unchanged(entry, file_path) else None
+
+    def duplicate_of(self, file_name, file_hash):
+        # Another uploaded file with the same content, if any
+        upload_folder = os.path.abspath(config.UPLOAD_FOLDER)
+        with self._lock:
+            entries = self._load()
+        for name, entry in entries.items():
+            if name != file_name and entry['hash'] == file_hash and self._unchanged(entry, os.path.join(upload_folder, name)):
+                return name
+        return None
+
+
+class UploadResult:
+
+    def __init__(self, file_name, file_hash, size, received, seconds, duplicate_of = None):
+        self.file_name = file_name
+        self.file_hash = file_hash
+        self.size = size
+        # Bytes received by the request which completed the upload, all of them unless it was resumed
+        self.received = received
+        self.seconds = seconds
+        self.duplicate_of = duplicate_of
+
+    @property
+    def throughput(self):
+        # MB/sec
+        return self.received / max(self.seconds, 1e-9) / 1e6
+
+
+async def copy_stream(chunks, f, digest, total_size = None, description = ''):
+    # Writes chunks through the async file f, hashing them on the way. Returns the number of bytes written
+    written = 0
+    progress = time.perf_counter()
+    async for chunk in chunks:
+        digest.update(chunk)
+        await f.write(chunk)
+        written += len(chunk)
+        elapsed_time = time.perf_counter() - progress
+        # Log progress after every minute
+        if elapsed_time > 60:
+            progress = time.perf_counter()
+            done = f'{(written / total_size) * 100:.2f}%' if total_size else f'{written / 1e6:.2f} MB'
+            logger.info(f'Downloaded {done} of {description}')
+    return written
+
+async def iter_upload_file(file, chunk_size):
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def save_upload(file, file_name):
+    # Streams an UploadFile to UPLOAD_FOLDER through a temporary file, so a failed upload never replaces an earlier one
+    uploaded_file = os.path.join(config.UPLOAD_FOLDER, file_name)
+    temporary_file = os.path.join(os.path.abspath(config.UPLOAD_PARTIAL_FOLDER), f'{file_name}.{os.getpid()}.{id(file)}.tmp')
+    os.makedirs(os.path.dirname(temporary_file), exist_ok = True)
+    digest = hashlib.sha256()
+    start = time.perf_counter()
+    try:
+        async with aiofiles.open(temporary_file, 'wb') as f:
+            size = await copy_stream(iter_upload_file(file, config.FILE_WRITE_BUFFER_SIZE), f, digest, getattr(file, 'size', None), uploaded_file)
+        await aiofiles.os.replace(temporary_file, uploaded_file)
+    finally:
+        if os.path.exists(temporary_file):
+            os.unlink(temporary_file)
+    return await asyncio.to_thread(finish_upload, file_name, digest.hexdigest(), size, size, time.perf_counter() - start)
+
+def finish_upload(file_name, file_hash, size, received, seconds):
+    # Blocks on the index lock file and its JSON, so the upload handlers run it in a worker thread
+    index = get_upload_index()
+    index.add(file_name, file_hash, os.path.join(config.UPLOAD_FOLDER, file_name))
+    result = UploadResult(file_name, file_hash, size, received, seconds, index.duplicate_of(file_name, file_hash))
+    logger.info(f"Finished downloading '{file_name}' in {seconds:.2f} seconds at {result.throughput:.2f} MB/sec")
+    return result
+
+
+class ResumableUploads:
+
+    def __init__(self, folder):
+        # Partial uploads are kept in their own folder until completed, so they are never used as spell-check input.
+        # Hashes of uploads received in order stay in memory; an upload resumed in another process is re-hashed at the end
+        self.folder = folder
+        self._digests = {}
+        # File name --> (asyncio.Lock, requests holding or waiting for it), dropped when no request needs it
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _partial_path(self, file_name):
+        return os.path.join(self.folder, f'{file_name}.part')
+
+    @asynccontextmanager
+    async def _file_lock(self, file_name):
+        # Appends to an upload are serialized between the requests of this process and, through a lock file, between
+        # worker processes. The lock file is polled so that waiting never blocks the event loop
+        with self._lock:
+            lock, users = self._locks.get(file_name, (None, 0))
+            lock = lock or asyncio.Lock()
+            self._locks[file_name] = (lock, users + 1)
+        try:
+            async with lock:
+                os.makedirs(self.folder, exist_ok = True)
+                file_lock = FileLock(os.path.join(self.folder, f'{file_name}.lock'))
+                while not file_lock.acquire(blocking = False):
+                    await asyncio.sleep(0.05)
+                try:
+                    yield
+                finally:
+                    file_lock.release()
+        finally:
+            with self._lock:
+                users = self._locks[file_name][1] - 1
+                if users:
+                    self._locks[file_name] = (lock, users)
+                else:
+                    del self._locks[file_name]
+
+    def offset(self, file_name):
+        # Bytes received so far, i.e. where the next chunk has to start
+        partial_path = self._partial_path(file_name)
+        return os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+
+    async def append(self, file_name, offset, chunks, complete = False):
+        # Appends a chunk starting at byte offset. With complete, the upload is moved to UPLOAD_FOLDER and an UploadResult
+        # is returned, otherwise the new offset
+        async with self._file_lock(file_name):
+            if offset != self.offset(file_name):
+                raise UploadOffsetMismatch(self.offset(file_name))
+            partial_path = self._partial_path(file_name)
+            start = time.perf_counter()
+            received_offset, digest = self._digests.pop(file_name, (None, None))
+            if received_offset != offset:
+                digest = None
+            hashing_digest = digest or hashlib.sha256()
+            async with aiofiles.open(partial_path, 'ab') as f:
+                written = await copy_stream(chunks, f, hashing_digest, description = partial_path)
+            if digest is not None or offset == 0:
+                self._digests[file_name] = (offset + written, hashing_digest)
+            if not complete:
+                return offset + written
+
+            _, digest = self._digests.pop(file_name, (None, None))
+            file_hash = digest.hexdigest() if digest is not None else await hash_file_async(partial_path)
+            size = self.offset(file_name)
+            await aiofiles.os.replace(partial_path, os.path.join(config.UPLOAD_FOLDER, file_name))
+            return await asyncio.to_thread(finish_upload, file_name, file_hash, size, written, time.perf_counter() - start)
+
+    def discard(self, file_name):
+        with self._lock:
+            self._digests.pop(file_name, None)
+        if os.path.exists(self._partial_path(file_name)):
+            os.unlink(self._partial_path(file_name))
+
+
+async def hash_file_async(file_path):
+    digest = hashlib.sha256()
+    async with aiofiles.open(file_path, 'rb') as f:
+        while True:
+            block = await f.read(1024 * 1024)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@lru_cache()
+def get_upload_index() -> UploadIndex:
+    return UploadIndex(os.path.abspath(config.UPLOAD_INDEX_PATH))
+
+@lru_cache()
+def get_resumable_uploads() -> ResumableUploads:
+    return ResumableUploads(os.path.abspath(config.UPLOAD_PARTIAL_FOLDER))
@@ -0,0 +1,146 @@
+import json
+import os
+import sqlite3
+import string
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, NamedTuple, Tuple
+
+from app.settings import get_app_settings
+
+config = get_app_settings()
+
+# SQLite refuses statements with more than 999 bound parameters on older builds
+SQLITE_MAX_PARAMS = 900
+
+
+class Verdict(NamedTuple):
+    # Words flagged by Google inside the token and the suggestion offered for each of them
+    incorrect_words: Tuple[str, ...] = ()
+    suggested_words: Tuple[str, ...] = ()
+
+    @property
+    def misspelled(self):
+        return len(self.incorrect_words) > 0
+
+
+def normalize_token(token):
+    return unicodedata.normalize('NFKC', token).strip(string.punctuation + string.whitespace)
+
+def split_tokens(phrase):
+    tokens = (normalize_token(i) for i in str(phrase).split())
+    return [i for i in tokens if i]
+
+
+class VerdictCache:
+
+    def __init__(self, db_path, memory_size = 100000, disk_size = 5000000, ttl = 7 * 24 * 3600):
+        self.db_path = db_path
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok = True)
+        self._connection = sqlite3.connect(db_path, check_same_thread = False, isolation_level = None)
+        # WAL lets every uvicorn worker read the cache while one of them writes
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS verdicts ('
+            'token TEXT PRIMARY KEY, incorrect_words TEXT, suggested_words TEXT, '
+            'expires_at REAL, last_used REAL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts (last_used)')
+
+    def get_many(self, tokens: Iterable[str]) -> Dict[str, Verdict]:
+        now = time.time()
+        tokens = set(tokens)
+        found = {}
+        remaining = []
+        with self._lock:
+            for token in tokens:
+                entry = self._memory.get(token)
+                if entry is not None and entry[1] > now:
+                    self._memory.move_to_end(token)
+                    found[token] = entry[0]
+                else:
+                    if entry is not None:
+                        del self._memory[token]
+                    remaining.append(token)
+
+            for i in range(0, len(remaining), SQLITE_MAX_PARAMS):
+                chunk = remaining[i : i + SQLITE_MAX_PARAMS]
+                rows = self._connection.execute(
+                    f'SELECT token, incorrect_words, suggested_words, expires_at FROM verdicts '
+                    f'WHERE token IN ({",".join("?" * len(chunk))}) AND expires_at > ?',
+                    (*chunk, now)
+                ).fetchall()
+                for token, incorrect_words, suggested_words, expires_at in rows:
+                    verdict = Verdict(tuple(json.loads(incorrect_words)), tuple(json.loads(suggested_words)))
+                    found[token] = verdict
+                    self._remember(token, verdict, expires_at)
+                if rows:
+                    self._connection.executemany(
+                        'UPDATE verdicts SET last_used = ? WHERE token = ?', [(now, i[0]) for i in rows])
+
+            self.hits += len(found)
+            self.misses += len(tokens) - len(found)
+        return found
+
+    def set_many(self, verdicts: Dict[str, Verdict]):
+        if not verdicts:
+            return
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            for token, verdict in verdicts.items():
+                self._remember(token, verdict, expires_at)
+            self._connection.execute('BEGIN')
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?)',
+                [
+                    (token, json.dumps(verdict.incorrect_words), json.dumps(verdict.suggested_words), expires_at, now)
+                    for token, verdict in verdicts.items()
+                ]
+            )
+            self._connection.execute('COMMIT')
+            self._evict_disk(now)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._connection.execute('DELETE FROM verdicts')
+
+    def _remember(self, token, verdict, expires_at):
+        self._memory[token] = (verdict, expires_at)
+        self._memory.move_to_end(token)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last = False)
+
+    def _evict_disk(self, now):
+        self._connection.execute('DELETE FROM verdicts WHERE expires_at <= ?', (now,))
+        count = self._connection.execute('SELECT COUNT(*) FROM verdicts').fetchone()[0]
+        if count > self.disk_size:
+            # Least recently used entries go first
+            self._connection.execute(
+                'DELETE FROM verdicts WHERE token IN (SELECT token FROM verdicts ORDER BY last_used LIMIT ?)',
+                (count - self.disk_size,)
+            )
+
+
+@lru_cache()
+def get_verdict_cache() -> VerdictCache:
+    return VerdictCache(
+        os.path.abspath(config.VERDICT_CACHE_PATH),
+        memory_size = config.VERDICT_CACHE_MEMORY_SIZE,
+        disk_size = config.VERDICT_CACHE_DISK_SIZE,
+        ttl = config.VERDICT_CACHE_TTL_SECONDS
+    )
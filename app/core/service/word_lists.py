@@ -0,0 +1,222 @@
+import glob
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections.abc import Mapping
+from functools import lru_cache
+from itertools import accumulate
+
+from app.core.service.file_lock import FileLock
+from app.core.service.verdict_cache import split_tokens
+from app.settings import get_app_settings
+
+config = get_app_settings()
+logger = logging.getLogger(__name__)
+
+# Magic and number of entries, followed by entries + 1 offsets and the "<normalized entry>\t<entry as written>" lines
+HEADER = struct.Struct('<8sQ')
+MAGIC = b'WORDS001'
+# Every SAMPLE_INTERVAL-th key is kept in memory, so most steps of a lookup bisect a list instead of the mapped file
+SAMPLE_INTERVAL = 64
+
+
+def normalize_word(word):
+    # Case, Unicode forms and punctuation around tokens are ignored, e.g. "Café," matches "CAFÉ" and "café"
+    if word.isascii() and word.isalnum():
+        return word.lower()
+    return ' '.join(i.casefold() for i in split_tokens(word))
+
+def parse_entries(text):
+    # Normalized entry --> first line of the word list which normalizes to it
+    entries = {}
+    for line in text.splitlines():
+        key = normalize_word(line)
+        if key:
+            entries.setdefault(key, line.strip())
+    return entries
+
+
+class SortedWordFile(Mapping):
+    # Read-only file of entries sorted by normalized entry, binary-searched in place through a memory map. Every worker
+    # maps the same file, so the operating system keeps a single copy of it in memory
+
+    @staticmethod
+    def write(path, entries):
+        lines = [f'{key}\t{entries[key]}'.encode('utf-8') for key in sorted(entries)]
+        offsets = array('Q', accumulate(map(len, lines), initial = 0))
+        temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(lines)))
+            f.write(offsets.tobytes())
+            f.write(b''.join(lines))
+        os.replace(temporary_path, path)
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, self._count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' is not a word list index")
+        self._data = HEADER.size + 8 * (self._count + 1)
+        self._offsets = memoryview(self._mmap)[HEADER.size : self._data].cast('Q')
+        self._samples = [self._key(i) for i in range(0, self._count, SAMPLE_INTERVAL)]
+
+    def _line(self, i):
+        return self._mmap[self._data + self._offsets[i] : self._data + self._offsets[i + 1]]
+
+    def _key(self, i):
+        start = self._data + self._offsets[i]
+        return self._mmap[start : self._mmap.find(b'\t', start)]
+
+    def _find(self, key):
+        target = key.encode('utf-8')
+        block = bisect_right(self._samples, target) - 1
+        if block < 0:
+            return None
+        low, high = block * SAMPLE_INTERVAL, min((block + 1) * SAMPLE_INTERVAL, self._count)
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self._count and self._key(low) == target else None
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i is None:
+            raise KeyError(key)
+        line = self._line(i)
+        return line[line.index(b'\t') + 1:].decode('utf-8')
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._key(i).decode('utf-8')
+
+    def __len__(self):
+        return self._count
+
+
+class WordList(Mapping):
+    # Normalized entry --> entry as written, for a text file with one entry per line which may be edited while the app
+    # runs. Changes are picked up within reload_seconds through the file's mtime. The entries are compiled into a
+    # SortedWordFile named after the content hash, built by the first worker to notice the change and mapped by all others
+
+    def __init__(self, path, index_folder, reload_seconds = 1.0):
+        self.path = path
+        self.index_folder = index_folder
+        self.reload_seconds = reload_seconds
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.content_hash = None
+        self._words = None
+        self._stat = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def words(self, force = False):
+        # Current SortedWordFile, which stays valid for callers holding it while the list is reloaded
+        if not force and self._checked is not None and time.monotonic() - self._checked < self.reload_seconds:
+            return self._words
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+                stat = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                stat = None
+            if stat != self._stat or self._words is None:
+                self._load()
+                self._stat = stat
+            self._checked = time.monotonic()
+        return self._words
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            with open(self.path, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            content = b''
+        content_hash = hashlib.sha256(content).hexdigest()
+        if content_hash == self.content_hash:
+            return
+        index_path = os.path.join(self.index_folder, f'{self.name}.{content_hash[:16]}.words')
+        try:
+            words = SortedWordFile(index_path)
+        except FileNotFoundError:
+            # Workers noticing the change at the same time wait for the first one instead of compiling it again
+            with FileLock(os.path.join(self.index_folder, f'{self.name}.lock')):
+                if not os.path.exists(index_path):
+                    SortedWordFile.write(index_path, parse_entries(content.decode('utf-8')))
+                    self._remove_stale_indexes(index_path)
+            words = SortedWordFile(index_path)
+        self._words, self.content_hash = words, content_hash
+        logger.info(f"Loaded {len(words)} entries of '{self.path}' in {time.perf_counter() - start:.3f} seconds")
+
+    def _remove_stale_indexes(self, index_path):
+        # Workers still mapping an older index keep reading it; where the operating system refuses, it is left behind
+        for path in glob.glob(os.path.join(self.index_folder, f'{self.name}.*.words')):
+            if path != index_path:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    @property
+    def version(self):
+        self.words()
+        return self.content_hash
+
+    def __getitem__(self, key):
+        return self.words()[key]
+
+    def __iter__(self):
+        return iter(self.words())
+
+    def __len__(self):
+        return len(self.words())
+
+    def matches(self, word):
+        return normalize_word(word) in self.words()
+
+    def edit(self, add = (), remove = ()):
+        # Adds and removes entries (matched after normalization) in the word-list file, under a lock shared by every
+        # worker. Returns the entries actually added and removed
+        with FileLock(f'{self.path}.lock'):
+            try:
+                with open(self.path, 'r', encoding = 'utf-8') as f:
+                    lines = [i.strip() for i in f.read().splitlines() if i.strip()]
+            except FileNotFoundError:
+                lines = []
+            remove_keys = {normalize_word(i) for i in remove}
+            removed = [i for i in lines if normalize_word(i) in remove_keys]
+            lines = [i for i in lines if normalize_word(i) not in remove_keys]
+            existing = {normalize_word(i) for i in lines}
+            added = []
+            for word in add:
+                key = normalize_word(word)
+                if key and key not in existing:
+                    existing.add(key)
+                    added.append(word.strip())
+            if added or removed:
+                os.makedirs(os.path.dirname(self.path), exist_ok = True)
+                temporary_path = f'{self.path}.{os.getpid()}.tmp'
+                with open(temporary_path, 'w', encoding = 'utf-8') as f:
+                    f.write(''.join(i + '\n' for i in lines + added))
+                os.replace(temporary_path, self.path)
+        self.words(force = True)
+        return added, removed
+
+
+@lru_cache()
+def get_blacklist() -> WordList:
+    return WordList(os.path.abspath(config.BLACKLIST_PATH), os.path.abspath(config.WORD_LIST_INDEX_FOLDER), config.WORD_LIST_RELOAD_SECONDS)
+
+@lru_cache()
+def get_whitelist() -> WordList:
+    return WordList(os.path.abspath(config.WHITELIST_PATH), os.path.abspath(config.WORD_LIST_INDEX_FOLDER), config.WORD_LIST_RELOAD_SECONDS)
@@ -0,0 +1,144 @@
+import logging
+import os
+import platform
+import signal
+import threading
+import time
+from functools import lru_cache
+
+from app.core.service.file_lock import FileLock
+from app.settings import get_app_settings
+
+config = get_app_settings()
+logger = logging.getLogger(__name__)
+
+
+def process_tree(pid):
+    # pid and its descendants, children first
+    children = {}
+    if os.path.isdir('/proc'):
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat', 'r') as f:
+                    # The process name is in parentheses and may contain spaces, the parent pid follows it
+                    parent = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree[::-1]
+
+def process_name(pid):
+    try:
+        with open(f'/proc/{pid}/comm', 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def process_alive(pid):
+    if platform.system() == 'Windows':
+        return f' {pid} ' in os.popen(f'tasklist /nh /fi "PID eq {pid}"').read()
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running under another user
+        pass
+    return True
+
+def kill_process_tree(pid, name = None):
+    # Kills pid and the processes it started, e.g. a chromedriver and its Chrome. With name, pid is only killed if it
+    # still runs under that name, as a recorded pid may have been reused by an unrelated process
+    if platform.system() == 'Windows':
+        name_filter = f' /fi "IMAGENAME eq {name}.exe"' if name else ''
+        return os.system(f'taskkill /f /t{name_filter} /pid {pid}') == 0
+    if name is not None and os.path.isdir('/proc') and not (process_name(pid) or '').startswith(name[:15]):
+        return False
+    killed = False
+    for i in process_tree(pid):
+        try:
+            os.kill(i, signal.SIGKILL)
+            killed = True
+        except OSError:
+            pass
+    return killed
+
+
+class WorkerLease:
+    # Slot held by this process among the uvicorn workers sharing the machine and the spreadsheets. Each slot owns its
+    # own worksheets and Chrome processes, so workers never write to each other's worksheets or kill each other's
+    # drivers. The lock is released by the operating system when the process exits
+
+    def __init__(self, folder, slots):
+        self.folder = folder
+        self.slots = slots
+        self.slot = None
+        self._lock = None
+        self._acquire_lock = threading.Lock()
+
+    def _path(self, slot, extension):
+        return os.path.join(self.folder, f'worker_{slot}.{extension}')
+
+    def acquire(self, timeout = None):
+        # Returns the slot of this process, waiting for one to become free when more processes than slots are running
+        with self._acquire_lock:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self.slot is None:
+                for slot in range(self.slots):
+                    lock = FileLock(self._path(slot, 'lock'))
+                    if lock.acquire(blocking = False):
+                        self.slot, self._lock = slot, lock
+                        logger.info(f'Worker {os.getpid()} leased worksheet slot {slot}')
+                        self.kill_orphaned_drivers()
+                        break
+                else:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise TimeoutError(f'No worker slot became available within {timeout} seconds')
+                    time.sleep(0.5)
+            return self.slot
+
+    def release(self):
+        with self._acquire_lock:
+            if self._lock is not None:
+                self._lock.release()
+            self.slot, self._lock = None, None
+
+    def kill_orphaned_drivers(self):
+        # Drivers recorded under this slot belong to a worker which died without quitting them
+        for pid in self._recorded_pids():
+            if kill_process_tree(pid, 'chromedriver'):
+                logger.warning(f'Killed orphaned chromedriver {pid} of worker slot {self.slot}')
+        self._write_pids([])
+
+    def _recorded_pids(self):
+        try:
+            with open(self._path(self.slot, 'pids'), 'r') as f:
+                return [int(i) for i in f.read().split()]
+        except (OSError, ValueError):
+            return []
+
+    def _write_pids(self, pids):
+        with open(self._path(self.slot, 'pids'), 'w') as f:
+            f.write('\n'.join(str(i) for i in pids))
+
+    def record_driver(self, pid, running = True):
+        # Keeps track of the drivers started (or quit) by this worker
+        self.acquire()
+        with self._acquire_lock:
+            pids = [i for i in self._recorded_pids() if i != pid]
+            self._write_pids(pids + [pid] if running else pids)
+
+
+@lru_cache()
+def get_worker_lease() -> WorkerLease:
+    return WorkerLease(os.path.abspath(config.WORKER_LEASE_FOLDER), config.WORKER_LEASE_SLOTS)
+
+def worker_slot():
+    return get_worker_lease().acquire(config.BROWSER_POOL_CHECKOUT_TIMEOUT)
@@ -17,32 +17,157 @@ class Settings(BaseSettings):
 
     # Local File Paths
     UPLOAD_FOLDER: str = 'resources/uploads'
-    ALLOWED_UPLOAD_EXTENSIONS: List[str] = ['csv', 'txt', 'xls', 'xlsx']
+    ALLOWED_UPLOAD_EXTENSIONS: List[str] = ['csv', 'txt', 'xls', 'xlsx', 'parquet', 'feather', 'arrow']
+    # Convert Excel inputs to Parquet in EXCEL_PARQUET_FOLDER the first time they are read, later runs read the Parquet copy
+    EXCEL_TO_PARQUET: bool = False
+    EXCEL_PARQUET_FOLDER: str = 'resources/cache/excel_parquet'
     SCREENSHOTS_FOLDER: str = 'screenshots'
+    RESULTS_FOLDER: str = 'resources/results'
+    # Uploads in progress, moved to UPLOAD_FOLDER once complete
+    UPLOAD_PARTIAL_FOLDER: str = 'resources/uploads_partial'
+    # Content hash of every upload, to recognize duplicates
+    UPLOAD_INDEX_PATH: str = 'resources/cache/upload_index.json'
 
     # Chrome Configurations
     PROXY: bool = None
     HEADLESS: bool = False
+    # Number of Chrome sessions (each with its own worksheet) used to check shards of large inputs in parallel
+    BROWSER_POOL_SIZE: int = 1
+    BROWSER_POOL_MIN_SHARD_SIZE: int = 1000
+    BROWSER_POOL_CHECKOUT_TIMEOUT: int = 600
+    # Each worker process leases one of WORKER_LEASE_SLOTS slots, which owns its Chrome drivers and worksheets.
+    # A worker waits for a free slot when more than WORKER_LEASE_SLOTS workers run
+    WORKER_LEASE_SLOTS: int = 16
+    WORKER_LEASE_FOLDER: str = 'resources/leases'
+    # Start and log in the pooled Chrome sessions when the app starts, each with its worksheet open, instead of on the
+    # first request. Idle sessions are pinged every BROWSER_KEEPALIVE_SECONDS (0 disables) and replaced if Chrome died
+    BROWSER_WARM_START: bool = False
+    BROWSER_KEEPALIVE_SECONDS: int = 60
+    # A failed Google login is retried on checkout at most this often
+    BROWSER_LOGIN_RETRY_SECONDS: int = 300
+    # Wait up to this long for a worksheet still open from the last check to show the values just written, instead of
+    # reloading it. A worksheet which does not show them in time is reloaded
+    BROWSER_REUSE_SETTLE_MS: int = 2000
+    # Persistent Chrome profiles (one per worker slot and session) keep the Google login across restarts.
+    # Empty uses incognito sessions, which log in on every start
+    CHROME_PROFILE_FOLDER: str = ''
+    # chromedriver binary. Empty installs one matching Chrome, remembering its path in CHROMEDRIVER_CACHE_PATH
+    CHROMEDRIVER_PATH: str = ''
+    CHROMEDRIVER_CACHE_PATH: str = 'resources/cache/chromedriver_path.txt'
     # The following url is least likely to give captcha prompts. https://gist.github.com/ikegami-yukino/51b247080976cb41fe93#gistcomment-3455633
     GOOGLE_LOGIN_URL = 'https://accounts.google.com/o/oauth2/v2/auth/oauthchooseaccount?redirect_uri=https%3A%2F%2Fdevelopers.google.com%2Foauthplayground&prompt=consent&response_type=code&client_id=407408718192.apps.googleusercontent.com&scope=email&access_type=offline&flowName=GeneralOAuthFlow'
 
     # Google Spell Check Configurations
     CREDENTIALS_JSON_PATH: str = './api_credentials/google_sheets_credentials.json'
+    # Environment variable holding the service account JSON, used when CREDENTIALS_JSON_PATH does not exist
+    CREDENTIALS_ENV_VAR: str = 'GOOGLE_SHEETS_CREDENTIALS'
     # GOOGLE_USERNAME_ENV: str = 'ADD AS ENVIVRONMENT VARIABLE'
     # GOOGLE_PASSWORD_ENV: str = 'ADD AS ENVIVRONMENT VARIABLE'
     SHEET_NAME: str = 'Input Sheet'
-    # Load BLACKLIST_WORDS and WHITELIST_WORDS
-    try:
-        with open(os.path.abspath('./resources/word_list/blacklist_words.txt'), 'r') as f:
-            BLACKLIST_WORDS = set([i.strip('\n') for i in f.readlines()])
-    except:
-        BLACKLIST_WORDS = set()
-    try:
-        with open(os.path.abspath('./resources/word_list/whitelist_words.txt'), 'r') as f:
-            WHITELIST_WORDS = set([i.strip('\n') for i in f.readlines()])
-    except:
-        WHITELIST_WORDS = set()
+    # Values sent per update call when filling a worksheet
+    SHEETS_MAX_CELLS_PER_WRITE: int = 200000
+    # Payloads are split into up to SHEETS_WRITE_SHARDS worksheets of at least SHEETS_WRITE_MIN_SHARD_SIZE rows,
+    # written concurrently by SHEETS_WRITE_WORKERS threads and spell-checked one worksheet after the other.
+    # Shards rotate through SHEET_NAME and SHEETS_SHARD_SPREADSHEETS, which spreads the cell limit of a spreadsheet
+    SHEETS_WRITE_SHARDS: int = 1
+    SHEETS_WRITE_MIN_SHARD_SIZE: int = 50000
+    SHEETS_WRITE_WORKERS: int = 4
+    SHEETS_SHARD_SPREADSHEETS: List[str] = []
+    # Further service account files, each with its own quota, with which the spreadsheets are shared too. Sheets API
+    # requests are spread over them and CREDENTIALS_JSON_PATH, every credential sending at most
+    # SHEETS_REQUESTS_PER_MINUTE requests with bursts of SHEETS_REQUEST_BURST. Google counts quota per service account
+    # and per project, so accounts of separate projects add up. A credential answered with a 429 is paused for
+    # Retry-After or an exponential backoff of up to SHEETS_BACKOFF_MAX_SECONDS, and the call is retried at most
+    # SHEETS_RATE_LIMIT_RETRIES times.
+    # The worker processes of the machine share these limits through SHEETS_QUOTA_STATE_PATH. When it is empty, every
+    # worker keeps its own and SHEETS_REQUESTS_PER_MINUTE and SHEETS_REQUEST_BURST are divided by FAST_API_WORKERS
+    SHEETS_CREDENTIALS_PATHS: List[str] = []
+    SHEETS_QUOTA_STATE_PATH: str = 'resources/leases/sheets_quota.json'
+    SHEETS_REQUESTS_PER_MINUTE: float = 60
+    SHEETS_REQUEST_BURST: int = 10
+    SHEETS_BACKOFF_MAX_SECONDS: float = 64
+    SHEETS_RATE_LIMIT_RETRIES: int = 6
+    # Longest wait for the spell-check dialog to move on, e.g. after pressing "Ignore"
+    SPELL_CHECK_DIALOG_WAIT_MS: int = 1500
+    # Waits for the spreadsheet to load and for the spell-check dialog to move on follow the durations observed so far,
+    # within these bounds. A dialog which does not move within its timeout is stalled
+    SPELL_CHECK_PAGE_TIMEOUT_MIN_SECONDS: float = 10
+    SPELL_CHECK_PAGE_TIMEOUT_MAX_SECONDS: float = 120
+    SPELL_CHECK_STALL_TIMEOUT_MIN_SECONDS: float = 10
+    SPELL_CHECK_STALL_TIMEOUT_MAX_SECONDS: float = 300
+    # Stalled dialogs and browser failures restart the browser and re-upload the rows after the last checkpoint,
+    # up to SPELL_CHECK_MAX_RECOVERIES times per worksheet
+    SPELL_CHECK_MAX_RECOVERIES: int = 3
 
+    # Word List Configurations
+    # One entry per line, matched regardless of case, Unicode form and surrounding punctuation. The files may be edited
+    # while the app runs (or through the Word Lists APIs), changes are picked up within WORD_LIST_RELOAD_SECONDS
+    BLACKLIST_PATH: str = 'resources/word_list/blacklist_words.txt'
+    WHITELIST_PATH: str = 'resources/word_list/whitelist_words.txt'
+    WORD_LIST_RELOAD_SECONDS: float = 1.0
+    # Sorted, memory-mapped copies of the word lists shared by every worker
+    WORD_LIST_INDEX_FOLDER: str = 'resources/cache/word_lists'
+
+    # Verdict Cache Configurations
+    VERDICT_CACHE_ENABLED: bool = True
+    VERDICT_CACHE_PATH: str = 'resources/cache/verdict_cache.sqlite3'
+    VERDICT_CACHE_MEMORY_SIZE: int = 100000
+    VERDICT_CACHE_DISK_SIZE: int = 5000000
+    VERDICT_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+
+    # Offline Spell Check Configurations
+    # 'google' checks words missing from the SymSpell dictionary using Google Sheets, 'offline' uses the dictionary alone
+    SPELL_CHECK_BACKEND: str = 'google'
+    # Frequency dictionary with "<word> <count>" per line. Words found in it are never sent to Google Sheets
+    SYMSPELL_DICTIONARY_PATH: str = 'resources/word_list/frequency_dictionary_en.txt'
+    SYMSPELL_INDEX_PATH: str = 'resources/cache/symspell_index.pickle'
+    SYMSPELL_MAX_EDIT_DISTANCE: int = 2
+    SYMSPELL_PREFIX_LENGTH: int = 7
+
+    # Single-word and small-list requests arriving within COALESCE_WINDOW_SECONDS are checked in one batch. Batches run
+    # on BROWSER_POOL_SIZE threads and wait behind each other, a request not answered within COALESCE_TIMEOUT_SECONDS fails
+    COALESCE_WINDOW_SECONDS: float = 0.05
+    COALESCE_MAX_BATCH_SIZE: int = 500
+    COALESCE_MAX_LIST_SIZE: int = 50
+    COALESCE_TIMEOUT_SECONDS: float = 600
+
+    # Spell-Check Job Configurations
+    JOB_WORKERS: int = 1
+    JOB_QUEUE_SIZE: int = 16
+    # 'memory' keeps jobs in the worker process, 'sqlite' persists them in JOB_STORE_PATH
+    JOB_STORE: str = 'memory'
+    JOB_STORE_PATH: str = 'resources/jobs/jobs.sqlite3'
+    # Progress within a chunk is written, and cancellation checked, at most every JOB_PROGRESS_INTERVAL_SECONDS
+    JOB_PROGRESS_INTERVAL_SECONDS: float = 1
+    # Failed jobs resume from the last chunk written to their result, up to JOB_MAX_RESUMES times in a row without
+    # progress. Queued or running jobs can be resumed through the API once their owner process exited, or for running
+    # jobs, once their owner sent no heartbeat for JOB_STALE_SECONDS (e.g. a hung worker)
+    JOB_MAX_RESUMES: int = 3
+    JOB_HEARTBEAT_SECONDS: int = 30
+    JOB_STALE_SECONDS: int = 600
+
+    # Streaming Configurations
+    # Jobs and streaming file requests read, check and write their input STREAMING_CHUNK_SIZE rows at a time
+    STREAMING_CHUNK_SIZE: int = 50000
+    # Streams of a worker process uploading their next chunk while a pooled browser checks the current one. Each has
+    # two worksheets of its own, a stream starting while all are in use waits up to BROWSER_POOL_CHECKOUT_TIMEOUT
+    STREAMING_CONCURRENT_UPLOADS: int = 2
+
+    # Result Store Configurations
+    # Results of file requests are stored per upload content hash. Re-submitted files are answered from the store and
+    # modified files only check rows whose ID or text changed since the last upload with the same name
+    RESULT_STORE_ENABLED: bool = True
+    RESULT_STORE_FOLDER: str = 'resources/cache/results'
+    # Results least recently written or read are deleted once the store holds more than RESULT_STORE_MAX_MB
+    RESULT_STORE_MAX_MB: int = 1024
+
+    # Monitoring Configurations
+    LOG_LEVEL: str = 'INFO'
+    # Spans of requests sent with an "X-Trace" header, ignored unless TRACES_ENABLED. Only the TRACES_MAX_FILES most
+    # recent traces are kept
+    TRACES_ENABLED: bool = False
+    TRACES_FOLDER: str = 'resources/traces'
+    TRACES_MAX_FILES: int = 1000
 
     # Miscellaneous Configurations
     FILE_WRITE_BUFFER_SIZE = 16384
@@ -0,0 +1,59 @@
+# Compares the compiled blacklist matcher with the previous row-by-row implementation.
+# Usage: python -m benchmarks.bench_blacklist_matcher [--sizes 10000 100000 1000000]
+import argparse
+import random
+import time
+
+import pandas as pd
+from app.core.service.blacklist_matcher import BlacklistMatcher
+
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet']
+BLACKLIST_WORDS = {'bravo', 'hotel', 'golf india', 'zulu'} | {f'banned{i}' for i in range(1000)}
+
+
+def make_df(size, seed = 0):
+    rng = random.Random(seed)
+    df = pd.DataFrame({'ID': range(size), 'ACTUAL WORDS': [' '.join(rng.choice(WORDS) for _ in range(6)) for _ in range(size)]})
+    df['INCORRECT WORDS'] = ''
+    df['SUGGESTED WORDS'] = ''
+    df['DESCRIPTION'] = ''
+    return df
+
+def row_by_row_mark(df, blacklist_words):
+    # Previous mark_bad_words_from_file without the tqdm progress bar
+    for i in df.index:
+        bad_words = blacklist_words & set(df.at[i, df.columns[1]].split())
+        for j in bad_words:
+            if df.at[i, 'INCORRECT WORDS'] == '':
+                df.at[i, 'INCORRECT WORDS'] = j
+                df.at[i, 'DESCRIPTION'] = j + ' marked using black-listed words'
+            if j not in df.at[i, 'INCORRECT WORDS']:
+                df.at[i, 'INCORRECT WORDS'] = df.at[i, 'INCORRECT WORDS'] + ', ' + j
+                df.at[i, 'DESCRIPTION'] = (df.at[i, 'DESCRIPTION'] + ', ' + j + ' marked using black-listed words') if df.at[i, 'DESCRIPTION'] != '' else (j + ' marked using black-listed words')
+    return df
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    matcher = BlacklistMatcher(BLACKLIST_WORDS)
+    print(f'Matcher compiled from {len(BLACKLIST_WORDS)} entries in {time.perf_counter() - start:.4f} seconds\n')
+
+    print(f"{'rows':>10} {'row by row (s)':>15} {'matcher (s)':>12} {'speed-up':>9}")
+    for size in args.sizes:
+        df = make_df(size)
+        start = time.perf_counter()
+        row_by_row_mark(df.copy(), BLACKLIST_WORDS)
+        row_by_row_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matcher.mark(df.copy())
+        matcher_time = time.perf_counter() - start
+
+        print(f'{size:>10} {row_by_row_time:>15.3f} {matcher_time:>12.3f} {row_by_row_time / matcher_time:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# Measures loading the ID and text columns of an input in each format, with the memory held by the loaded frame.
+# Usage: python -m benchmarks.bench_input_formats [--rows 500000]
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow.feather as feather
+
+from app.core.service.input_file import read_input_file
+
+
+def make_input(rows, seed = 0):
+    rng = random.Random(seed)
+    words = ['the', 'cat', 'teh', 'dog', 'quick', 'brown', 'fox', 'jumps', 'over', 'lazy', 'recieve', 'spelling']
+    return pd.DataFrame({'ID': range(rows), 'ACTUAL WORDS': [' '.join(rng.choices(words, k = rng.randint(2, 8))) for _ in range(rows)],
+                         'NOTES': ['unused column'] * rows})
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type = int, default = 500000)
+    args = parser.parse_args()
+
+    df = make_input(args.rows)
+    with tempfile.TemporaryDirectory() as folder:
+        writers = {'csv': lambda path: df.to_csv(path, index = False),
+                   'parquet': lambda path: df.to_parquet(path, index = False),
+                   'feather': lambda path: feather.write_feather(df, path)}
+        try:
+            import openpyxl # noqa: F401
+            writers['xlsx'] = lambda path: df.to_excel(path, index = False)
+        except ImportError:
+            print('openpyxl is not installed, skipping xlsx\n')
+
+        print(f"{'format':<10} {'file MB':>9} {'load s':>9} {'frame MB':>10}")
+        for extension, write in writers.items():
+            path = os.path.join(folder, f'input.{extension}')
+            write(path)
+            start = time.perf_counter()
+            loaded = read_input_file(path)
+            seconds = time.perf_counter() - start
+            frame_size = loaded.iloc[:, :2].memory_usage(deep = True).sum()
+            print(f'{extension:<10} {os.path.getsize(path) / 1e6:>9.1f} {seconds:>9.3f} {frame_size / 1e6:>10.1f}')
+
+if __name__ == '__main__':
+    main()
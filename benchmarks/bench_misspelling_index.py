@@ -0,0 +1,63 @@
+# Compares the per-misspelling cost of the dialog loop before and after the row index.
+# Usage: python -m benchmarks.bench_misspelling_index [--sizes 10000 100000 1000000] [--misspellings 200]
+import argparse
+import random
+import time
+
+import pandas as pd
+from app.core.service.spell_check_results import RowIndex, record_misspelling
+
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet']
+
+
+def make_phrases(size, seed = 0):
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(WORDS) for _ in range(3)) + f' item{i % (size // 10 or 1)}' for i in range(size)]
+
+def scan_based_mapping(df, misspellings):
+    # Previous implementation: a full column comparison and df.at writes for every misspelling
+    df['INCORRECT WORDS'] = ''
+    df['SUGGESTED WORDS'] = ''
+    for incorrect_phrase, incorrect_word, suggested_word in misspellings:
+        for i in df.index[df[df.columns[1]] == incorrect_phrase].tolist():
+            if df.at[i, 'INCORRECT WORDS'] == '':
+                df.at[i, 'INCORRECT WORDS'] = incorrect_word
+                df.at[i, 'SUGGESTED WORDS'] = suggested_word
+            elif incorrect_word not in df.at[i, 'INCORRECT WORDS']:
+                df.at[i, 'INCORRECT WORDS'] = df.at[i, 'INCORRECT WORDS'] + ', ' + incorrect_word
+                df.at[i, 'SUGGESTED WORDS'] = df.at[i, 'SUGGESTED WORDS'] + ', ' + suggested_word
+
+def index_based_mapping(phrases, misspellings):
+    row_index = RowIndex(phrases)
+    row_misspellings = {}
+    loop_start = time.perf_counter()
+    for incorrect_phrase, incorrect_word, suggested_word in misspellings:
+        record_misspelling(row_index, row_misspellings, incorrect_phrase, incorrect_word, suggested_word)
+    return time.perf_counter() - loop_start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [10000, 100000, 1000000])
+    parser.add_argument('--misspellings', type = int, default = 200)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'scan loop (s)':>14} {'index build (s)':>16} {'index loop (s)':>15} {'per misspelling (us)':>21}")
+    for size in args.sizes:
+        phrases = make_phrases(size)
+        # Distinct misspelled words, each shared by the ~10 rows of its item
+        misspellings = [(phrase, phrase.split()[-1], phrase.split()[-1].upper()) for phrase in random.Random(1).sample(phrases, args.misspellings)]
+
+        df = pd.DataFrame({'ID': range(size), 'ACTUAL WORDS': phrases})
+        start = time.perf_counter()
+        scan_based_mapping(df, misspellings)
+        scan_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        loop_time = index_based_mapping(phrases, misspellings)
+        build_time = time.perf_counter() - start - loop_time
+
+        print(f'{size:>10} {scan_time:>14.3f} {build_time:>16.3f} {loop_time:>15.5f} {loop_time / args.misspellings * 1e6:>21.2f}')
+
+
+if __name__ == '__main__':
+    main()
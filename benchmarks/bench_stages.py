@@ -0,0 +1,98 @@
+# Times every stage of a /spell-check/file request separately, using in-process fakes instead of Google.
+# Results are appended to benchmarks/results/stage_timings.jsonl together with the current commit.
+# Usage: python -m benchmarks.bench_stages [--sizes 10000 100000] [--compare]
+import argparse
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+
+import pandas as pd
+from app.core.schema.spell_check_schema import SpellCheckResponse
+from app.core.service import google_spell_check
+from app.core.service.google_spell_check import fill_google_sheet, mark_bad_words_from_file
+from app.core.service.input_file import read_input_file
+from app.core.service.sheets_session import SheetsSession
+from app.core.service.spell_check_backend import FakeSpellCheckBackend
+from app.core.service.spell_check_results import build_incorrect_words
+
+from benchmarks.fake_sheets import fake_authorize
+
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), 'results', 'stage_timings.jsonl')
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet']
+MISSPELLED_WORDS = {'alpah': 'alpha', 'bravvo': 'bravo', 'delat': 'delta'}
+
+
+def make_df(size, seed = 0):
+    rng = random.Random(seed)
+    vocabulary = WORDS + list(MISSPELLED_WORDS)
+    # Roughly 10x duplication, as in product-catalog exports
+    phrases = [' '.join(rng.choice(vocabulary) for _ in range(5)) for _ in range(max(1, size // 10))]
+    return pd.DataFrame({'ID': range(size), 'ACTUAL WORDS': [rng.choice(phrases) for _ in range(size)]})
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def run_stages(size):
+    timings = {}
+    df = make_df(size)
+    with tempfile.TemporaryDirectory() as folder:
+        file_path = os.path.join(folder, 'input.csv')
+        df.to_csv(file_path, index = False)
+        df, timings['file_load'] = timed(read_input_file, file_path)
+
+    session = SheetsSession('Input Sheet', authorize = fake_authorize())
+    google_spell_check.get_sheets_session = lambda sheet_name = None: session
+    _, timings['sheet_fill'] = timed(fill_google_sheet, df.copy())
+
+    unique_df = pd.DataFrame({'ID': range(df['ACTUAL WORDS'].nunique()), 'ACTUAL WORDS': df['ACTUAL WORDS'].unique()})
+    (unique_df, _), timings['misspelling_mapping'] = timed(FakeSpellCheckBackend(MISSPELLED_WORDS).check, unique_df)
+    results = unique_df.set_index('ACTUAL WORDS')[['INCORRECT WORDS', 'SUGGESTED WORDS', 'DESCRIPTION']]
+    df[results.columns] = results.loc[df['ACTUAL WORDS']].values
+
+    df, timings['blacklist_marking'] = timed(mark_bad_words_from_file, df)
+    _, timings['response'] = timed(lambda df: SpellCheckResponse(incorrect_words = build_incorrect_words(df)), df)
+    return timings
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text = True).strip()
+    except Exception:
+        return 'unknown'
+
+def previous_timings(commit):
+    if not os.path.exists(RESULTS_PATH):
+        return {}
+    with open(RESULTS_PATH, 'r') as f:
+        records = [json.loads(i) for i in f if i.strip()]
+    other_commits = [i for i in records if i['commit'] != commit]
+    if not other_commits:
+        return {}
+    last_commit = other_commits[-1]['commit']
+    return {(i['stage'], i['rows']): i['seconds'] for i in other_commits if i['commit'] == last_commit}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [10000, 100000])
+    parser.add_argument('--compare', action = 'store_true', help = 'Compare with the latest recorded run of another commit')
+    args = parser.parse_args()
+
+    commit = current_commit()
+    previous = previous_timings(commit) if args.compare else {}
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok = True)
+    print(f"{'stage':<20} {'rows':>9} {'seconds':>9} {'previous':>9}")
+    with open(RESULTS_PATH, 'a') as f:
+        for size in args.sizes:
+            for stage, seconds in run_stages(size).items():
+                before = previous.get((stage, size))
+                before = f'{before:.3f}' if before is not None else '-'
+                print(f'{stage:<20} {size:>9} {seconds:>9.3f} {before:>9}')
+                f.write(json.dumps({'commit': commit, 'timestamp': time.time(), 'stage': stage, 'rows': size, 'seconds': seconds}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Measures reloading and looking up word lists against the previous import-time set.
+# Usage: python -m benchmarks.bench_word_lists [--entries 1000000] [--lookups 200000]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from app.core.service.word_lists import WordList, normalize_word
+
+
+def make_entries(size, seed = 0):
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(4, 12))) + str(i) for i in range(size)]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type = int, default = 1000000)
+    parser.add_argument('--lookups', type = int, default = 200000)
+    args = parser.parse_args()
+
+    entries = make_entries(args.entries)
+    rng = random.Random(1)
+    lookups = [rng.choice(entries).upper() if i % 2 else f'missing{i}' for i in range(args.lookups)]
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'whitelist_words.txt')
+        with open(path, 'w') as f:
+            f.write('\n'.join(entries) + '\n')
+
+        start = time.perf_counter()
+        with open(path, 'r') as f:
+            words = set([i.strip('\n') for i in f.readlines()])
+        print(f'Import-time set:     loaded in {time.perf_counter() - start:.3f} s, {sys.getsizeof(words) / 1e6:.1f} MB of set table per worker')
+
+        start = time.perf_counter()
+        word_list = WordList(path, os.path.join(folder, 'index'))
+        word_list.words()
+        print(f'Cold reload:         {time.perf_counter() - start:.3f} s (parse, sort and write the shared index)')
+
+        start = time.perf_counter()
+        WordList(path, os.path.join(folder, 'index')).words()
+        print(f'Other worker reload: {time.perf_counter() - start:.3f} s (hash the file and map the existing index)')
+        index_size = sum(os.path.getsize(os.path.join(folder, 'index', i)) for i in os.listdir(os.path.join(folder, 'index')))
+        print(f'Shared index:        {index_size / 1e6:.1f} MB, mapped once for every worker\n')
+
+        start = time.perf_counter()
+        set_hits = sum(i in words for i in lookups)
+        set_time = time.perf_counter() - start
+        start = time.perf_counter()
+        normalized_hits = sum(normalize_word(i) in words for i in lookups)
+        normalized_set_time = time.perf_counter() - start
+        start = time.perf_counter()
+        hits = sum(word_list.matches(i) for i in lookups)
+        word_list_time = time.perf_counter() - start
+
+        print(f"{'lookup':<28} {'hits':>8} {'lookups/s':>12}")
+        print(f"{'set, exact':<28} {set_hits:>8} {len(lookups) / set_time:>12,.0f}")
+        print(f"{'set, normalized':<28} {normalized_hits:>8} {len(lookups) / normalized_set_time:>12,.0f}")
+        print(f"{'word list, normalized':<28} {hits:>8} {len(lookups) / word_list_time:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
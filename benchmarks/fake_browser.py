@@ -0,0 +1,116 @@
+import itertools
+import re
+import time
+import zlib
+
+from app.core.service.google_spell_check import READ_CELL_SCRIPT
+from app.core.service.verdict_cache import split_tokens
+
+
+# Local stand-in for the parts of the Selenium WebDriver used by the Google Sheets spell-check. Pages are worksheets of
+# a FakeSheetsClient, whose spell-check dialog stops on every word chosen as misspelled by misspelled()
+def misspelled(word, rate):
+    # Same verdict for a word in every process and run, a share rate of distinct words is misspelled
+    return zlib.crc32(word.lower().encode('utf-8')) % 10000 < rate * 10000
+
+
+class FakeElement:
+
+    def click(self):
+        pass
+
+
+class FakeBrowser:
+
+    def __init__(self, client, misspelling_rate = 0.05, page_latency = 0.0, dialog_latency = 0.0):
+        # page_latency is spent loading a worksheet and dialog_latency in every round trip to the spell-check dialog
+        self.client = client
+        self.misspelling_rate = misspelling_rate
+        self.page_latency = page_latency
+        self.dialog_latency = dialog_latency
+        self.current_url = 'data:,'
+        self.title = 'New Tab'
+        self.wks = None
+        self.misspellings = []
+        self.position = 0
+        self.ignored = set()
+
+    def get(self, url):
+        if self.page_latency:
+            time.sleep(self.page_latency)
+        self.current_url = url
+        self.wks = self.client.worksheet_by_url(url)
+        self.title = 'Input Sheet - Google Sheets' if self.wks is not None else 'Page'
+
+    def find_element(self, by = None, value = None):
+        return FakeElement()
+
+    def execute(self, command, params = None):
+        # Keyboard and mouse actions, e.g. opening the spell-check dialog through the Tools menu
+        return {'value': None}
+
+    def set_script_timeout(self, seconds):
+        pass
+
+    def execute_script(self, script, *args):
+        if script == READ_CELL_SCRIPT:
+            return self.read_cell(args[0])
+        # Reading the dialog state for the first time starts a spell-check of the values now in the worksheet
+        cells = sorted(((col, row), value) for (row, col), value in self.wks.cells.items() if row > 1) if self.wks is not None else []
+        self.misspellings = [(value, token, token[::-1]) for _, value in cells for token in split_tokens(value)
+                             if misspelled(token, self.misspelling_rate)]
+        self.position = 0
+        self.ignored = set()
+        return self._state()
+
+    def read_cell(self, label):
+        # Value of a cell labelled like "B12", as the formula bar shows it
+        letters, row = re.fullmatch(r'([A-Z]+)(\d+)', label).groups()
+        col = 0
+        for letter in letters:
+            col = 26 * col + ord(letter) - ord('A') + 1
+        return self.wks.cells.get((int(row), col), '') if self.wks is not None else None
+
+    def execute_async_script(self, script, previous, ignore, timeout):
+        if self.dialog_latency:
+            time.sleep(self.dialog_latency)
+        if ignore and self.position < len(self.misspellings):
+            if ignore == 'ignore_all':
+                self.ignored.add(self.misspellings[self.position][1])
+            self.position += 1
+        # "Ignore all" skips the word everywhere after the current cell
+        self.position = next((i for i in itertools.count(self.position)
+                              if i >= len(self.misspellings) or self.misspellings[i][1] not in self.ignored))
+        return self._state()
+
+    def _state(self):
+        if self.position >= len(self.misspellings):
+            return {'phrase': '', 'word': '', 'suggestion': '', 'ignore_visible': False, 'done': True}
+        phrase, word, suggestion = self.misspellings[self.position]
+        return {'phrase': phrase, 'word': word, 'suggestion': suggestion, 'ignore_visible': True, 'done': False}
+
+    def quit(self):
+        pass
+
+
+class FakeBrowserSession:
+    # Pooled session around a FakeBrowser, in place of BrowserSession
+
+    def __init__(self, worksheet_index, browser_factory):
+        self.worksheet_index = worksheet_index
+        self.browser_factory = browser_factory
+        self.browser = browser_factory()
+        self.google_logged_in = True
+
+    def is_browser_reachable(self):
+        return True
+
+    def google_login(self):
+        return True
+
+    def restart(self):
+        self.browser = self.browser_factory()
+        return self.browser
+
+    def kill_stale_drivers(self):
+        pass
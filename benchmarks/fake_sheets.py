@@ -0,0 +1,101 @@
+import threading
+import time
+from urllib.parse import quote
+
+
+# Local stand-in for the parts of the pygsheets client used by the Sheets session
+class FakeWorksheet:
+
+    def __init__(self, spreadsheet, index, title = 'Sheet1'):
+        self.spreadsheet = spreadsheet
+        self.index = index
+        self.title = title
+        self.rows = 1000
+        self.cols = 26
+        self.cells = {}
+        self.url = f'https://docs.google.com/spreadsheets/d/{quote(spreadsheet.title)}/edit#gid={index}'
+
+    def clear(self, start = 'A1', end = None):
+        self.spreadsheet.client.record('clear', self.index)
+        first_row, first_col = (1, 1) if start == 'A1' else start
+        last_row, last_col = end or (self.rows, self.cols)
+        for row, col in list(self.cells):
+            if first_row <= row <= last_row and first_col <= col <= last_col:
+                del self.cells[(row, col)]
+
+    def resize(self, rows = None, cols = None):
+        self.spreadsheet.client.record('resize', self.index)
+        self.rows = rows or self.rows
+        self.cols = cols or self.cols
+        self.cells = {k: v for k, v in self.cells.items() if k[0] <= self.rows and k[1] <= self.cols}
+
+    def update_values(self, crange, values, majordim = 'ROWS'):
+        self.spreadsheet.client.record('update_values', self.index)
+        row, col = crange
+        if majordim == 'ROWS':
+            values = [list(i) for i in zip(*values)]
+        for i, column in enumerate(values):
+            if row + len(column) - 1 > self.rows or col + i > self.cols:
+                raise ValueError('Range exceeds grid limits')
+            for j, value in enumerate(column):
+                self.cells[(row + j, col + i)] = str(value)
+
+    def column(self, col):
+        return [self.cells.get((i, col), '') for i in range(1, self.rows + 1)]
+
+
+class FakeSpreadsheet:
+
+    def __init__(self, client, title = 'fake'):
+        self.client = client
+        self.title = title
+        self._worksheets = [FakeWorksheet(self, 0)]
+
+    def worksheets(self):
+        return self._worksheets
+
+    def fetch_properties(self):
+        self.client.record('fetch', None)
+
+    def add_worksheet(self, title, **kwargs):
+        self.client.record('add_worksheet', len(self._worksheets))
+        self._worksheets.append(FakeWorksheet(self, len(self._worksheets), title))
+        return self._worksheets[-1]
+
+    def __getitem__(self, index):
+        return self._worksheets[index]
+
+
+class FakeSheetsClient:
+
+    def __init__(self, latency = 0.0):
+        # latency: seconds spent in every API call, as a round trip to Google would
+        self.latency = latency
+        self.spreadsheets = {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def record(self, call, index):
+        self.calls.append((call, index))
+        if self.latency:
+            time.sleep(self.latency)
+
+    def open(self, title):
+        self.record('open', None)
+        with self._lock:
+            if title not in self.spreadsheets:
+                self.spreadsheets[title] = FakeSpreadsheet(self, title)
+            return self.spreadsheets[title]
+
+    def worksheet_by_url(self, url):
+        for spreadsheet in list(self.spreadsheets.values()):
+            for wks in spreadsheet.worksheets():
+                if wks.url == url:
+                    return wks
+        return None
+
+
+def fake_authorize(client = None):
+    client = client or FakeSheetsClient()
+    # Every credential reaches the same spreadsheets, as service accounts they are shared with would
+    return lambda credential = None, **kwargs: client
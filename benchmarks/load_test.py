@@ -0,0 +1,199 @@
+# Drives the spell-check APIs of uvicorn workers over HTTP at a given concurrency, with Google Sheets and Chrome replaced
+# by local stand-ins with configurable latencies and misspelling rates. Reports throughput, latency percentiles and the
+# peak RSS of the server processes, and appends them to benchmarks/results/load_test.jsonl with the current commit.
+# Usage: python -m benchmarks.load_test [--workers 1 2 4] [--concurrency 32] [--requests 500] [--endpoints word words file]
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import requests
+
+from app.core.models.browser import get_browser_pool
+from app.core.service import sheets_session
+from app.core.service.sheets_session import SheetsSession
+from app.core.service.worker_lease import process_tree
+from benchmarks.bench_stages import current_commit
+from benchmarks.fake_browser import FakeBrowser, FakeBrowserSession
+from benchmarks.fake_sheets import FakeSheetsClient, fake_authorize
+
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), 'results', 'load_test.jsonl')
+FILE_NAME = 'load_test.csv'
+ENDPOINTS = ('word', 'words', 'file')
+
+
+def install_fakes(misspelling_rate = 0.05, sheets_latency = 0.0, page_latency = 0.0, dialog_latency = 0.0, setattr = setattr):
+    # Replaces the Sheets client and the pooled Chrome sessions of this process. setattr may be monkeypatch.setattr
+    client = FakeSheetsClient(latency = sheets_latency)
+
+    @lru_cache()
+    def fake_sheets_session(sheet_name):
+        return SheetsSession(sheet_name, authorize = fake_authorize(client), max_cells_per_write = sheets_session.config.SHEETS_MAX_CELLS_PER_WRITE)
+
+    def browser_factory():
+        return FakeBrowser(client, misspelling_rate, page_latency, dialog_latency)
+
+    setattr(sheets_session, '_get_sheets_session', fake_sheets_session)
+    setattr(get_browser_pool(), 'session_factory', lambda worksheet_index: FakeBrowserSession(worksheet_index, browser_factory))
+    return client
+
+def install_fakes_from_env():
+    # Settings of the stand-ins for uvicorn workers, which are started in their own processes
+    return install_fakes(float(os.environ.get('LOAD_TEST_MISSPELLING_RATE', 0.05)), float(os.environ.get('LOAD_TEST_SHEETS_LATENCY', 0)),
+                         float(os.environ.get('LOAD_TEST_PAGE_LATENCY', 0)), float(os.environ.get('LOAD_TEST_DIALOG_LATENCY', 0)))
+
+
+def make_vocabulary(size = 2000, seed = 0):
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return sorted({''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)})
+
+def write_input_file(folder, rows, vocabulary, seed = 0):
+    rng = random.Random(seed)
+    phrases = [' '.join(rng.choices(vocabulary, k = rng.randint(2, 8))) for _ in range(rows)]
+    os.makedirs(folder, exist_ok = True)
+    pd.DataFrame({'ID': range(rows), 'ACTUAL WORDS': phrases}).to_csv(os.path.join(folder, FILE_NAME), index = False)
+
+def request_factory(endpoint, vocabulary, list_size = 20, seed = 0):
+    # Returns a callable(session, base_url) sending one request to endpoint
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def words(k):
+        with lock:
+            return rng.choices(vocabulary, k = k)
+    if endpoint == 'word':
+        return lambda session, base_url: session.get(f'{base_url}/spell-check/words/{words(1)[0]}')
+    if endpoint == 'words':
+        return lambda session, base_url: session.get(f'{base_url}/spell-check/words', params = {'word_list': words(list_size)})
+    if endpoint == 'file':
+        return lambda session, base_url: session.get(f'{base_url}/spell-check/file', params = {'file_name': FILE_NAME})
+    raise ValueError(f"Unknown endpoint '{endpoint}', use one of {', '.join(ENDPOINTS)}")
+
+def run_requests(send, base_url = '', requests_count = 100, concurrency = 8, session_factory = requests.Session):
+    # Sends requests_count requests from concurrency threads, each with its own session
+    sessions = threading.local()
+    latencies, errors = [], []
+
+    def send_one(_):
+        session = getattr(sessions, 'session', None)
+        if session is None:
+            session = sessions.session = session_factory()
+        start = time.perf_counter()
+        try:
+            response = send(session, base_url)
+            ok = response.status_code == 200
+        except Exception:
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        if not ok:
+            errors.append(1)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = concurrency) as executor:
+        list(executor.map(send_one, range(requests_count)))
+    seconds = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99]) if latencies else (0, 0, 0)
+    return {'requests': requests_count, 'errors': len(errors), 'seconds': seconds, 'throughput': requests_count / seconds,
+            'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+
+def peak_rss_mb(pid):
+    # Sum of the peak resident set sizes of pid and its children (the uvicorn workers), where /proc is available
+    total = 0
+    for i in process_tree(pid):
+        try:
+            with open(f'/proc/{i}/status', 'r') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+        except (OSError, StopIteration):
+            continue
+    return total / 1024 if total else None
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(workers, folder, args):
+    port = free_port()
+    env = dict(os.environ,
+               LOAD_TEST_MISSPELLING_RATE = str(args.misspelling_rate), LOAD_TEST_SHEETS_LATENCY = str(args.sheets_latency),
+               LOAD_TEST_PAGE_LATENCY = str(args.page_latency), LOAD_TEST_DIALOG_LATENCY = str(args.dialog_latency),
+               BROWSER_POOL_SIZE = str(args.pool_size), UPLOAD_FOLDER = os.path.join(folder, 'uploads'),
+               UPLOAD_INDEX_PATH = os.path.join(folder, 'upload_index.json'), RESULTS_FOLDER = os.path.join(folder, 'results'),
+               WORKER_LEASE_FOLDER = os.path.join(folder, 'leases'), TRACES_FOLDER = os.path.join(folder, 'traces'),
+               SHEETS_QUOTA_STATE_PATH = os.path.join(folder, 'leases', 'sheets_quota.json'),
+               VERDICT_CACHE_ENABLED = str(args.verdict_cache).lower(), VERDICT_CACHE_PATH = os.path.join(folder, 'verdict_cache.sqlite3'),
+               RESULT_STORE_ENABLED = 'false', SYMSPELL_DICTIONARY_PATH = os.path.join(folder, 'no_dictionary.txt'),
+               BLACKLIST_PATH = os.path.join(folder, 'blacklist_words.txt'), WHITELIST_PATH = os.path.join(folder, 'whitelist_words.txt'),
+               WORD_LIST_INDEX_FOLDER = os.path.join(folder, 'word_lists'), BROWSER_WARM_START = 'false', LOG_LEVEL = 'WARNING')
+    process = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'benchmarks.load_test_app:app', '--port', str(port),
+                                '--workers', str(workers), '--log-level', 'warning', '--no-access-log'], env = env)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{base_url}/metrics', timeout = 1).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('Server did not start within 60 seconds')
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout = 30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type = int, nargs = '+', default = [1, 2])
+    parser.add_argument('--concurrency', type = int, default = 32)
+    parser.add_argument('--requests', type = int, default = 500, help = 'Requests per endpoint, /spell-check/file gets a tenth of them')
+    parser.add_argument('--endpoints', nargs = '+', default = list(ENDPOINTS), choices = ENDPOINTS)
+    parser.add_argument('--list-size', type = int, default = 20)
+    parser.add_argument('--file-rows', type = int, default = 5000)
+    parser.add_argument('--pool-size', type = int, default = 1, help = 'BROWSER_POOL_SIZE of every worker')
+    parser.add_argument('--misspelling-rate', type = float, default = 0.05, help = 'Share of distinct words flagged by the stand-in')
+    parser.add_argument('--sheets-latency', type = float, default = 0.05, help = 'Seconds per Sheets API call')
+    parser.add_argument('--page-latency', type = float, default = 0.2, help = 'Seconds to load a worksheet in the browser')
+    parser.add_argument('--dialog-latency', type = float, default = 0.005, help = 'Seconds per round trip to the spell-check dialog')
+    parser.add_argument('--verdict-cache', action = 'store_true', help = 'Keep the verdict cache enabled, repeated words are then answered from it')
+    args = parser.parse_args()
+
+    commit = current_commit()
+    vocabulary = make_vocabulary()
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok = True)
+    print(f"{'workers':>7} {'endpoint':<8} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12}")
+    with open(RESULTS_PATH, 'a') as results:
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as folder:
+                write_input_file(os.path.join(folder, 'uploads'), args.file_rows, vocabulary)
+                process, base_url = start_server(workers, folder, args)
+                try:
+                    for endpoint in args.endpoints:
+                        count = max(1, args.requests // 10) if endpoint == 'file' else args.requests
+                        report = run_requests(request_factory(endpoint, vocabulary, args.list_size), base_url, count, args.concurrency)
+                        report.update(peak_rss_mb = peak_rss_mb(process.pid), workers = workers, endpoint = endpoint, concurrency = args.concurrency)
+                        rss = f"{report['peak_rss_mb']:.0f}" if report['peak_rss_mb'] is not None else '-'
+                        print(f"{workers:>7} {endpoint:<8} {count:>8} {report['errors']:>6} {report['throughput']:>8.1f} "
+                              f"{report['p50_ms']:>9.1f} {report['p95_ms']:>9.1f} {report['p99_ms']:>9.1f} {rss:>12}")
+                        results.write(json.dumps(dict(report, commit = commit, timestamp = time.time(), settings = vars(args))) + '\n')
+                finally:
+                    stop_server(process)
+
+
+if __name__ == '__main__':
+    main()
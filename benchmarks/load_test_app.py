@@ -0,0 +1,5 @@
+# uvicorn target of benchmarks.load_test: the app, with Google Sheets and Chrome replaced by local stand-ins in every worker
+from app import app # noqa: F401
+from benchmarks.load_test import install_fakes_from_env
+
+install_fakes_from_env()
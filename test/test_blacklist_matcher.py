@@ -0,0 +1,23 @@
+import pandas as pd
+from app.core.service.blacklist_matcher import BlacklistMatcher
+
+
+def make_df(texts, incorrect_words = None, description = None):
+    df = pd.DataFrame({'ID': range(len(texts)), 'ACTUAL WORDS': texts})
+    df['INCORRECT WORDS'] = incorrect_words or [''] * len(texts)
+    df['SUGGESTED WORDS'] = ''
+    df['DESCRIPTION'] = description or [''] * len(texts)
+    return df
+
+def test_matches_punctuation_adjacent_tokens_and_phrases():
+    matcher = BlacklistMatcher({'darn', 'heck', 'bad phrase'})
+    assert matcher.find(['Oh darn, what the heck!', 'a bad phrase here', 'bad and phrase', '']) == {
+        0: ['darn', 'heck'],
+        1: ['bad phrase'],
+    }
+
+def test_mark_keeps_previous_output_format():
+    matcher = BlacklistMatcher({'darn', 'heck'})
+    df = matcher.mark(make_df(['darn it', 'teh heck', 'fine'], incorrect_words = ['', 'teh', ''], description = ['', '', '']))
+    assert df['INCORRECT WORDS'].tolist() == ['darn', 'teh, heck', '']
+    assert df['DESCRIPTION'].tolist() == ['darn marked using black-listed words', 'heck marked using black-listed words', '']
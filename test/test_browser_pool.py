@@ -0,0 +1,186 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+from app.core.models import browser
+from app.core.models.browser import BrowserPool
+from app.core.service import google_spell_check
+from benchmarks.fake_browser import FakeBrowser
+from benchmarks.fake_sheets import FakeSheetsClient
+
+
+class FakeSession:
+
+    def __init__(self, worksheet_index):
+        self.worksheet_index = worksheet_index
+        self.browser = object()
+        self.google_logged_in = True
+        self.reachable = True
+
+    def is_browser_reachable(self):
+        return self.reachable
+
+    def restart(self):
+        self.browser = object()
+        return self.browser
+
+
+def test_sessions_are_created_lazily_and_reused():
+    pool = BrowserPool(size = 2, session_factory = FakeSession)
+    first = pool.checkout()
+    second = pool.checkout()
+    assert (first.worksheet_index, second.worksheet_index) == (0, 1)
+    with pytest.raises(TimeoutError):
+        pool.checkout(timeout = 0.01)
+    pool.checkin(second)
+    assert pool.checkout() is second
+
+def test_dead_sessions_are_replaced_on_checkout():
+    pool = BrowserPool(size = 1, session_factory = FakeSession)
+    with pool.session() as session:
+        session.reachable = False
+    replacement = pool.checkout()
+    assert replacement is not session
+    assert replacement.worksheet_index == 0
+
+def test_failed_replacement_keeps_the_worksheet_of_every_live_session():
+    failing = []
+    def session_factory(worksheet_index):
+        if worksheet_index in failing:
+            raise RuntimeError('Chrome did not start')
+        return FakeSession(worksheet_index)
+    pool = BrowserPool(size = 2, session_factory = session_factory)
+    first, second = pool.checkout(), pool.checkout()
+    first.reachable = False
+    pool.checkin(first)
+    failing.append(0)
+    with pytest.raises(RuntimeError):
+        pool.checkout()
+
+    # The dead session's worksheet is created again, never the one of the session still in use
+    failing.clear()
+    replacement = pool.checkout()
+    assert (replacement.worksheet_index, second.worksheet_index) == (0, 1)
+    with pytest.raises(TimeoutError):
+        pool.checkout(timeout = 0.01)
+
+def test_large_inputs_are_sharded_across_sessions(tmp_path, monkeypatch):
+    monkeypatch.setattr(google_spell_check.config, 'BROWSER_POOL_MIN_SHARD_SIZE', 2)
+    monkeypatch.setattr(google_spell_check.config, 'VERDICT_CACHE_ENABLED', False)
+    monkeypatch.setattr(google_spell_check, 'get_symspell_index', lambda: None)
+    worksheets = []
+    def fake_google_spell_check(df, browser, worksheet_index = 0, progress = None, recover = None):
+        worksheets.append((worksheet_index, df.iloc[:, 1].tolist()))
+        df['INCORRECT WORDS'] = df.iloc[:, 1].str.split().str[0]
+        df['SUGGESTED WORDS'] = ''
+        df['DESCRIPTION'] = ''
+        return df, {}
+    monkeypatch.setattr(google_spell_check, 'run_google_spell_check', fake_google_spell_check)
+
+    df = pd.DataFrame({'ID': range(6), 'ACTUAL WORDS': ['a x', 'b x', 'c x', 'd x', 'e x', 'a x']})
+    df = google_spell_check.run_spell_check(df, pool = BrowserPool(size = 3, session_factory = FakeSession))
+    assert len(worksheets) == 2
+    assert sorted(sum((i for _, i in worksheets), [])) == ['a x', 'b x', 'c x', 'd x', 'e x']
+    assert df['INCORRECT WORDS'].tolist() == ['a', 'b', 'c', 'd', 'e', 'a']
+
+def test_warm_starts_every_session_and_keepalive_replaces_dead_ones():
+    pool = BrowserPool(size = 2, session_factory = FakeSession)
+    prepared = []
+    assert pool.warm(lambda session: prepared.append(session.worksheet_index)) == 2
+    assert prepared == [0, 1]
+    assert pool.warm() == 0
+
+    session = pool.checkout()
+    session.reachable = False
+    pool.checkin(session)
+    pool.keepalive(lambda session: prepared.append(session.worksheet_index))
+    sessions = [pool.checkout(), pool.checkout()]
+    assert session not in sessions
+    assert sorted(i.worksheet_index for i in sessions) == [0, 1]
+    # The replacement opened its worksheet as the warm start did
+    assert prepared == [0, 1, session.worksheet_index]
+
+def test_keepalive_pings_one_session_at_a_time():
+    pinging, release = threading.Event(), threading.Event()
+    class HangingSession(FakeSession):
+        def is_browser_reachable(self):
+            if self.worksheet_index == 0:
+                pinging.set()
+                release.wait(5)
+            return True
+    pool = BrowserPool(size = 2, session_factory = HangingSession)
+    pool.warm()
+    pinged = []
+    keepalive = threading.Thread(target = pool.keepalive)
+    keepalive.start()
+    try:
+        assert pinging.wait(5)
+        # The session of worksheet 1 stays available while Chrome of worksheet 0 does not answer
+        with pool.session(timeout = 1) as session:
+            pinged.append(session.worksheet_index)
+    finally:
+        release.set()
+        keepalive.join(5)
+    assert pinged == [1]
+    assert sorted(pool.checkout(timeout = 1).worksheet_index for _ in range(2)) == [0, 1]
+
+def test_failed_logins_are_not_retried_on_every_checkout(monkeypatch):
+    monkeypatch.setattr(browser.config, 'BROWSER_LOGIN_RETRY_SECONDS', 300)
+    logins = []
+    class LoggedOutSession(FakeSession):
+        def google_login(self):
+            logins.append(self.worksheet_index)
+            self.login_attempted_at = time.monotonic()
+            return False
+    pool = BrowserPool(size = 1, session_factory = LoggedOutSession)
+    for _ in range(3):
+        with pool.session() as session:
+            session.google_logged_in = False
+    assert logins == [0]
+
+def test_chromedriver_path_is_resolved_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(browser.config, 'CHROMEDRIVER_PATH', '')
+    monkeypatch.setattr(browser.config, 'CHROMEDRIVER_CACHE_PATH', str(tmp_path / 'chromedriver_path.txt'))
+    driver = tmp_path / 'chromedriver'
+    driver.write_text('')
+    installs = []
+    monkeypatch.setattr(browser.chromedriver_autoinstaller, 'install', lambda: installs.append(1) or str(driver))
+    browser._resolve_chromedriver.cache_clear()
+    try:
+        assert browser.resolve_chromedriver() == str(driver)
+        assert browser.resolve_chromedriver() == str(driver)
+        # A later process reads the remembered path
+        browser._resolve_chromedriver.cache_clear()
+        assert browser.resolve_chromedriver() == str(driver)
+        assert len(installs) == 1
+        assert browser.resolve_chromedriver(refresh = True) == str(driver)
+        assert len(installs) == 2
+    finally:
+        browser._resolve_chromedriver.cache_clear()
+
+def test_open_worksheet_is_not_reloaded():
+    url = 'https://docs.google.com/spreadsheets/d/abc/edit#gid=5'
+    assert google_spell_check.same_sheet_url('https://docs.google.com/spreadsheets/d/abc/edit?pli=1#gid=5', url)
+    assert not google_spell_check.same_sheet_url('https://docs.google.com/spreadsheets/d/abc/edit#gid=6', url)
+    assert not google_spell_check.same_sheet_url('data:,', url)
+
+def test_worksheet_left_open_is_reloaded_unless_it_shows_the_new_values(monkeypatch):
+    monkeypatch.setattr(google_spell_check.config, 'BROWSER_REUSE_SETTLE_MS', 100)
+    client = FakeSheetsClient()
+    wks = client.open('Input Sheet')[0]
+    fake_browser = FakeBrowser(client)
+    fake_browser.get(wks.url)
+    loads = []
+    get = fake_browser.get
+    fake_browser.get = lambda url: loads.append(url) or get(url)
+    wks.update_values((1, 1), [['ACTUAL WORDS', 'teh', 'a dog']], majordim = 'COLUMNS')
+    phrases = ['x', 'teh', 'a dog']
+    last_cell = google_spell_check.last_written_cell(google_spell_check.SheetShard('Input Sheet', 0, 1, 3, wks), phrases)
+    assert last_cell == ('A3', 'a dog')
+
+    assert google_spell_check.open_spell_check_dialog(fake_browser, wks, last_cell = last_cell)
+    assert loads == []
+    # The grid still shows the values of the last check
+    assert google_spell_check.open_spell_check_dialog(fake_browser, wks, last_cell = ('A3', 'a cat'))
+    assert loads == [wks.url]
@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import threading
+import time
+
+import pytest
+from app.controllers import file_input_router
+from app.core.service import uploads
+from starlette.testclient import TestClient
+from app import app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    (tmp_path / 'uploads').mkdir()
+    monkeypatch.setattr(uploads.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(uploads.config, 'UPLOAD_PARTIAL_FOLDER', str(tmp_path / 'partial'))
+    monkeypatch.setattr(uploads.config, 'UPLOAD_INDEX_PATH', str(tmp_path / 'upload_index.json'))
+    monkeypatch.setattr(uploads.config, 'FILE_WRITE_BUFFER_SIZE', 4)
+    uploads.get_upload_index.cache_clear()
+    uploads.get_resumable_uploads.cache_clear()
+    yield TestClient(app)
+    uploads.get_upload_index.cache_clear()
+    uploads.get_resumable_uploads.cache_clear()
+
+def test_upload_is_hashed_while_written_and_duplicates_are_recognized(client, tmp_path):
+    content = b'ID,TEXT\n0,teh cat\n1,a dog\n'
+    response = client.post('/file-input/upload', files = {'file': ('first.csv', content)}).json()
+    assert response['file_hash'] == hashlib.sha256(content).hexdigest()
+    assert response['size_bytes'] == len(content)
+    assert 'duplicate_of' not in response
+    assert (tmp_path / 'uploads' / 'first.csv').read_bytes() == content
+    assert list((tmp_path / 'partial').iterdir()) == []
+
+    response = client.post('/file-input/upload', files = {'file': ('second.csv', content)}).json()
+    assert response['duplicate_of'] == 'first.csv'
+    assert uploads.get_upload_index().hash_of('second.csv', str(tmp_path / 'uploads' / 'second.csv')) == response['file_hash']
+
+def test_resumable_upload_continues_from_received_offset(client, tmp_path):
+    content = b'teh\nok\nfine\n'
+    assert client.put('/file-input/upload/big.txt', params = {'offset': 0}, content = content[:5]).json()['offset'] == 5
+    # A chunk sent again after a lost response is rejected with the offset to continue from
+    response = client.put('/file-input/upload/big.txt', params = {'offset': 0}, content = content[:5])
+    assert response.status_code == 409
+    assert client.get('/file-input/upload/big.txt').json()['offset'] == 5
+    assert not (tmp_path / 'uploads' / 'big.txt').exists()
+
+    response = client.put('/file-input/upload/big.txt', params = {'offset': 5, 'complete': True}, content = content[5:]).json()
+    assert response['file_hash'] == hashlib.sha256(content).hexdigest()
+    assert response['size_bytes'] == len(content)
+    assert (tmp_path / 'uploads' / 'big.txt').read_bytes() == content
+    assert client.get('/file-input/upload/big.txt').json()['offset'] == 0
+
+    # An upload resumed without the in-memory hash, e.g. by another worker, is hashed once complete
+    client.put('/file-input/upload/other.txt', params = {'offset': 0}, content = content[:5])
+    uploads.get_resumable_uploads()._digests.clear()
+    response = client.put('/file-input/upload/other.txt', params = {'offset': 5, 'complete': True}, content = content[5:]).json()
+    assert response['file_hash'] == hashlib.sha256(content).hexdigest()
+    assert response['duplicate_of'] == 'big.txt'
+
+def test_duplicates_are_found_with_a_single_index_read(client, tmp_path, monkeypatch):
+    for i in range(5):
+        client.post('/file-input/upload', files = {'file': (f'{i}.csv', f'{i}\n'.encode())})
+    index = uploads.get_upload_index()
+    loads = []
+    load = index._load
+    monkeypatch.setattr(index, '_load', lambda: loads.append(1) or load())
+    assert index.duplicate_of('copy.csv', hashlib.sha256(b'4\n').hexdigest()) == '4.csv'
+    assert len(loads) == 1
+
+def test_appends_wait_for_the_upload_lock_of_other_processes(client, tmp_path):
+    resumable = uploads.get_resumable_uploads()
+    (tmp_path / 'partial').mkdir()
+    # Another worker process appending to the same upload holds its lock file
+    other = uploads.FileLock(str(tmp_path / 'partial' / 'big.txt.lock'))
+    assert other.acquire(blocking = False)
+    threading.Timer(0.3, other.release).start()
+    started = time.monotonic()
+    assert client.put('/file-input/upload/big.txt', params = {'offset': 0}, content = b'teh\n').json()['offset'] == 4
+    assert time.monotonic() - started >= 0.25
+    # Locks of uploads no request is appending to are dropped
+    assert resumable._locks == {}
+
+def test_upload_index_is_updated_outside_the_event_loop(client, monkeypatch):
+    index = uploads.get_upload_index()
+    add = index.add
+    event_loops = []
+    def recording_add(*args):
+        try:
+            event_loops.append(asyncio.get_running_loop())
+        except RuntimeError:
+            event_loops.append(None)
+        return add(*args)
+    monkeypatch.setattr(index, 'add', recording_add)
+    client.post('/file-input/upload', files = {'file': ('first.csv', b'teh\n')})
+    client.put('/file-input/upload/big.txt', params = {'offset': 0, 'complete': True}, content = b'teh\n')
+    assert event_loops == [None, None]
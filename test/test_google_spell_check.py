@@ -0,0 +1,151 @@
+import time
+
+import pandas as pd
+import pytest
+from app.core.service import dialog_watchdog, google_spell_check, spell_check_results
+from app.core.service.verdict_cache import Verdict, VerdictCache
+from app.core.service.word_lists import WordList
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = VerdictCache(str(tmp_path / 'cache.sqlite3'))
+    monkeypatch.setattr(google_spell_check, 'get_verdict_cache', lambda: cache)
+    monkeypatch.setattr(google_spell_check, 'get_symspell_index', lambda: None)
+    return cache
+
+def test_cached_rows_skip_google_sheets(cache, monkeypatch):
+    cache.set_many({'Hello': Verdict(), 'wrold': Verdict(('wrold',), ('world',))})
+    monkeypatch.setattr(google_spell_check, 'run_google_spell_check', fail_if_called)
+
+    df = pd.DataFrame({'ID': [1, 2], 'ACTUAL WORDS': ['Hello wrold', 'Hello']})
+    df = google_spell_check.run_spell_check(df, browser = None)
+    assert df['INCORRECT WORDS'].tolist() == ['wrold', '']
+    assert df['SUGGESTED WORDS'].tolist() == ['world', '']
+    assert (df.attrs['cache_hits'], df.attrs['cache_misses']) == (2, 0)
+
+def test_checked_rows_fill_the_cache(cache, monkeypatch):
+    def fake_google_spell_check(df, browser, worksheet_index = 0, progress = None):
+        df.loc[0, spell_check_results.RESULT_COLUMNS] = ['knwon', 'known', '']
+        return df, {'well-knwon fact': [('knwon', 'known')]}
+    monkeypatch.setattr(google_spell_check, 'run_google_spell_check', fake_google_spell_check)
+
+    df = pd.DataFrame({'ID': [1], 'ACTUAL WORDS': ['well-knwon fact']})
+    df = google_spell_check.run_spell_check(df, browser = None)
+    assert df['INCORRECT WORDS'].tolist() == ['knwon']
+    assert cache.get_many(['well-knwon', 'fact']) == {'well-knwon': Verdict(('knwon',), ('known',)), 'fact': Verdict()}
+
+def test_duplicate_phrases_are_checked_once(cache, monkeypatch):
+    checked_phrases = []
+    def fake_google_spell_check(df, browser, worksheet_index = 0, progress = None):
+        checked_phrases.extend(df.iloc[:, 1])
+        df.loc[df.iloc[:, 1] == 'teh cat', spell_check_results.RESULT_COLUMNS] = ['teh', 'the', '']
+        return df, {'teh cat': [('teh', 'the')]}
+    monkeypatch.setattr(google_spell_check, 'run_google_spell_check', fake_google_spell_check)
+
+    df = pd.DataFrame({'ID': [10, 11, 12, 13], 'ACTUAL WORDS': ['teh cat', 'a dog', 'teh cat', 'teh\r\ncat']})
+    df = google_spell_check.run_spell_check(df, browser = None)
+    assert sorted(checked_phrases) == ['a dog', 'teh cat']
+    assert df['ID'].tolist() == [10, 11, 12, 13]
+    assert df['INCORRECT WORDS'].tolist() == ['teh', '', 'teh', 'teh']
+
+def test_misspelling_is_applied_to_every_row_containing_the_word():
+    phrases = ['teh cat', ' teh cat ', 'a dog', 'teh-cat', 'tehcat', 'teh cat teh']
+    row_index = spell_check_results.RowIndex(phrases)
+    row_misspellings = {}
+    assert spell_check_results.record_misspelling(row_index, row_misspellings, 'teh cat', 'teh', 'the') == [0, 1, 3, 5]
+    assert row_misspellings[5] == [('teh', 'the')]
+    # Words Sheets reports which are not indexed fall back to the rows of the dialog cell
+    assert spell_check_results.record_misspelling(row_index, row_misspellings, 'tehcat', 'tehc', 'tech') == [4]
+    assert spell_check_results.record_misspelling(row_index, row_misspellings, 'a dog', 'do', 'dog') == [2]
+
+def test_fanned_out_misspellings_keep_phrase_order_and_whitelist_notes(tmp_path, monkeypatch):
+    (tmp_path / 'whitelist_words.txt').write_text('Acme\n')
+    whitelist = WordList(str(tmp_path / 'whitelist_words.txt'), str(tmp_path / 'index'))
+    monkeypatch.setattr(spell_check_results, 'get_whitelist', lambda: whitelist)
+    phrases = ['Acme teh dgo', 'dgo', 'Acme']
+    row_index = spell_check_results.RowIndex(phrases)
+    row_misspellings = {}
+    for phrase, word, suggestion in [('dgo', 'dgo', 'dog'), ('Acme teh dgo', 'teh', 'the'), ('Acme', 'Acme', 'Acne')]:
+        spell_check_results.record_misspelling(row_index, row_misspellings, phrase, word, suggestion)
+    df, _ = spell_check_results.write_results(pd.DataFrame({'ID': range(3), 'ACTUAL WORDS': phrases}), phrases, row_misspellings)
+    assert df['INCORRECT WORDS'].tolist() == ['teh, dgo', 'dgo', '']
+    assert df['DESCRIPTION'].tolist() == ['Acme found in white-listed words', '', 'Acme found in white-listed words']
+
+def test_progress_is_reported_in_input_rows():
+    reported = []
+    progress = spell_check_results.SpellCheckProgress(lambda *args: reported.append(args), [2, 1, 3, 1], processed_rows = 4, flagged_rows = 1)
+    progress.update(0, 1, [0])
+    progress.update(2, 1, [0])
+    assert reported == [(6, 3), (9, 6)]
+
+def fail_if_called(*args):
+    raise AssertionError('Google Sheets should not be used for cached rows')
+
+class FakeDialogBrowser:
+    # Spell-check dialog going through misspellings one "Ignore" at a time, with an empty word read after every press
+    def __init__(self, misspellings):
+        self.states = []
+        for phrase, word, suggestion in misspellings:
+            self.states += [self.state(phrase, '', ''), self.state(phrase, word, suggestion)]
+        self.states = self.states[1:] + [dict(self.state('', '', ''), done = True)]
+        self.position = 0
+        self.ignored = []
+
+    def state(self, phrase, word, suggestion):
+        return {'phrase': phrase, 'word': word, 'suggestion': suggestion, 'ignore_visible': True, 'done': False}
+
+    def set_script_timeout(self, seconds):
+        pass
+
+    def execute_script(self, script):
+        return self.states[self.position]
+
+    def execute_async_script(self, script, previous, ignore, timeout):
+        if ignore:
+            self.ignored.append(ignore)
+            self.position += 1
+        # The observer skips the intermediate state with an empty word
+        if self.states[self.position]['word'] == '' and not self.states[self.position]['done']:
+            self.position += 1
+        return self.states[self.position]
+
+def test_dialog_loop_takes_one_round_trip_per_misspelling():
+    phrases = ['teh cat', 'a dgo', 'teh cat teh']
+    browser = FakeDialogBrowser([('teh cat', 'teh', 'the'), ('a dgo', 'dgo', 'dog'), ('teh cat teh', 'teh', 'the'), ('teh cat teh', 'teh', 'the')])
+    row_misspellings = {}
+    shard = google_spell_check.SheetShard('Input Sheet', 0, 0, len(phrases), None)
+    metrics = google_spell_check.run_dialog_loop(browser, shard, spell_check_results.RowIndex(phrases), row_misspellings)
+    assert row_misspellings == {0: [('teh', 'the')], 1: [('dgo', 'dog')], 2: [('teh', 'the')]}
+    # "teh" was applied to every row when first seen, the dialog stopping on it again only costs a press of "Ignore all"
+    assert metrics.misspellings == 2
+    assert metrics.round_trips == 5
+    assert browser.ignored == ['ignore_all'] * 4
+
+def test_dialog_which_does_not_move_is_reported_as_stalled(monkeypatch):
+    monkeypatch.setattr(google_spell_check, 'DIALOG_STALL_TIMEOUT', dialog_watchdog.AdaptiveTimeout(0.05, 0, 0.05))
+    browser = FakeDialogBrowser([('teh cat', 'teh', 'the')])
+    # Sheets keeps showing the cell without the misspelled word
+    browser.states = [browser.state('teh cat', '', '')]
+    browser.execute_async_script = lambda script, previous, ignore, timeout: time.sleep(0.01) or browser.states[0]
+    shard = google_spell_check.SheetShard('Input Sheet', 0, 0, 1, None)
+    with pytest.raises(dialog_watchdog.DialogStalled):
+        google_spell_check.run_dialog_loop(browser, shard, spell_check_results.RowIndex(['teh cat']), {})
+
+def test_timeouts_adapt_to_observed_durations():
+    timeout = dialog_watchdog.AdaptiveTimeout(30, 1, 60)
+    assert timeout.timeout == 30
+    for _ in range(50):
+        timeout.observe(0.5)
+    assert timeout.timeout == 1
+    for _ in range(50):
+        timeout.observe(20)
+    assert 20 < timeout.timeout <= 60
+
+def test_checkpoint_resumes_from_the_row_under_the_dialog():
+    checkpoint = dialog_watchdog.DialogCheckpoint(2)
+    assert checkpoint.resume_position == 2
+    # The dialog stopped in row 4, which may hold more misspellings
+    checkpoint.advance(5)
+    checkpoint.advance(3)
+    assert checkpoint.resume_position == 4
@@ -0,0 +1,69 @@
+import pandas as pd
+import pyarrow.feather as feather
+import pytest
+from app.core.service import google_spell_check, input_file
+from app.core.service.input_file import iter_input_chunks, read_input_file
+from app.core.service.spell_check_backend import FakeSpellCheckBackend
+
+
+@pytest.fixture
+def columnar_inputs(tmp_path):
+    df = pd.DataFrame({'ID': [1, 2, 3, 4], 'TEXT': ['teh cat', 'ok', None, 'teh cat'], 'EXTRA': [1.0, 2.0, 3.0, 4.0]})
+    df.to_parquet(tmp_path / 'input.parquet')
+    feather.write_feather(df, str(tmp_path / 'input.feather'))
+    return [str(tmp_path / 'input.parquet'), str(tmp_path / 'input.feather')]
+
+def test_columnar_inputs_read_identifier_and_text_as_arrow_strings(columnar_inputs):
+    for file_path in columnar_inputs:
+        df = read_input_file(file_path)
+        assert list(df.columns) == ['ID', 'TEXT']
+        assert df['TEXT'].dtype == pd.StringDtype('pyarrow')
+        chunks = list(iter_input_chunks(file_path, 3))
+        assert [len(i) for i in chunks] == [3, 1]
+        assert all(i['TEXT'].dtype == pd.StringDtype('pyarrow') for i in chunks)
+        assert pd.concat(chunks)['ID'].tolist() == [1, 2, 3, 4]
+
+def test_arrow_strings_are_kept_through_the_spell_check(columnar_inputs, monkeypatch):
+    monkeypatch.setattr(google_spell_check.config, 'VERDICT_CACHE_ENABLED', False)
+    monkeypatch.setattr(google_spell_check, 'get_symspell_index', lambda: None)
+    backend = FakeSpellCheckBackend({'teh': 'the'})
+    df = google_spell_check.run_spell_check(read_input_file(columnar_inputs[0]), backend = backend)
+    assert df['TEXT'].dtype == pd.StringDtype('pyarrow')
+    assert df['INCORRECT WORDS'].tolist() == ['teh', '', '', 'teh']
+    # Duplicate and empty rows never reach the backend
+    assert backend.checked_phrases == 2
+
+def test_excel_inputs_are_converted_to_parquet_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(input_file.config, 'EXCEL_TO_PARQUET', True)
+    monkeypatch.setattr(input_file.config, 'EXCEL_PARQUET_FOLDER', str(tmp_path / 'parquet'))
+    (tmp_path / 'input.xls').write_bytes(b'workbook')
+    reads = []
+    def read_excel(file_path):
+        reads.append(file_path)
+        return pd.DataFrame({'ID': [1, 2], 'TEXT': ['teh', 42]})
+    monkeypatch.setattr(input_file.pd, 'read_excel', read_excel)
+
+    for _ in range(2):
+        df = read_input_file(str(tmp_path / 'input.xls'))
+        assert df['TEXT'].tolist() == ['teh', '42']
+    assert len(reads) == 1
+    assert len(list((tmp_path / 'parquet').glob('*.parquet'))) == 1
+    assert pd.concat(iter_input_chunks(str(tmp_path / 'input.xls'), 1))['ID'].tolist() == [1, 2]
+
+def test_compressed_feather_inputs_are_chunked_across_record_batches(tmp_path, monkeypatch):
+    df = pd.DataFrame({'ID': range(5), 'TEXT': ['teh', 'a', 'b', 'c', 'd'], 'EXTRA': range(5)})
+    feather.write_feather(df, str(tmp_path / 'input.feather'), compression = 'lz4', chunksize = 2)
+    batches = []
+    read_ipc_batches = input_file.read_ipc_batches
+    def counted_batches(file_path):
+        schema, reader = read_ipc_batches(file_path)
+        return schema, (batches.append(len(i)) or i for i in reader)
+    monkeypatch.setattr(input_file, 'read_ipc_batches', counted_batches)
+
+    chunks = iter_input_chunks(str(tmp_path / 'input.feather'), 3)
+    first = next(chunks)
+    assert (list(first.columns), first['ID'].tolist()) == (['ID', 'TEXT'], [0, 1, 2])
+    # The last batch is only read for the next chunk
+    assert batches == [2, 2]
+    assert [i['ID'].tolist() for i in chunks] == [[3, 4]]
+    assert read_input_file(str(tmp_path / 'input.feather'))['TEXT'].tolist() == ['teh', 'a', 'b', 'c', 'd']
@@ -0,0 +1,37 @@
+import pytest
+from app import app
+from app.core.service import google_spell_check
+from benchmarks import load_test
+from benchmarks.fake_browser import misspelled
+from starlette.testclient import TestClient
+
+
+@pytest.fixture
+def fakes(tmp_path, monkeypatch):
+    monkeypatch.setattr(google_spell_check.config, 'VERDICT_CACHE_ENABLED', False)
+    monkeypatch.setattr(google_spell_check.config, 'RESULT_STORE_ENABLED', False)
+    monkeypatch.setattr(google_spell_check.config, 'BROWSER_REUSE_SETTLE_MS', 0)
+    monkeypatch.setattr(google_spell_check.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(google_spell_check, 'get_symspell_index', lambda: None)
+    monkeypatch.setattr(google_spell_check, 'worker_slot', lambda: 0)
+    return load_test.install_fakes(misspelling_rate = 0.2, setattr = monkeypatch.setattr)
+
+def test_stand_ins_flag_the_chosen_words_through_the_real_pipeline(fakes):
+    vocabulary = load_test.make_vocabulary(200)
+    flagged = [i for i in vocabulary if misspelled(i, 0.2)]
+    correct = [i for i in vocabulary if not misspelled(i, 0.2)]
+    response = TestClient(app).get('/spell-check/words', params = {'word_list': flagged[:3] + correct[:3]})
+    assert response.status_code == 200
+    assert sorted(response.json()['incorrect_words']) == sorted(flagged[:3])
+    # The dialog was driven through the Sheets stand-in
+    assert ('update_values', 0) in fakes.calls
+
+def test_harness_reports_latency_percentiles(fakes, tmp_path):
+    vocabulary = load_test.make_vocabulary(200)
+    load_test.write_input_file(str(tmp_path), 50, vocabulary)
+    client = TestClient(app)
+    for endpoint in load_test.ENDPOINTS:
+        report = load_test.run_requests(load_test.request_factory(endpoint, vocabulary, list_size = 5), requests_count = 8,
+                                        concurrency = 4, session_factory = lambda: client)
+        assert (report['requests'], report['errors']) == (8, 0)
+        assert 0 < report['p50_ms'] <= report['p95_ms'] <= report['p99_ms']
@@ -0,0 +1,63 @@
+import pytest
+from app.controllers import google_spell_check_router, metrics_router
+from app.core.service import google_spell_check, metrics
+from app.core.service.metrics import Counter, Histogram, MetricsRegistry
+from app.core.service.spell_check_backend import FakeSpellCheckBackend
+from starlette.testclient import TestClient
+from app import app
+
+
+def test_metrics_are_rendered_in_prometheus_text_format():
+    counter = Counter('calls_total', 'Calls', ('call',))
+    counter.inc(call = 'open')
+    counter.inc(2, call = 'say "hi"')
+    assert counter.render() == ['# HELP calls_total Calls', '# TYPE calls_total counter',
+                                'calls_total{call="open"} 1', 'calls_total{call="say \\"hi\\""} 2']
+
+    histogram = Histogram('stage_seconds', 'Stages', ('stage',), buckets = (0.1, 1))
+    for value in (0.05, 0.5, 3):
+        histogram.observe(value, stage = 'upload')
+    assert histogram.render()[2:] == [
+        'stage_seconds_bucket{stage="upload",le="0.1"} 1', 'stage_seconds_bucket{stage="upload",le="1"} 2',
+        'stage_seconds_bucket{stage="upload",le="+Inf"} 3', 'stage_seconds_sum{stage="upload"} 3.55', 'stage_seconds_count{stage="upload"} 3']
+
+@pytest.fixture
+def registry(monkeypatch):
+    # A registry of its own, so that requests sent by other tests are not counted
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics, 'REQUEST_SECONDS', registry.histogram('http_request_duration_seconds', 'Latency', ('method', 'route', 'status')))
+    monkeypatch.setattr(metrics, 'STAGE_SECONDS', registry.histogram('spell_check_stage_seconds', 'Stages', ('stage',)))
+    monkeypatch.setattr(metrics_router, 'REGISTRY', registry)
+    return registry
+
+def test_traced_request_records_stage_spans_and_route_latency(tmp_path, monkeypatch, registry):
+    monkeypatch.setattr(metrics.config, 'TRACES_ENABLED', True)
+    monkeypatch.setattr(metrics.config, 'TRACES_FOLDER', str(tmp_path))
+    monkeypatch.setattr(google_spell_check.config, 'VERDICT_CACHE_ENABLED', False)
+    monkeypatch.setattr(google_spell_check.config, 'COALESCE_MAX_LIST_SIZE', 0)
+    monkeypatch.setattr(google_spell_check, 'get_symspell_index', lambda: None)
+    monkeypatch.setattr(google_spell_check, 'get_spell_check_backend', lambda browser, pool: FakeSpellCheckBackend({'teh': 'the'}))
+    monkeypatch.setattr(google_spell_check_router, 'get_browser_pool', lambda: None)
+    client = TestClient(app)
+
+    response = client.get('/spell-check/words', params = {'word_list': ['teh cat', 'ok']}, headers = {'X-Trace': '1'})
+    assert response.json()['incorrect_words'] == {'teh cat': {'incorrect_word': 'teh', 'suggested_word': 'the', 'description': ''}}
+    trace = client.get(f"/metrics/traces/{response.headers['X-Trace-Id']}").json()
+    assert [i['stage'] for i in trace['spans']] == ['cache_lookup', 'backend_check', 'expand_results', 'blacklist_marking', 'serialization']
+    assert 'X-Trace-Id' not in client.get('/spell-check/words', params = {'word_list': ['ok']}).headers
+
+    text = client.get('/metrics').text
+    assert 'http_request_duration_seconds_count{method="GET",route="/spell-check/words",status="200"} 2' in text
+    assert 'spell_check_stage_seconds_count{stage="backend_check"}' in text
+
+def test_traces_are_opt_in_and_rotated(tmp_path, monkeypatch, registry):
+    monkeypatch.setattr(metrics.config, 'TRACES_FOLDER', str(tmp_path))
+    monkeypatch.setattr(metrics.config, 'TRACES_MAX_FILES', 2)
+    client = TestClient(app)
+    assert 'X-Trace-Id' not in client.get('/metrics', headers = {'X-Trace': '1'}).headers
+    assert list(tmp_path.iterdir()) == []
+
+    monkeypatch.setattr(metrics.config, 'TRACES_ENABLED', True)
+    trace_ids = [client.get('/metrics', headers = {'X-Trace': '1'}).headers['X-Trace-Id'] for _ in range(3)]
+    assert len(list(tmp_path.iterdir())) == 2
+    assert client.get(f'/metrics/traces/{trace_ids[-1]}').status_code == 200
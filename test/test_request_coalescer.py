@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from app.core.service.request_coalescer import SpellCheckCoalescer
+
+
+def fake_batch(batches):
+    def run_batch(df):
+        batches.append(df['ACTUAL WORDS'].tolist())
+        df['INCORRECT WORDS'] = df['ACTUAL WORDS'].where(df['ACTUAL WORDS'].str.startswith('x'), '')
+        return df
+    return run_batch
+
+def test_concurrent_requests_share_one_batch():
+    batches = []
+    coalescer = SpellCheckCoalescer(fake_batch(batches), window = 0.2)
+    with ThreadPoolExecutor(max_workers = 3) as executor:
+        results = list(executor.map(coalescer.check, [['xa'], ['b', 'xc'], ['d']]))
+    assert len(batches) == 1
+    assert sorted(batches[0]) == ['b', 'd', 'xa', 'xc']
+    assert [i['INCORRECT WORDS'].tolist() for i in results] == [['xa'], ['', 'xc'], ['']]
+    assert [i['ID'].tolist() for i in results] == [[0], [0, 1], [0]]
+
+def test_full_batch_is_checked_without_waiting_for_the_window():
+    batches = []
+    coalescer = SpellCheckCoalescer(fake_batch(batches), window = 60, max_batch_size = 2)
+    assert coalescer.check(['a', 'b'], timeout = 5)['ACTUAL WORDS'].tolist() == ['a', 'b']
+
+def test_batch_errors_reach_every_caller():
+    def failing_batch(df):
+        raise RuntimeError('sheet unavailable')
+    coalescer = SpellCheckCoalescer(failing_batch, window = 0.01)
+    with pytest.raises(RuntimeError):
+        coalescer.check(['a'], timeout = 5)
+
+def test_errors_while_splitting_a_batch_reach_every_caller():
+    # A result which is not a DataFrame cannot be split
+    coalescer = SpellCheckCoalescer(lambda df: None, window = 0.2)
+    with ThreadPoolExecutor(max_workers = 2) as executor:
+        futures = [executor.submit(coalescer.check, i, 5) for i in (['a'], ['b'])]
+        errors = [i.exception(5) for i in futures]
+    assert all(isinstance(i, AttributeError) for i in errors)
+
+def test_caller_which_timed_out_is_left_out_of_its_batch():
+    started, release, batches = threading.Event(), threading.Event(), []
+    def slow_batch(df):
+        batches.append(df['ACTUAL WORDS'].tolist())
+        started.set()
+        release.wait(5)
+        return df
+    coalescer = SpellCheckCoalescer(slow_batch, window = 0.01)
+    first = coalescer.submit(['a'])
+    assert started.wait(5)
+    # The next batch queues behind the running one
+    with pytest.raises(TimeoutError):
+        coalescer.check(['b'], timeout = 0.1)
+    release.set()
+    assert first.result(5)['ACTUAL WORDS'].tolist() == ['a']
+    coalescer._executor.shutdown(wait = True)
+    assert batches == [['a']]
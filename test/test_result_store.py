@@ -0,0 +1,61 @@
+import os
+
+import pandas as pd
+from app.core.service.result_store import ResultStore, results_signature, run_incremental_spell_check
+from app.core.service.spell_check_backend import FakeSpellCheckBackend
+
+
+def make_run(checked):
+    backend = FakeSpellCheckBackend({'teh': 'the', 'dgo': 'dog'})
+    def run(df):
+        checked.append(df['ACTUAL WORDS'].tolist())
+        df, misspellings = backend.check(df)
+        df.attrs.update({'cache_hits': 0, 'cache_misses': len(df), 'sheets_api_calls': 1})
+        return df
+    return run
+
+def test_identical_and_modified_uploads_reuse_stored_results(tmp_path):
+    store = ResultStore(str(tmp_path), results_signature('blacklist', 'whitelist', 'google'))
+    checked = []
+    df = pd.DataFrame({'ID': [0, 1, 2], 'ACTUAL WORDS': ['teh cat', 'a dgo', 'fine']})
+    result = run_incremental_spell_check(df.copy(), 'hash1', 'input.csv', make_run(checked), store)
+    assert result['INCORRECT WORDS'].tolist() == ['teh', 'dgo', '']
+
+    # Identical content is answered from the store without checking anything
+    result = run_incremental_spell_check(df.copy(), 'hash1', 'input.csv', make_run(checked), store)
+    assert len(checked) == 1
+    assert result.attrs['reused_rows'] == 3
+    assert result['SUGGESTED WORDS'].tolist() == ['the', 'dog', '']
+
+    # Only the changed and the new row of a modified upload are checked
+    modified = pd.DataFrame({'ID': [0, 1, 2, 3], 'ACTUAL WORDS': ['teh cat', 'a dog', 'fine', 'teh end']})
+    result = run_incremental_spell_check(modified, 'hash2', 'input.csv', make_run(checked), store)
+    assert checked[-1] == ['a dog', 'teh end']
+    assert result.attrs['reused_rows'] == 2
+    assert result['ID'].tolist() == [0, 1, 2, 3]
+    assert result['INCORRECT WORDS'].tolist() == ['teh', '', '', 'teh']
+
+def test_changed_word_lists_invalidate_stored_results(tmp_path):
+    ResultStore(str(tmp_path), results_signature('blacklist', 'whitelist', 'google')).put('hash1', 'input.csv', pd.DataFrame({'ROW HASH': [1]}))
+    store = ResultStore(str(tmp_path), results_signature('blacklist', 'edited whitelist', 'google'))
+    assert store.get('hash1') is None
+    assert store.previous('input.csv') is None
+
+def test_results_of_another_backend_are_not_reused(tmp_path):
+    ResultStore(str(tmp_path), results_signature('blacklist', 'whitelist', 'google')).put('hash1', 'input.csv', pd.DataFrame({'ROW HASH': [1]}))
+    store = ResultStore(str(tmp_path), results_signature('blacklist', 'whitelist', 'offline'))
+    assert store.get('hash1') is None
+    assert store.previous('input.csv') is None
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+    store = ResultStore(str(tmp_path), results_signature('blacklist', 'whitelist', 'google'))
+    df = pd.DataFrame({'ROW HASH': range(100)})
+    for i, file_hash in enumerate(['a', 'b', 'c']):
+        store.put(file_hash, f'{file_hash}.csv', df)
+        os.utime(store._path(file_hash), (i, i))
+    # Reading a result makes it the most recently used
+    store.get('a')
+    size = os.path.getsize(store._path('a'))
+    store.evict(2 * size)
+    assert store.get('b') is None
+    assert store.get('a') is not None and store.get('c') is not None
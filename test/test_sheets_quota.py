@@ -0,0 +1,104 @@
+import pandas as pd
+import pytest
+from app.controllers import metrics_router
+from app.core.service import google_spell_check
+from app.core.service.sheets_quota import SheetsQuotaScheduler
+from app.core.service.sheets_session import SheetsSession
+from benchmarks.fake_sheets import FakeSheetsClient, FakeWorksheet, fake_authorize
+from starlette.testclient import TestClient
+from app import app
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class RateLimitError(Exception):
+    # Shaped like googleapiclient.errors.HttpError, whose resp holds the status and headers
+    def __init__(self, retry_after = None):
+        super().__init__('429 Quota exceeded')
+        self.resp = {'status': '429'} if retry_after is None else {'status': '429', 'retry-after': str(retry_after)}
+
+def make_scheduler(credentials, clock):
+    return SheetsQuotaScheduler(credentials, requests_per_minute = 60, burst = 1, clock = clock, sleep = clock.sleep)
+
+@pytest.mark.parametrize('credentials', [1, 2, 4])
+def test_sustained_throughput_scales_with_the_credentials(credentials):
+    clock = FakeClock()
+    scheduler = make_scheduler([f'key_{i}.json' for i in range(credentials)], clock)
+    for _ in range(120):
+        scheduler.acquire(scheduler.choose())
+    # One request per second per credential once the bursts are spent
+    assert clock.now == pytest.approx(120 / credentials - 1)
+    assert {i['requests'] for i in scheduler.usage()} == {120 // credentials}
+
+def test_rate_limited_calls_back_off_and_move_to_another_credential(monkeypatch):
+    clock = FakeClock()
+    scheduler = make_scheduler(['first.json', 'second.json'], clock)
+    authorized = []
+    authorize = fake_authorize(FakeSheetsClient())
+    session = SheetsSession('Input Sheet', authorize = lambda credential: authorized.append(credential) or authorize(credential),
+                            scheduler = scheduler)
+    update_values = FakeWorksheet.update_values
+    failures = [RateLimitError(), RateLimitError(retry_after = 30)]
+    def limited_update_values(self, *args, **kwargs):
+        if failures:
+            raise failures.pop(0)
+        return update_values(self, *args, **kwargs)
+    monkeypatch.setattr(FakeWorksheet, 'update_values', limited_update_values)
+
+    wks = session.fill(pd.DataFrame({'ID': [0], 'ACTUAL WORDS': ['teh']}))
+    assert wks.column(1)[:2] == ['ACTUAL WORDS', 'teh']
+    # The second 429 asked for 30 seconds, the credential waited them before its third attempt
+    usage = {i['credential']: i for i in scheduler.usage()}
+    assert usage['first.json']['rate_limited'] == 2 and clock.now >= 30
+
+    # The paused credential had no quota left, so the next fill opened a connection with the other one
+    scheduler.rate_limited('first.json', retry_after = 60)
+    session.fill(pd.DataFrame({'ID': [0], 'ACTUAL WORDS': ['a']}))
+    assert authorized == ['first.json', 'second.json']
+
+def test_failed_upload_raises_instead_of_returning_no_worksheet(monkeypatch):
+    clock = FakeClock()
+    session = SheetsSession('Input Sheet', authorize = fake_authorize(FakeSheetsClient()), scheduler = make_scheduler(['key.json'], clock))
+    monkeypatch.setattr(google_spell_check, 'get_sheets_session', lambda sheet_name = None: session)
+    monkeypatch.setattr(google_spell_check, 'worker_slot', lambda: 0)
+    monkeypatch.setattr(google_spell_check.config, 'SHEETS_RATE_LIMIT_RETRIES', 2)
+    def always_limited(self, *args, **kwargs):
+        raise RateLimitError()
+    monkeypatch.setattr(FakeWorksheet, 'update_values', always_limited)
+
+    with pytest.raises(RateLimitError):
+        google_spell_check.fill_google_sheet(pd.DataFrame({'ID': [0], 'ACTUAL WORDS': ['teh']}))
+    assert session.scheduler.usage()[0]['rate_limited'] == 3
+
+def test_quota_usage_is_reported_per_credential(monkeypatch):
+    scheduler = SheetsQuotaScheduler(['/secrets/key.json'], requests_per_minute = 120, burst = 5)
+    scheduler.acquire('/secrets/key.json')
+    monkeypatch.setattr(metrics_router, 'get_sheets_quota_scheduler', lambda: scheduler)
+    response = TestClient(app).get('/metrics/sheets-quota')
+    assert response.status_code == 200
+    [quota] = response.json()['credentials']
+    assert (quota['credential'], quota['requests_per_minute'], quota['requests'], quota['rate_limited']) == ('key.json', 120, 1, 0)
+    assert 3.9 < quota['available_tokens'] <= 5
+
+def test_worker_processes_share_the_quota_of_a_credential(tmp_path):
+    clock = FakeClock()
+    # One scheduler per worker process, drawing from the same state file
+    workers = [SheetsQuotaScheduler(['key.json'], requests_per_minute = 60, burst = 1, clock = clock, sleep = clock.sleep,
+                                    state_path = str(tmp_path / 'sheets_quota.json')) for _ in range(2)]
+    for _ in range(3):
+        for scheduler in workers:
+            scheduler.acquire('key.json')
+    # Six requests at one per second, as a single process would send them
+    assert clock.now == pytest.approx(5)
+    workers[0].rate_limited('key.json', retry_after = 30)
+    assert workers[1].acquire('key.json') == pytest.approx(30)
@@ -0,0 +1,130 @@
+import threading
+from collections import Counter
+
+import pandas as pd
+import pytest
+from app.core.service import google_spell_check, sheets_session
+from app.core.service.sheets_session import SheetsSession
+from app.core.service.spell_check_results import record_misspelling
+from benchmarks.fake_sheets import FakeSheetsClient, FakeWorksheet, fake_authorize
+
+
+def make_session(client, monkeypatch, column_rows = 191000):
+    monkeypatch.setattr(sheets_session, 'COLUMN_ROWS', column_rows)
+    authorizations = []
+    authorize = fake_authorize(client)
+    return SheetsSession('Input Sheet', authorize = lambda: authorizations.append(1) or authorize()), authorizations
+
+def test_client_and_worksheet_are_reused_between_fills(monkeypatch):
+    client = FakeSheetsClient()
+    session, authorizations = make_session(client, monkeypatch)
+    df = pd.DataFrame({'ID': [0, 1], 'ACTUAL WORDS': ['teh cat', 'a dog']})
+    wks = session.fill(df)
+    assert wks.column(1) == ['ACTUAL WORDS', 'teh cat', 'a dog']
+    session.clear(wks)
+
+    calls = Counter()
+    wks = session.fill(df, calls = calls)
+    # Neither authorization, opening, resizing nor a full clear is repeated for a payload of the same size
+    assert len(authorizations) == 1
+    assert calls == Counter({'update_values': 1})
+    assert session.api_calls['open'] == 1
+
+def test_sheet_is_sized_to_the_payload_and_only_written_ranges_are_cleared(monkeypatch):
+    client = FakeSheetsClient()
+    session, _ = make_session(client, monkeypatch, column_rows = 3)
+    wks = session.fill(pd.DataFrame({'ID': range(7), 'ACTUAL WORDS': [f'word{i}' for i in range(7)]}), worksheet_index = 1)
+    assert len(client.spreadsheets['Input Sheet'].worksheets()) == 2
+    assert (wks.rows, [wks.column(i) for i in (1, 2, 3)]) == (4, [
+        ['ACTUAL WORDS', 'word0', 'word1', 'word2'],
+        ['ACTUAL WORDS', 'word3', 'word4', 'word5'],
+        ['ACTUAL WORDS', 'word6', '', '']])
+
+    # A smaller payload leaves nothing of the previous one behind
+    calls = Counter()
+    wks = session.fill(pd.DataFrame({'ID': [0], 'ACTUAL WORDS': ['teh']}), worksheet_index = 1, calls = calls)
+    assert wks.cells == {(1, 1): 'ACTUAL WORDS', (2, 1): 'teh'}
+    assert calls == Counter({'clear': 1, 'resize': 1, 'update_values': 1})
+
+    session.clear(wks)
+    assert wks.cells == {}
+    assert client.calls[-1] == ('clear', 1)
+
+def test_shards_are_written_concurrently_and_merged_by_row(monkeypatch):
+    client = FakeSheetsClient()
+    sessions = {}
+    monkeypatch.setattr(google_spell_check, 'get_sheets_session',
+                        lambda sheet_name = None: sessions.setdefault(sheet_name, SheetsSession(sheet_name, authorize = fake_authorize(client))))
+    monkeypatch.setattr(google_spell_check, 'worker_slot', lambda: 0)
+    monkeypatch.setattr(google_spell_check.config, 'SHEETS_WRITE_SHARDS', 3)
+    monkeypatch.setattr(google_spell_check.config, 'SHEETS_WRITE_MIN_SHARD_SIZE', 2)
+    monkeypatch.setattr(google_spell_check.config, 'SHEETS_SHARD_SPREADSHEETS', ['Second Sheet'])
+    # Every shard waits for the others inside its write, which only succeeds when they are written in parallel
+    barrier = threading.Barrier(3, timeout = 5)
+    update_values = FakeWorksheet.update_values
+    def concurrent_update_values(self, *args, **kwargs):
+        barrier.wait()
+        return update_values(self, *args, **kwargs)
+    monkeypatch.setattr(FakeWorksheet, 'update_values', concurrent_update_values)
+
+    def fake_check_worksheet(browser, shard, row_index, row_misspellings, progress = None, metrics = None, checkpoint = None, reload = False):
+        for row, value in sorted(shard.wks.cells.items()):
+            if row[0] > 1 and 'teh' in value.split():
+                record_misspelling(row_index, row_misspellings, value, 'teh', 'the')
+        return 1
+    monkeypatch.setattr(google_spell_check, 'check_worksheet', fake_check_worksheet)
+
+    df = pd.DataFrame({'ID': range(7), 'ACTUAL WORDS': ['teh', 'a', 'b', 'teh c', 'd', 'e', 'f teh']})
+    shards = google_spell_check.fill_google_sheet(df, worksheet_index = 1)
+    assert [(i.sheet_name, i.worksheet_index, i.start, i.stop) for i in shards] == [
+        ('Input Sheet', 2, 0, 2), ('Second Sheet', 2, 2, 4), ('Input Sheet', 3, 4, 7)]
+    assert shards[1].wks.column(1) == ['ACTUAL WORDS', 'b', 'teh c']
+
+    df, misspellings = google_spell_check.run_google_spell_check(df, None, shards = shards)
+    assert df['INCORRECT WORDS'].tolist() == ['teh', '', '', 'teh', '', '', 'teh']
+    assert sorted(misspellings) == ['f teh', 'teh', 'teh c']
+    assert all(i.wks.cells == {} for i in shards)
+
+def test_failed_check_resumes_from_the_checkpoint_in_a_new_browser(monkeypatch):
+    client = FakeSheetsClient()
+    session = SheetsSession('Input Sheet', authorize = fake_authorize(client))
+    monkeypatch.setattr(google_spell_check, 'get_sheets_session', lambda sheet_name = None: session)
+    monkeypatch.setattr(google_spell_check, 'worker_slot', lambda: 0)
+    uploads, browsers = [], []
+
+    def fake_check_worksheet(browser, shard, row_index, row_misspellings, progress = None, metrics = None, checkpoint = None, reload = False):
+        rows = [value for row, value in sorted(shard.wks.cells.items()) if row[0] > 1]
+        uploads.append(rows)
+        browsers.append(browser)
+        for i, value in enumerate(rows):
+            if 'teh' in value.split():
+                record_misspelling(row_index, row_misspellings, value, 'teh', 'the')
+                checkpoint.advance(row_index.phrase_rows[value][0] + 1)
+            if browser == 'first' and value == 'c teh':
+                raise google_spell_check.DialogStalled('stuck')
+        return 1
+    monkeypatch.setattr(google_spell_check, 'check_worksheet', fake_check_worksheet)
+
+    df = pd.DataFrame({'ID': range(6), 'ACTUAL WORDS': ['teh', 'a', 'b', 'c teh', 'd', 'teh e']})
+    df, misspellings = google_spell_check.run_google_spell_check(df, 'first', recover = lambda: 'second')
+    # The row under the dialog when it stalled is checked again, the rows before it are not uploaded again
+    assert uploads == [['teh', 'a', 'b', 'c teh', 'd', 'teh e'], ['c teh', 'd', 'teh e']]
+    assert browsers == ['first', 'second']
+    assert df['INCORRECT WORDS'].tolist() == ['teh', '', '', 'teh', '', 'teh']
+    assert sorted(misspellings) == ['c teh', 'teh', 'teh e']
+
+def test_failed_check_without_recovery_is_raised_at_once(monkeypatch):
+    session = SheetsSession('Input Sheet', authorize = fake_authorize(FakeSheetsClient()))
+    monkeypatch.setattr(google_spell_check, 'get_sheets_session', lambda sheet_name = None: session)
+    monkeypatch.setattr(google_spell_check, 'worker_slot', lambda: 0)
+    checks = []
+    def fake_check_worksheet(browser, shard, row_index, row_misspellings, progress = None, metrics = None, checkpoint = None, reload = False):
+        checks.append(browser)
+        raise google_spell_check.DialogStalled('stuck')
+    monkeypatch.setattr(google_spell_check, 'check_worksheet', fake_check_worksheet)
+
+    df = pd.DataFrame({'ID': range(2), 'ACTUAL WORDS': ['teh', 'a']})
+    with pytest.raises(google_spell_check.DialogStalled):
+        google_spell_check.run_google_spell_check(df, 'dead')
+    # The same browser is not retried
+    assert checks == ['dead']
@@ -0,0 +1,24 @@
+import pandas as pd
+from app.core.service import google_spell_check
+from app.core.service.spell_check_backend import FakeSpellCheckBackend
+
+
+def test_fake_backend_drives_the_whole_pipeline(monkeypatch):
+    monkeypatch.setattr(google_spell_check.config, 'VERDICT_CACHE_ENABLED', False)
+    monkeypatch.setattr(google_spell_check, 'get_symspell_index', lambda: None)
+    backend = FakeSpellCheckBackend({'teh': 'the', 'wrold': 'world'})
+
+    df = pd.DataFrame({'ID': [1, 2, 3], 'ACTUAL WORDS': ['teh wrold', 'hello', 'teh wrold']})
+    df = google_spell_check.run_spell_check(df, backend = backend)
+    assert df['INCORRECT WORDS'].tolist() == ['teh, wrold', '', 'teh, wrold']
+    assert df['SUGGESTED WORDS'].tolist() == ['the, world', '', 'the, world']
+    assert (backend.checks, backend.checked_phrases) == (1, 2)
+
+def test_fake_backend_reports_progress():
+    reported = []
+    class Progress:
+        def update(self, offset, position, new_rows):
+            reported.append((position, new_rows))
+    df = pd.DataFrame({'ID': [0, 1], 'ACTUAL WORDS': ['fine', 'teh end']})
+    FakeSpellCheckBackend(['teh']).check(df, Progress())
+    assert reported == [(2, [1]), (2, [])]
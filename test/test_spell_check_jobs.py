@@ -0,0 +1,185 @@
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import pandas as pd
+import pytest
+from app.core.schema.spell_check_job_schema import JobStatus
+from app.core.service import google_spell_check, spell_check_jobs, streaming_spell_check
+from app.core.service.spell_check_backend import FakeSpellCheckBackend
+from app.core.service.spell_check_jobs import InMemoryJobStore, SpellCheckJobQueue, SqliteJobStore
+
+
+@pytest.fixture(params = ['memory', 'sqlite'])
+def store(request, tmp_path):
+    return InMemoryJobStore() if request.param == 'memory' else SqliteJobStore(str(tmp_path / 'jobs.sqlite3'))
+
+def test_store_round_trip(store):
+    job = store.create('input.csv')
+    store.update(job.job_id, status = JobStatus.RUNNING, rows_processed = 5)
+    assert store.get(job.job_id).status == JobStatus.RUNNING
+    assert store.get(job.job_id).rows_processed == 5
+    assert store.get('missing') is None
+
+def test_job_reports_progress_and_writes_result(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(spell_check_jobs.config, 'RESULTS_FOLDER', str(tmp_path))
+    monkeypatch.setattr(spell_check_jobs.config, 'VERDICT_CACHE_ENABLED', False)
+    monkeypatch.setattr(google_spell_check, 'get_symspell_index', lambda: None)
+    monkeypatch.setattr(streaming_spell_check, 'get_spell_check_backend', lambda browser, pool: FakeSpellCheckBackend({'teh': 'the'}))
+    chunks = [pd.DataFrame({'ID': [1, 2], 'ACTUAL WORDS': ['teh', 'ok']}), pd.DataFrame({'ID': [3], 'ACTUAL WORDS': ['teh cat']})]
+    monkeypatch.setattr(spell_check_jobs, 'iter_input_chunks', lambda path, chunk_size, skip_rows = 0: iter(chunks))
+    monkeypatch.setattr(spell_check_jobs, 'get_browser_pool', lambda: None)
+
+    job = store.create('input.csv')
+    spell_check_jobs.run_spell_check_job(store, job.job_id)
+    job = store.get(job.job_id)
+    assert (job.status, job.rows_total, job.rows_processed, job.misspellings_found) == (JobStatus.COMPLETED, 3, 3, 2)
+    result = pd.read_csv(job.result_file, keep_default_na = False)
+    assert result['ID'].tolist() == [1, 2, 3]
+    assert result['INCORRECT WORDS'].tolist() == ['teh', '', 'teh']
+
+def test_queued_job_can_be_cancelled(store):
+    started, release = threading.Event(), threading.Event()
+    def runner(store, job_id):
+        started.set()
+        release.wait(5)
+    job_queue = SpellCheckJobQueue(store, workers = 1, max_size = 1, runner = runner)
+    running = job_queue.submit('a.csv')
+    started.wait(5)
+    queued = job_queue.submit('b.csv')
+    with pytest.raises(queue.Full):
+        job_queue.submit('c.csv')
+    assert job_queue.cancel(queued.job_id).status == JobStatus.CANCELLED
+    release.set()
+    # A cancelled job is never started, and finished jobs keep their status
+    spell_check_jobs.run_spell_check_job(store, queued.job_id)
+    assert store.get(queued.job_id).status == JobStatus.CANCELLED
+    store.update(running.job_id, status = JobStatus.COMPLETED)
+    assert job_queue.cancel(running.job_id).status == JobStatus.COMPLETED
+
+def test_running_job_stops_before_its_next_chunk(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(spell_check_jobs.config, 'RESULTS_FOLDER', str(tmp_path))
+    monkeypatch.setattr(spell_check_jobs.config, 'VERDICT_CACHE_ENABLED', False)
+    monkeypatch.setattr(google_spell_check, 'get_symspell_index', lambda: None)
+    monkeypatch.setattr(spell_check_jobs, 'get_browser_pool', lambda: None)
+    # No chunk holds a misspelling, so no progress update sees the cancellation
+    chunks_read = []
+    def chunks(path, chunk_size, skip_rows = 0):
+        for i in range(10):
+            chunks_read.append(i)
+            yield pd.DataFrame({'ID': [i], 'ACTUAL WORDS': [f'fine {i}']})
+    monkeypatch.setattr(spell_check_jobs, 'iter_input_chunks', chunks)
+    job_queue = SpellCheckJobQueue(store, workers = 0)
+
+    class CancellingBackend(FakeSpellCheckBackend):
+        def check(self, df, progress = None):
+            job_queue.cancel(job.job_id)
+            return super().check(df, progress)
+    backend = CancellingBackend({'teh': 'the'})
+    monkeypatch.setattr(streaming_spell_check, 'get_spell_check_backend', lambda browser, pool: backend)
+
+    job = store.create('input.csv')
+    spell_check_jobs.run_spell_check_job(store, job.job_id)
+    # The chunk being checked finishes, no further chunk is checked and the job is not marked completed afterwards
+    assert backend.checks == 1
+    assert len(chunks_read) <= 3
+    assert store.get(job.job_id).status == JobStatus.CANCELLED
+    assert job_queue.cancel(job.job_id).status == JobStatus.CANCELLED
+
+def test_failed_job_resumes_from_its_last_chunk(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(spell_check_jobs.config, 'RESULTS_FOLDER', str(tmp_path))
+    monkeypatch.setattr(spell_check_jobs.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(spell_check_jobs.config, 'STREAMING_CHUNK_SIZE', 2)
+    monkeypatch.setattr(spell_check_jobs.config, 'VERDICT_CACHE_ENABLED', False)
+    monkeypatch.setattr(google_spell_check, 'get_symspell_index', lambda: None)
+    monkeypatch.setattr(spell_check_jobs, 'get_browser_pool', lambda: None)
+    (tmp_path / 'input.txt').write_text('teh\nok\nfine\nteh cat\nend\n')
+
+    class FlakyBackend(FakeSpellCheckBackend):
+        # The browser dies once, on the second chunk
+        failed = False
+        def check(self, df, progress = None):
+            if 'fine' in df.iloc[:, 1].tolist() and not self.failed:
+                self.failed = True
+                raise RuntimeError('chrome not reachable')
+            return super().check(df, progress)
+    backend = FlakyBackend({'teh': 'the'})
+    monkeypatch.setattr(streaming_spell_check, 'get_spell_check_backend', lambda browser, pool: backend)
+
+    job = store.create('input.txt')
+    spell_check_jobs.run_spell_check_job(store, job.job_id)
+    job = store.get(job.job_id)
+    assert (job.status, job.resumes, job.rows_total, job.misspellings_found) == (JobStatus.COMPLETED, 1, 5, 2)
+    # The first chunk was written before the failure and is not checked again
+    assert backend.checked_phrases == 2 + 3
+    result = pd.read_csv(job.result_file, keep_default_na = False)
+    assert result['ID'].tolist() == [0, 1, 2, 3, 4]
+    assert result['INCORRECT WORDS'].tolist() == ['teh', '', '', 'teh', '']
+
+def test_only_failed_or_orphaned_jobs_can_be_resumed(store, monkeypatch):
+    job_queue = SpellCheckJobQueue(store, workers = 0)
+    job = store.create('a.csv')
+    store.update(job.job_id, status = JobStatus.RUNNING, heartbeat_at = time.time())
+    assert job_queue.resume(job.job_id) is None
+    # The worker which ran it exited
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    store.update(job.job_id, owner_pid = exited.pid)
+    assert job_queue.resume(job.job_id).status == JobStatus.QUEUED
+    # Its owner is alive but stopped sending heartbeats
+    store.update(job.job_id, status = JobStatus.RUNNING, heartbeat_at = time.time() - 60)
+    monkeypatch.setattr(spell_check_jobs.config, 'JOB_STALE_SECONDS', 30)
+    assert job_queue.resume(job.job_id).status == JobStatus.QUEUED
+    store.update(job.job_id, status = JobStatus.COMPLETED)
+    assert job_queue.resume(job.job_id) is None
+
+def test_long_running_job_of_a_live_worker_is_not_requeued(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(spell_check_jobs.config, 'RESULTS_FOLDER', str(tmp_path))
+    monkeypatch.setattr(spell_check_jobs.config, 'VERDICT_CACHE_ENABLED', False)
+    monkeypatch.setattr(spell_check_jobs.config, 'JOB_HEARTBEAT_SECONDS', 0.05)
+    monkeypatch.setattr(spell_check_jobs.config, 'JOB_STALE_SECONDS', 0.3)
+    monkeypatch.setattr(google_spell_check, 'get_symspell_index', lambda: None)
+    monkeypatch.setattr(spell_check_jobs, 'get_browser_pool', lambda: None)
+    monkeypatch.setattr(streaming_spell_check, 'get_spell_check_backend', lambda browser, pool: FakeSpellCheckBackend({'teh': 'the'}))
+    release = threading.Event()
+    def chunks(path, chunk_size, skip_rows = 0):
+        # Reading the input takes longer than JOB_STALE_SECONDS, without any progress update
+        release.wait(5)
+        yield pd.DataFrame({'ID': [0], 'ACTUAL WORDS': ['teh']})
+    monkeypatch.setattr(spell_check_jobs, 'iter_input_chunks', chunks)
+    job_queue = SpellCheckJobQueue(store, workers = 0)
+
+    job = store.create('input.csv')
+    worker = threading.Thread(target = spell_check_jobs.run_spell_check_job, args = (store, job.job_id))
+    worker.start()
+    try:
+        time.sleep(0.6)
+        assert job_queue.resume(job.job_id) is None
+        assert time.time() - store.get(job.job_id).heartbeat_at < 0.3
+    finally:
+        release.set()
+        worker.join(5)
+    assert store.get(job.job_id).status == JobStatus.COMPLETED
+
+def test_progress_within_a_chunk_is_written_at_most_every_interval(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(spell_check_jobs.config, 'RESULTS_FOLDER', str(tmp_path))
+    monkeypatch.setattr(spell_check_jobs.config, 'VERDICT_CACHE_ENABLED', False)
+    monkeypatch.setattr(spell_check_jobs.config, 'JOB_PROGRESS_INTERVAL_SECONDS', 60)
+    monkeypatch.setattr(google_spell_check, 'get_symspell_index', lambda: None)
+    monkeypatch.setattr(spell_check_jobs, 'get_browser_pool', lambda: None)
+    words = [f'w{i}' for i in range(50)]
+    monkeypatch.setattr(streaming_spell_check, 'get_spell_check_backend', lambda browser, pool: FakeSpellCheckBackend(words))
+    chunks = [pd.DataFrame({'ID': range(50), 'ACTUAL WORDS': words})]
+    monkeypatch.setattr(spell_check_jobs, 'iter_input_chunks', lambda path, chunk_size, skip_rows = 0: iter(chunks))
+
+    job = store.create('input.csv')
+    updates = []
+    update = store.update
+    monkeypatch.setattr(store, 'update', lambda job_id, expected = None, **changes: updates.append(changes) or update(job_id, expected, **changes))
+    spell_check_jobs.run_spell_check_job(store, job.job_id)
+    # 50 misspellings were reported, a single one of them was written before the chunk
+    assert sum('rows_processed' in i and 'checkpoint_rows' not in i for i in updates) == 1
+    job = store.get(job.job_id)
+    assert (job.status, job.rows_processed, job.misspellings_found) == (JobStatus.COMPLETED, 50, 50)
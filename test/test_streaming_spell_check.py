@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+
+import pandas as pd
+import pytest
+from app.core.models.browser import BrowserPool
+from app.core.service import google_spell_check, streaming_spell_check
+from app.core.service.google_spell_check import GoogleSheetsBackend
+from app.core.service.input_file import iter_input_chunks
+from app.core.service.spell_check_backend import FakeSpellCheckBackend
+from app.core.service.streaming_spell_check import run_streaming_spell_check
+from benchmarks.fake_browser import FakeBrowserSession
+
+
+class UploadingBackend(FakeSpellCheckBackend):
+    # Records the order of uploads and checks, checking chunk 0 only once chunk 1 has been uploaded
+    def __init__(self, misspelled_words, fail_on_check = None):
+        super().__init__(misspelled_words)
+        self.events = []
+        self.released = []
+        self.fail_on_check = fail_on_check
+        self.second_upload = threading.Event()
+
+    def upload(self, df, slot = 0):
+        self.events.append(('upload', slot))
+        if len([i for i in self.events if i[0] == 'upload']) == 2:
+            self.second_upload.set()
+        return slot
+
+    def release(self, upload):
+        self.released.append(upload)
+
+    def check(self, df, progress = None, upload = None):
+        assert self.second_upload.wait(5)
+        self.events.append(('check', upload))
+        if self.fail_on_check == self.checks:
+            raise RuntimeError('Spell-check dialog did not open')
+        return super().check(df, progress)
+
+
+@pytest.fixture(autouse = True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(google_spell_check.config, 'VERDICT_CACHE_ENABLED', False)
+    monkeypatch.setattr(google_spell_check, 'get_symspell_index', lambda: None)
+
+def chunks_of(phrases, chunk_size):
+    for i in range(0, len(phrases), chunk_size):
+        yield pd.DataFrame({'ID': range(i, i + len(phrases[i : i + chunk_size])), 'ACTUAL WORDS': phrases[i : i + chunk_size]})
+
+def test_txt_and_csv_inputs_are_read_in_chunks(tmp_path):
+    (tmp_path / 'input.txt').write_text('teh\nok\r\nfine\n')
+    chunks = list(iter_input_chunks(str(tmp_path / 'input.txt'), 2))
+    assert [len(i) for i in chunks] == [2, 1]
+    assert pd.concat(chunks)['ID'].tolist() == [0, 1, 2]
+    assert pd.concat(chunks)['ACTUAL WORDS'].tolist() == ['teh', 'ok', 'fine']
+
+    pd.DataFrame({'ID': [5, 6, 7], 'TEXT': ['a', 'b', 'c']}).to_csv(tmp_path / 'input.csv', index = False)
+    chunks = list(iter_input_chunks(str(tmp_path / 'input.csv'), 2))
+    assert [len(i) for i in chunks] == [2, 1]
+    assert pd.concat(chunks)['TEXT'].tolist() == ['a', 'b', 'c']
+
+def test_next_chunk_is_uploaded_while_the_current_one_is_checked(tmp_path):
+    backend = UploadingBackend({'teh': 'the'})
+    reported = []
+    totals = run_streaming_spell_check(
+        chunks_of(['teh cat', 'a dog', 'teh', 'ok', 'fine'], 2), str(tmp_path / 'result.csv'),
+        backend = backend, progress = lambda *args: reported.append(args))
+
+    # Chunk 1 is uploaded before chunk 0 is checked, chunk 2 waits for the worksheet of chunk 0
+    assert backend.events[:3] == [('upload', 0), ('upload', 1), ('check', 0)]
+    assert [i[1] for i in backend.events if i[0] == 'check'] == [0, 1, 0]
+    assert (totals['rows'], totals['flagged_rows']) == (5, 2)
+    assert reported[-1] == (5, 2)
+    result = pd.read_csv(tmp_path / 'result.csv', keep_default_na = False)
+    assert result['ID'].tolist() == [0, 1, 2, 3, 4]
+    assert result['INCORRECT WORDS'].tolist() == ['teh', '', 'teh', '', '']
+
+def test_pooled_uploads_overlap_checks_with_a_single_browser(tmp_path, monkeypatch):
+    monkeypatch.setattr(google_spell_check.config, 'BROWSER_POOL_CHECKOUT_TIMEOUT', 1)
+    second_upload = threading.Event()
+    uploads, checks = [], []
+    def fake_fill_google_sheet(df, worksheet_index = 0):
+        uploads.append(worksheet_index)
+        if len(uploads) == 2:
+            second_upload.set()
+        return [worksheet_index]
+    def fake_run_google_spell_check(df, browser, progress = None, shards = None, recover = None):
+        # Chunk 1 is uploaded while the only browser checks chunk 0, however long the check takes
+        assert second_upload.wait(5)
+        checks.append(shards[0])
+        return FakeSpellCheckBackend({'teh': 'the'}).check(df)
+    monkeypatch.setattr(google_spell_check, 'fill_google_sheet', fake_fill_google_sheet)
+    monkeypatch.setattr(google_spell_check, 'run_google_spell_check', fake_run_google_spell_check)
+    pool = BrowserPool(size = 1, session_factory = lambda worksheet_index: FakeBrowserSession(worksheet_index, object))
+    worksheets = google_spell_check.StreamWorksheets(2, 1)
+    monkeypatch.setattr(google_spell_check, 'get_stream_worksheets', lambda: worksheets)
+
+    totals = run_streaming_spell_check(chunks_of(['teh cat', 'a dog', 'teh', 'ok', 'fine'], 2), backend = GoogleSheetsBackend(pool = pool))
+    assert (totals['rows'], totals['flagged_rows']) == (5, 2)
+    # Uploads alternate between the two worksheets of the stream, which are given back at the end
+    assert uploads == checks == [2, 3, 2]
+    assert worksheets.reserve(timeout = 0) == (2, 3)
+
+def test_failed_check_releases_uploaded_chunks(tmp_path):
+    backend = UploadingBackend({'teh': 'the'}, fail_on_check = 0)
+    with pytest.raises(RuntimeError):
+        run_streaming_spell_check(chunks_of(['teh', 'ok', 'fine', 'good'], 1), str(tmp_path / 'result.csv'), backend = backend)
+    # Every chunk uploaded after the failed one is cleared up, whether it was queued or still being handed over
+    uploads = [i[1] for i in backend.events if i[0] == 'upload']
+    assert sorted(backend.released) == sorted(uploads[1:])
+    assert len(uploads) <= 3
+
+def test_file_results_stream_as_id_keyed_records(tmp_path, monkeypatch):
+    from starlette.testclient import TestClient
+    from app import app
+    from app.controllers import google_spell_check_router
+
+    monkeypatch.setattr(google_spell_check_router.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(google_spell_check_router.config, 'STREAMING_CHUNK_SIZE', 2)
+    monkeypatch.setattr(google_spell_check_router, 'get_browser_pool', lambda: None)
+    monkeypatch.setattr(streaming_spell_check, 'get_spell_check_backend', lambda browser, pool: FakeSpellCheckBackend({'teh': 'the'}))
+    (tmp_path / 'input.txt').write_text('teh cat\nok\nteh cat\n')
+
+    client = TestClient(app)
+    response = client.get('/spell-check/file', params = {'file_name': 'input.txt', 'output': 'ndjson'})
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    # Duplicate phrases keep a record per ID instead of collapsing into one entry
+    assert [json.loads(i) for i in response.text.splitlines()] == [
+        {'id': 0, 'actual_words': 'teh cat', 'incorrect_word': 'teh', 'suggested_word': 'the', 'description': ''},
+        {'id': 2, 'actual_words': 'teh cat', 'incorrect_word': 'teh', 'suggested_word': 'the', 'description': ''}]
+
+    response = client.get('/spell-check/file', params = {'file_name': 'input.txt', 'output': 'csv'})
+    assert response.text.splitlines() == ['ID,ACTUAL WORDS,INCORRECT WORDS,SUGGESTED WORDS,DESCRIPTION', '0,teh cat,teh,the,', '2,teh cat,teh,the,']
+
+def test_failed_csv_stream_is_aborted_and_timed_to_its_end(tmp_path, monkeypatch):
+    from starlette.testclient import TestClient
+    from app import app
+    from app.controllers import google_spell_check_router
+    from app.core.service import metrics
+
+    monkeypatch.setattr(google_spell_check_router.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(google_spell_check_router.config, 'STREAMING_CHUNK_SIZE', 1)
+    monkeypatch.setattr(google_spell_check_router, 'get_browser_pool', lambda: None)
+    class FailingBackend(FakeSpellCheckBackend):
+        # Checks of the second chunk start after the first chunk has been streamed
+        def check(self, df, progress = None):
+            if self.checks == 1:
+                time.sleep(0.2)
+                raise RuntimeError('chrome not reachable')
+            return super().check(df, progress)
+    monkeypatch.setattr(streaming_spell_check, 'get_spell_check_backend', lambda browser, pool: FailingBackend({'teh': 'the'}))
+    (tmp_path / 'input.txt').write_text('teh\nok\nteh\n')
+    labels = {'method': 'GET', 'route': '/spell-check/file', 'status': 500}
+    failures_before = metrics.REQUEST_SECONDS.count(**labels)
+    seconds_before = metrics.REQUEST_SECONDS._values.get(tuple(labels.values()), [None, 0.0])[1]
+
+    with pytest.raises(BaseException) as raised:
+        TestClient(app).get('/spell-check/file', params = {'file_name': 'input.txt', 'output': 'csv'})
+    # The test client raises what the server would abort the connection with, possibly inside exception groups
+    aborted = streaming_spell_check.ResultStreamAborted
+    assert raised.errisinstance(aborted) or raised.group_contains(aborted, depth = None)
+    # The request is recorded as a failure once its body ended, after the failed check of the second chunk
+    assert metrics.REQUEST_SECONDS.count(**labels) == failures_before + 1
+    assert metrics.REQUEST_SECONDS._values[tuple(labels.values())][1] - seconds_before >= 0.2
@@ -0,0 +1,38 @@
+import pandas as pd
+from app.core.service import google_spell_check
+from app.core.service.symspell import SymSpellIndex, damerau_levenshtein_distance, load_symspell_index
+
+FREQUENCIES = {'the': 100, 'world': 50, 'word': 40, 'hello': 30, 'known': 20, 'well': 20, 'receive': 10}
+
+
+def test_damerau_levenshtein_distance():
+    assert damerau_levenshtein_distance('teh', 'the', 2) == 1
+    assert damerau_levenshtein_distance('kitten', 'sitting', 3) == 3
+    assert damerau_levenshtein_distance('kitten', 'sitting', 2) == 3
+
+def test_lookup_prefers_closest_then_most_frequent():
+    index = SymSpellIndex(FREQUENCIES)
+    assert index.lookup('wrold')[0][:2] == ('world', 1)
+    assert index.lookup('recieve')[0][:2] == ('receive', 1)
+    assert [i[0] for i in index.lookup('wor')] == ['word', 'world']
+    assert index.suggest('Wrold') == 'World'
+    assert index.unknown_words('well-knwon,') == ['knwon']
+
+def test_index_is_serialized_once(tmp_path):
+    dictionary_path = tmp_path / 'dictionary.txt'
+    dictionary_path.write_text('\n'.join(f'{i} {j}' for i, j in FREQUENCIES.items()))
+    index_path = str(tmp_path / 'index.pickle')
+    load_symspell_index(str(dictionary_path), index_path)
+    assert load_symspell_index(str(dictionary_path), index_path).words == SymSpellIndex(FREQUENCIES).words
+
+def test_offline_backend_never_uses_google_sheets(monkeypatch):
+    monkeypatch.setattr(google_spell_check.config, 'SPELL_CHECK_BACKEND', 'offline')
+    monkeypatch.setattr(google_spell_check.config, 'VERDICT_CACHE_ENABLED', False)
+    monkeypatch.setattr(google_spell_check, 'get_symspell_index', lambda: SymSpellIndex(FREQUENCIES))
+    monkeypatch.setattr(google_spell_check, 'run_google_spell_check', None)
+
+    df = pd.DataFrame({'ID': [1, 2], 'ACTUAL WORDS': ['Hello wrold', 'the well-known word']})
+    df = google_spell_check.run_spell_check(df)
+    assert df['INCORRECT WORDS'].tolist() == ['wrold', '']
+    assert df['SUGGESTED WORDS'].tolist() == ['world', '']
+    assert df.attrs['dictionary_hits'] == 4
@@ -0,0 +1,30 @@
+import time
+
+from app.core.service.verdict_cache import Verdict, VerdictCache, split_tokens
+
+
+def test_split_tokens_strips_punctuation():
+    assert split_tokens('Hello, wrold! ...') == ['Hello', 'wrold']
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = VerdictCache(str(tmp_path / 'cache.sqlite3'), memory_size = 2)
+    cache.set_many({'a': Verdict(), 'b': Verdict(), 'c': Verdict()})
+    assert list(cache._memory) == ['b', 'c']
+    # Evicted from memory but still served by the disk tier
+    assert cache.get_many(['a']) == {'a': Verdict()}
+
+def test_disk_tier_survives_restart_and_expires(tmp_path):
+    db_path = str(tmp_path / 'cache.sqlite3')
+    VerdictCache(db_path).set_many({'wrold': Verdict(('wrold',), ('world',))})
+    assert VerdictCache(db_path).get_many(['wrold'])['wrold'].suggested_words == ('world',)
+
+    cache = VerdictCache(db_path, ttl = 0.01)
+    cache.set_many({'wrold': Verdict(('wrold',), ('world',))})
+    time.sleep(0.02)
+    assert cache.get_many(['wrold', 'other']) == {}
+    assert (cache.hits, cache.misses) == (0, 2)
+
+def test_disk_tier_respects_size_limit(tmp_path):
+    cache = VerdictCache(str(tmp_path / 'cache.sqlite3'), disk_size = 2)
+    cache.set_many({'a': Verdict(), 'b': Verdict(), 'c': Verdict()})
+    assert cache._connection.execute('SELECT COUNT(*) FROM verdicts').fetchone()[0] == 2
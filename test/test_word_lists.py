@@ -0,0 +1,53 @@
+import glob
+import os
+
+import pandas as pd
+import pytest
+from app.controllers import word_list_router
+from app.core.service import blacklist_matcher
+from app.core.service.word_lists import SortedWordFile, WordList, normalize_word
+from starlette.testclient import TestClient
+from app import app
+
+
+@pytest.fixture
+def blacklist(tmp_path, monkeypatch):
+    (tmp_path / 'blacklist_words.txt').write_text('darn\nBad Phrase\n')
+    word_list = WordList(str(tmp_path / 'blacklist_words.txt'), str(tmp_path / 'index'), reload_seconds = 0)
+    monkeypatch.setattr(blacklist_matcher, 'get_blacklist', lambda: word_list)
+    monkeypatch.setitem(word_list_router.WORD_LISTS, word_list_router.WordListName.BLACKLIST, lambda: word_list)
+    return word_list
+
+def test_sorted_word_file_is_searched_in_place(tmp_path):
+    entries = {normalize_word(i): i for i in ['Zulu', 'alpha', 'Café,', 'golf india', 'ärger']}
+    SortedWordFile.write(str(tmp_path / 'words'), entries)
+    words = SortedWordFile(str(tmp_path / 'words'))
+    assert list(words) == sorted(entries)
+    assert [words.get(normalize_word(i)) for i in ['CAFÉ', 'café', 'zulu!', 'Golf  India', 'golf', 'ärger']] == [
+        'Café,', 'Café,', 'Zulu', 'golf india', None, 'ärger']
+
+def test_edited_file_is_reloaded_and_matcher_recompiled(blacklist):
+    df = pd.DataFrame({'ID': [0, 1], 'ACTUAL WORDS': ['Oh DARN, a bad phrase', 'heck no']})
+    df['INCORRECT WORDS'], df['SUGGESTED WORDS'], df['DESCRIPTION'] = '', '', ''
+    assert blacklist_matcher.get_blacklist_matcher().find(df['ACTUAL WORDS']) == {0: ['darn', 'Bad Phrase']}
+
+    first_hash = blacklist.version
+    with open(blacklist.path, 'a') as f:
+        f.write('heck\n')
+    os.utime(blacklist.path, ns = (0, 0))
+    assert blacklist.matches('Heck!')
+    assert blacklist.version != first_hash
+    assert blacklist_matcher.get_blacklist_matcher().find(df['ACTUAL WORDS']) == {0: ['darn', 'Bad Phrase'], 1: ['heck']}
+    # Only the index of the current content is kept
+    assert glob.glob(os.path.join(blacklist.index_folder, '*.words')) == [os.path.join(blacklist.index_folder, f'blacklist_words.{blacklist.version[:16]}.words')]
+
+def test_entries_are_added_and_removed_through_the_api(blacklist):
+    client = TestClient(app)
+    response = client.post('/word-lists/blacklist/words', params = {'words': ['Heck', 'DARN', 'heck']}).json()
+    assert (response['added_words'], response['entries']) == (['Heck'], 3)
+    assert client.get('/word-lists/blacklist', params = {'word': 'heck?'}).json()['matched_entry'] == 'Heck'
+
+    response = client.delete('/word-lists/blacklist/words', params = {'words': ['bad phrase']}).json()
+    assert (response['removed_words'], response['entries']) == (['Bad Phrase'], 2)
+    with open(blacklist.path) as f:
+        assert f.read() == 'darn\nHeck\n'
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from app.core.service import google_spell_check
+from app.core.service.worker_lease import WorkerLease, kill_process_tree
+
+
+def test_workers_lease_distinct_slots_and_wait_for_a_free_one(tmp_path):
+    first, second, third = (WorkerLease(str(tmp_path), slots = 2) for _ in range(3))
+    assert (first.acquire(), second.acquire()) == (0, 1)
+    with pytest.raises(TimeoutError):
+        third.acquire(timeout = 0.1)
+    first.release()
+    assert third.acquire(timeout = 1) == 0
+
+def test_worksheets_of_each_worker_slot_are_disjoint(monkeypatch):
+    monkeypatch.setattr(google_spell_check.config, 'BROWSER_POOL_SIZE', 3)
+    monkeypatch.setattr(google_spell_check.config, 'STREAMING_CONCURRENT_UPLOADS', 1)
+    # Three pooled sessions followed by the two worksheets of a streaming upload
+    monkeypatch.setattr(google_spell_check, 'worker_slot', lambda: 0)
+    first_worker = {i for k in range(5) for _, i in google_spell_check.sheet_shard_targets(k, 1)}
+    monkeypatch.setattr(google_spell_check, 'worker_slot', lambda: 1)
+    second_worker = {i for k in range(5) for _, i in google_spell_check.sheet_shard_targets(k, 1)}
+    assert (first_worker, second_worker) == ({0, 1, 2, 3, 4}, {5, 6, 7, 8, 9})
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason = 'Process tree is read from /proc')
+def test_only_the_recorded_process_tree_is_killed(tmp_path):
+    start_tree = 'import subprocess, sys, time; subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"]); time.sleep(30)'
+    parent = subprocess.Popen([sys.executable, '-c', start_tree])
+    bystander = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+    try:
+        time.sleep(0.5)
+        # A recorded pid now running something other than a driver is left alone
+        lease = WorkerLease(str(tmp_path), slots = 1)
+        lease.record_driver(parent.pid)
+        lease.release()
+        WorkerLease(str(tmp_path), slots = 1).acquire()
+        assert parent.poll() is None
+
+        assert kill_process_tree(parent.pid)
+        assert parent.wait(5) == -9
+        assert bystander.poll() is None
+    finally:
+        for process in (parent, bystander):
+            process.kill()
+            process.wait()